@@ -18,9 +18,14 @@ sys.path.append(os.getcwd())
 # for 'autogenerate' support
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
+from app.config import settings
 from app.models import Base
 target_metadata = Base.metadata
 
+# The database of the application, when configured, takes precedence over the URL of alembic.ini
+if settings.mariadb_uri:
+    config.set_main_option("sqlalchemy.url", settings.mariadb_uri.replace("%", "%%"))
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -66,7 +71,9 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata,
+            # Autogenerated migrations use batch operations on SQLite, recreating the table for changes it cannot make in place
+            render_as_batch=connection.dialect.name == "sqlite",
         )
 
         with context.begin_transaction():
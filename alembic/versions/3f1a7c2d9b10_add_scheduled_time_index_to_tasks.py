@@ -0,0 +1,26 @@
+"""Add scheduled_time index to tasks
+
+Revision ID: 3f1a7c2d9b10
+Revises: c9005f6db961
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1a7c2d9b10'
+down_revision: Union[str, None] = 'c9005f6db961'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The secondary index implicitly carries the primary key, so it serves (scheduled_time, id) keyset scans.
+    op.create_index('ix_tasks_scheduled_time', 'tasks', ['scheduled_time'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_scheduled_time', table_name='tasks')
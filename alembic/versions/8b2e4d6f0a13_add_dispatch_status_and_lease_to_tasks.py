@@ -0,0 +1,32 @@
+"""Add dispatch status and lease columns to tasks
+
+Revision ID: 8b2e4d6f0a13
+Revises: 3f1a7c2d9b10
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2e4d6f0a13'
+down_revision: Union[str, None] = '3f1a7c2d9b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('status', sa.Enum('PENDING', 'RUNNING', 'SUCCEEDED', 'FAILED', name='taskstatus'), nullable=False, server_default='PENDING'))
+    op.add_column('tasks', sa.Column('lease_owner', sa.String(length=255), nullable=True))
+    op.add_column('tasks', sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_tasks_status_scheduled_time', 'tasks', ['status', 'scheduled_time'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_status_scheduled_time', table_name='tasks')
+    op.drop_column('tasks', 'lease_expires_at')
+    op.drop_column('tasks', 'lease_owner')
+    op.drop_column('tasks', 'status')
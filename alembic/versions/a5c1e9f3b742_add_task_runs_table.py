@@ -0,0 +1,40 @@
+"""Add task runs table
+
+Revision ID: a5c1e9f3b742
+Revises: f2b8d4c6a037
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a5c1e9f3b742'
+down_revision: Union[str, None] = 'f2b8d4c6a037'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'task_runs',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), primary_key=True, autoincrement=True),
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('scheduled_time', sa.DateTime(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.Enum('PENDING', 'RUNNING', 'SUCCEEDED', 'FAILED', name='taskstatus'), nullable=False),
+        sa.Column('worker', sa.String(length=255), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+    )
+    op.create_index('ix_task_runs_task_id_id', 'task_runs', ['task_id', 'id'])
+    op.create_index('ix_task_runs_finished_at', 'task_runs', ['finished_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_task_runs_finished_at', table_name='task_runs')
+    op.drop_index('ix_task_runs_task_id_id', table_name='task_runs')
+    op.drop_table('task_runs')
@@ -0,0 +1,41 @@
+"""Add the SKIPPED task status
+
+Revision ID: a7d3f5b9c462
+Revises: f4a2c8e6d391
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d3f5b9c462'
+down_revision: Union[str, None] = 'f4a2c8e6d391'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+STATUSES = ('PENDING', 'RUNNING', 'SUCCEEDED', 'FAILED')
+
+
+def _alter_statuses(old: tuple, new: tuple) -> None:
+    # SQLite stores the enum in a VARCHAR as long as the longest name, without a CHECK constraint
+    if op.get_bind().dialect.name == 'sqlite':
+        return
+    op.alter_column('tasks', 'status', existing_type=sa.Enum(*old, name='taskstatus'),
+                    type_=sa.Enum(*new, name='taskstatus'), existing_nullable=False, existing_server_default='PENDING')
+    op.alter_column('task_runs', 'status', existing_type=sa.Enum(*old, name='taskstatus'),
+                    type_=sa.Enum(*new, name='taskstatus'), existing_nullable=False)
+
+
+def upgrade() -> None:
+    _alter_statuses(STATUSES, STATUSES + ('SKIPPED',))
+
+
+def downgrade() -> None:
+    # Skipped occurrences were recorded as failed before
+    op.execute("UPDATE tasks SET status = 'FAILED' WHERE status = 'SKIPPED'")
+    op.execute("UPDATE task_runs SET status = 'FAILED' WHERE status = 'SKIPPED'")
+    _alter_statuses(STATUSES + ('SKIPPED',), STATUSES)
@@ -0,0 +1,28 @@
+"""Add priority and group to tasks
+
+Revision ID: b6d2f0a4c853
+Revises: a5c1e9f3b742
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d2f0a4c853'
+down_revision: Union[str, None] = 'a5c1e9f3b742'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('priority', sa.SmallInteger(), nullable=False, server_default='0'))
+    op.add_column('tasks', sa.Column('group', sa.String(length=255), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('tasks', 'group')
+    op.drop_column('tasks', 'priority')
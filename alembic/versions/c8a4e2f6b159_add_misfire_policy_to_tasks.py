@@ -0,0 +1,26 @@
+"""Add misfire policy to tasks
+
+Revision ID: c8a4e2f6b159
+Revises: b6d2f0a4c853
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8a4e2f6b159'
+down_revision: Union[str, None] = 'b6d2f0a4c853'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('misfire_policy', sa.Enum('RUN_ALL', 'COALESCE', 'SKIP', 'SPREAD', name='misfirepolicy'), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('tasks', 'misfire_policy')
@@ -0,0 +1,27 @@
+"""Add recurrence and scheduled_time index to tasks
+
+Revision ID: d1e5a7c3f284
+Revises: c8a4e2f6b159
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd1e5a7c3f284'
+down_revision: Union[str, None] = 'c8a4e2f6b159'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Serves listings and counts filtered by recurrence, with or without a scheduled time range. Filters on status use
+    # ix_tasks_status_scheduled_time, and name prefixes the unique index of name.
+    op.create_index('ix_tasks_recurrence_scheduled_time', 'tasks', ['recurrence', 'scheduled_time'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_recurrence_scheduled_time', table_name='tasks')
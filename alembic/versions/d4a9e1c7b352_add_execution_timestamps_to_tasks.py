@@ -0,0 +1,30 @@
+"""Add execution timestamps to tasks
+
+Revision ID: d4a9e1c7b352
+Revises: 8b2e4d6f0a13
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a9e1c7b352'
+down_revision: Union[str, None] = '8b2e4d6f0a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('started_at', sa.DateTime(), nullable=True))
+    op.add_column('tasks', sa.Column('finished_at', sa.DateTime(), nullable=True))
+    # Tasks executed before the status column existed were marked by appending "(Executed at ...)" to their name
+    op.execute("UPDATE tasks SET status = 'SUCCEEDED' WHERE status = 'PENDING' AND name LIKE '% (Executed at %)'")
+
+
+def downgrade() -> None:
+    op.drop_column('tasks', 'finished_at')
+    op.drop_column('tasks', 'started_at')
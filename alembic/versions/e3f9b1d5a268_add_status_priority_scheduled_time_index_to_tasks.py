@@ -0,0 +1,27 @@
+"""Add status, priority and scheduled_time index to tasks
+
+Revision ID: e3f9b1d5a268
+Revises: d1e5a7c3f284
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3f9b1d5a268'
+down_revision: Union[str, None] = 'd1e5a7c3f284'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Serves the dispatch queue claims, which take the due tasks of one priority at a time in scheduled time order,
+    # so that only the claimed rows are read and locked rather than the whole due backlog.
+    op.create_index('ix_tasks_status_priority_scheduled_time', 'tasks', ['status', 'priority', 'scheduled_time'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_status_priority_scheduled_time', table_name='tasks')
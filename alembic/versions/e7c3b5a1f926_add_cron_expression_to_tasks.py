@@ -0,0 +1,26 @@
+"""Add cron expression to tasks
+
+Revision ID: e7c3b5a1f926
+Revises: d4a9e1c7b352
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7c3b5a1f926'
+down_revision: Union[str, None] = 'd4a9e1c7b352'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('cron_expression', sa.String(length=255), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('tasks', 'cron_expression')
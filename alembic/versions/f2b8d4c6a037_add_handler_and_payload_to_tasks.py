@@ -0,0 +1,28 @@
+"""Add handler and payload to tasks
+
+Revision ID: f2b8d4c6a037
+Revises: e7c3b5a1f926
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b8d4c6a037'
+down_revision: Union[str, None] = 'e7c3b5a1f926'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('handler', sa.String(length=255), nullable=True))
+    op.add_column('tasks', sa.Column('payload', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('tasks', 'payload')
+    op.drop_column('tasks', 'handler')
@@ -0,0 +1,27 @@
+"""Add anchor_day to tasks
+
+Revision ID: f4a2c8e6d391
+Revises: e3f9b1d5a268
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4a2c8e6d391'
+down_revision: Union[str, None] = 'e3f9b1d5a268'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing tasks keep following the day of their scheduled time, which may already be clamped
+    op.add_column('tasks', sa.Column('anchor_day', sa.SmallInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('tasks', 'anchor_day')
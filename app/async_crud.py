@@ -0,0 +1,146 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Any, AsyncIterator, List, Optional, Tuple
+from .schemas import TaskCreate, TaskFilter
+from . import crud, models
+
+# Async counterparts of the functions in `crud`, used by the API.
+#
+# Each function runs the matching sync implementation through `AsyncSession.run_sync`. SQLAlchemy executes it on
+# the async driver, suspending the coroutine on every database round trip instead of blocking the event loop,
+# so the query logic lives in one place and the executor keeps using `crud` on a regular `Session`.
+
+async def create_task(db: AsyncSession, task_name: str, scheduled_time: datetime, recurrence: models.RecurrenceFrequency = None, cron_expression: str = None,
+                      handler: str = None, payload: Any = None, priority: int = 0, group: str = None,
+                      misfire_policy: models.MisfirePolicy = None) -> models.Task:
+    """
+    Async variant of `crud.create_task`.
+
+    Example usage:
+    ```python
+    new_task = await create_task(db, "Task Name", datetime.now(), models.RecurrenceFrequency.DAILY)
+    ```
+    """
+    return await db.run_sync(crud.create_task, task_name, scheduled_time, recurrence, cron_expression, handler, payload, priority, group,
+                             misfire_policy)
+
+async def upsert_task(db: AsyncSession, task_name: str, scheduled_time: datetime, recurrence: models.RecurrenceFrequency = None, cron_expression: str = None,
+                      handler: str = None, payload: Any = None, priority: int = 0, group: str = None,
+                      misfire_policy: models.MisfirePolicy = None, update_existing: bool = False) -> models.Task:
+    """
+    Async variant of `crud.upsert_task`.
+
+    Example usage:
+    ```python
+    task = await upsert_task(db, "Weekly report", datetime(2030, 1, 6, 9), models.RecurrenceFrequency.WEEKLY)
+    ```
+    """
+    return await db.run_sync(crud.upsert_task, task_name, scheduled_time, recurrence, cron_expression, handler, payload, priority, group,
+                             misfire_policy, update_existing)
+
+async def create_tasks(db: AsyncSession, tasks: List[TaskCreate], chunk_size: int = 1000) -> Tuple[List[models.Task], List[dict]]:
+    """
+    Async variant of `crud.create_tasks`.
+
+    Example usage:
+    ```python
+    created, errors = await create_tasks(db, [TaskCreate(name="A", scheduled_time=when)])
+    ```
+    """
+    return await db.run_sync(crud.create_tasks, tasks, chunk_size)
+
+async def get_tasks(db: AsyncSession, skip: int = 0, limit: int = 100, task_filter: Optional[TaskFilter] = None) -> List[dict]:
+    """
+    Async variant of `crud.get_tasks`.
+
+    Example usage:
+    ```python
+    tasks = await get_tasks(db, skip=10, limit=5)
+    ```
+    """
+    return await db.run_sync(crud.get_tasks, skip, limit, task_filter)
+
+async def get_tasks_page(db: AsyncSession, limit: int = 100, cursor: Optional[str] = None,
+                         task_filter: Optional[TaskFilter] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Async variant of `crud.get_tasks_page`.
+
+    Example usage:
+    ```python
+    tasks, next_cursor = await get_tasks_page(db, limit=50)
+    ```
+    """
+    return await db.run_sync(crud.get_tasks_page, limit, cursor, task_filter)
+
+async def count_tasks(db: AsyncSession, task_filter: Optional[TaskFilter] = None, exact_limit: Optional[int] = None) -> Tuple[int, bool]:
+    """
+    Async variant of `crud.count_tasks`.
+
+    Example usage:
+    ```python
+    count, exact = await count_tasks(db, TaskFilter(recurrence=models.RecurrenceFrequency.WEEKLY), exact_limit=100000)
+    ```
+    """
+    return await db.run_sync(crud.count_tasks, task_filter, exact_limit)
+
+async def iter_tasks(db: AsyncSession, chunk_size: int = 1000) -> AsyncIterator[dict]:
+    """
+    Async variant of `crud.iter_tasks`, streaming rows from a server-side cursor with `AsyncSession.stream`.
+
+    Example usage:
+    ```python
+    async for task in iter_tasks(db):
+        print(task["name"])
+    ```
+    """
+    result = await db.stream(crud.export_query(chunk_size))
+    async for partition in result.partitions():
+        for row in partition:
+            yield crud.export_record(row)
+
+async def get_task_runs(db: AsyncSession, task_id: int, limit: int = 50, before_id: Optional[int] = None) -> List[models.TaskRun]:
+    """
+    Async variant of `crud.get_task_runs`.
+
+    Example usage:
+    ```python
+    runs = await get_task_runs(db, task_id=1, limit=10)
+    ```
+    """
+    return await db.run_sync(crud.get_task_runs, task_id, limit, before_id)
+
+async def get_task_by_id(db: AsyncSession, task_id: int) -> Optional[models.Task]:
+    """
+    Async variant of `crud.get_task_by_id`.
+
+    Example usage:
+    ```python
+    task = await get_task_by_id(db, task_id=1)
+    ```
+    """
+    return await db.run_sync(crud.get_task_by_id, task_id)
+
+async def update_task(db: AsyncSession, task_id: int, new_name: str = None, new_scheduled_time: datetime = None, new_recurrence: models.RecurrenceFrequency = None,
+                      new_cron_expression: str = None, new_handler: str = None, new_payload: Any = None, new_priority: int = None,
+                      new_group: str = None, new_misfire_policy: models.MisfirePolicy = None) -> models.Task:
+    """
+    Async variant of `crud.update_task`.
+
+    Example usage:
+    ```python
+    updated_task = await update_task(db, task_id=1, new_name="Updated Task Name")
+    ```
+    """
+    return await db.run_sync(crud.update_task, task_id, new_name, new_scheduled_time, new_recurrence, new_cron_expression,
+                             new_handler, new_payload, new_priority, new_group, new_misfire_policy)
+
+async def delete_task(db: AsyncSession, task_id: int) -> bool:
+    """
+    Async variant of `crud.delete_task`.
+
+    Example usage:
+    ```python
+    success = await delete_task(db, task_id=1)
+    ```
+    """
+    return await db.run_sync(crud.delete_task, task_id)
@@ -0,0 +1,420 @@
+import abc
+import enum
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional, Union
+from sqlalchemy import DateTime, Enum
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
+from . import models
+from .config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+def task_record(task: models.Task) -> dict:
+    """Returns the column values of a task as a plain dictionary, the form in which tasks are cached."""
+    return {column.key: getattr(task, column.key) for column in models.Task.__table__.columns}
+
+def dump_task_record(record: dict) -> str:
+    """Serializes a task record to JSON for a shared backend. Enums are stored by name, datetimes in ISO format."""
+    return json.dumps({
+        key: value.name if isinstance(value, enum.Enum) else value.isoformat() if isinstance(value, datetime) else value
+        for key, value in record.items()
+    })
+
+def load_task_record(data: str) -> dict:
+    """Parses a task record serialized by `dump_task_record`, using the column types of `models.Task`."""
+    record = json.loads(data)
+    for column in models.Task.__table__.columns:
+        value = record.get(column.key)
+        if value is None:
+            continue
+        if isinstance(column.type, Enum):
+            record[column.key] = column.type.enum_class[value]
+        elif isinstance(column.type, DateTime):
+            record[column.key] = datetime.fromisoformat(value)
+    return record
+
+class CacheBackend(abc.ABC):
+    """
+    A cache shared by all replicas, storing serialized task records by key.
+
+    Besides plain reads and writes, keys have a version changed by every `invalidate` of them and by `clear`. A
+    replica takes the version of a key before reading the database and stores its result with `set_if_version`,
+    which writes nothing if another replica invalidated the key in the meantime, so a stale read is never cached.
+
+    Implementations must be safe to call from several threads.
+    """
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """Returns the value of `key`, or None if it is missing or expired."""
+
+    @abc.abstractmethod
+    def set(self, key: str, value: str, ttl: float):
+        """Stores `value` under `key` for `ttl` seconds."""
+
+    @abc.abstractmethod
+    def delete(self, keys: Iterable[str]):
+        """Removes `keys`, without changing their versions."""
+
+    @abc.abstractmethod
+    def clear(self):
+        """Removes every key and changes the version of all of them."""
+
+    @abc.abstractmethod
+    def version(self, key: str) -> str:
+        """Returns the current version of `key`, to pass to `set_if_version`."""
+
+    @abc.abstractmethod
+    def set_if_version(self, key: str, value: str, ttl: float, version: str) -> bool:
+        """Stores `value` under `key` for `ttl` seconds if its version is still `version`, atomically."""
+
+    @abc.abstractmethod
+    def invalidate(self, keys: Iterable[str]):
+        """Removes `keys` and changes their versions."""
+
+class InMemoryBackend(CacheBackend):
+    """A `CacheBackend` kept in a dictionary of this process, standing in for a shared store in tests and local runs."""
+
+    def __init__(self):
+        self._entries: Dict[str, tuple] = {}
+        self._versions: Dict[str, int] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def set(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._versions.clear()
+
+    def version(self, key: str) -> str:
+        with self._lock:
+            return f"{self._generation}:{self._versions.get(key, 0)}"
+
+    def set_if_version(self, key: str, value: str, ttl: float, version: str) -> bool:
+        with self._lock:
+            if version != f"{self._generation}:{self._versions.get(key, 0)}":
+                return False
+            self._entries[key] = (time.monotonic() + ttl, value)
+            return True
+
+    def invalidate(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+# Stores ARGV[2] in KEYS[1] for ARGV[3] ms if "<generation>:<version>" read from KEYS[3] and KEYS[2] is ARGV[1]
+_SET_IF_VERSION = """
+local current = (redis.call('GET', KEYS[3]) or '0') .. ':' .. (redis.call('GET', KEYS[2]) or '0')
+if current ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3])
+return 1
+"""
+
+class RedisBackend(CacheBackend):
+    """
+    A `CacheBackend` stored in Redis, so that every replica reads the same entries and sees the invalidations of the
+    others. Requires the `redis` package, installed by the `redis` extra (`poetry install -E redis`).
+
+    The version of a key is kept in Redis too, as `<generation>:<counter>`: `invalidate` increments the counter of
+    each key and `clear` the generation of the prefix. `set_if_version` compares and writes in one Lua script, so no
+    invalidation can slip between the check and the write. Counters expire `version_ttl` seconds after their last
+    increment, which only has to outlast the longest database read between `version` and `set_if_version`.
+
+    The API calls the cache from `crud` functions run by `AsyncSession.run_sync`, in a greenlet on the event loop.
+    There, commands go through a `redis.asyncio` client and the greenlet awaits them, like the async database driver
+    does, so the loop keeps serving other requests during the round trip. Elsewhere, in the threads of the executor
+    side, a blocking client is used.
+
+    Parameters:
+    - url (str): Redis connection URL, e.g. `redis://cache:6379/0`.
+    - prefix (str): Prefix of the keys written by this cache, removed all at once by `clear`.
+    - version_ttl (float): Seconds a key's invalidation counter is kept.
+    """
+
+    def __init__(self, url: str, prefix: str = "taskscheduler:task:", version_ttl: float = 3600.0):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError as e:
+            raise ImportError("TASK_CACHE_BACKEND=redis requires the redis package, install it with `poetry install -E redis`") from e
+        self._client = redis.Redis.from_url(url)
+        self._async_client = redis.asyncio.Redis.from_url(url)
+        self._prefix = prefix
+        self._generation_key = prefix + "generation"
+        self._version_ttl_ms = int(version_ttl * 1000)
+
+    def _run(self, command: Callable):
+        """Runs `command` on the client suited to the caller, awaiting it without blocking the loop in a greenlet."""
+        if in_greenlet():
+            return await_only(command(self._async_client))
+        return command(self._client)
+
+    def _version_key(self, key: str) -> str:
+        return f"{self._prefix}version:{key}"
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._run(lambda client: client.get(self._prefix + key))
+        return value.decode() if value is not None else None
+
+    def set(self, key: str, value: str, ttl: float):
+        self._run(lambda client: client.set(self._prefix + key, value, px=int(ttl * 1000)))
+
+    def delete(self, keys: Iterable[str]):
+        keys = [self._prefix + key for key in keys]
+        if keys:
+            self._run(lambda client: client.delete(*keys))
+
+    def clear(self):
+        # Bumping the generation first makes the versions taken before unusable even if the scan misses a write
+        self._run(lambda client: client.incr(self._generation_key))
+        cursor = 0
+        while True:
+            cursor, keys = self._run(lambda client: client.scan(cursor, match=self._prefix + "*", count=1000))
+            keys = [key for key in keys if key.decode() != self._generation_key]
+            if keys:
+                self._run(lambda client: client.delete(*keys))
+            if not cursor:
+                break
+
+    def version(self, key: str) -> str:
+        generation, counter = self._run(lambda client: client.mget([self._generation_key, self._version_key(key)]))
+        return f"{int(generation or 0)}:{int(counter or 0)}"
+
+    def set_if_version(self, key: str, value: str, ttl: float, version: str) -> bool:
+        keys = [self._prefix + key, self._version_key(key), self._generation_key]
+        return bool(self._run(lambda client: client.eval(_SET_IF_VERSION, len(keys), *keys, version, value, int(ttl * 1000))))
+
+    def invalidate(self, keys: Iterable[str]):
+        keys = list(keys)
+        if not keys:
+            return
+
+        def command(client):
+            pipeline = client.pipeline(transaction=True)
+            for key in keys:
+                pipeline.incr(self._version_key(key))
+                pipeline.pexpire(self._version_key(key), self._version_ttl_ms)
+            pipeline.delete(*(self._prefix + key for key in keys))
+            return pipeline.execute()
+
+        self._run(command)
+
+class TaskCache:
+    """
+    A bounded read-through cache of task records by task ID, evicting the least recently used entry when full and
+    expiring entries `ttl` seconds after they were stored.
+
+    Records are plain dictionaries of column values (see `task_record`), never ORM instances, so cached tasks are
+    not tied to a session. The write paths in `crud` invalidate the tasks they modify after committing. A lookup
+    that started before an invalidation does not store its (possibly stale) result, see `token`.
+
+    Without a backend entries are kept in this process, which is only coherent for a single replica. With a shared
+    `backend` the entries live there instead, so an invalidation made by one replica is seen by all of them, and
+    the check of `token` is made by the backend when storing, so it covers the invalidations of every replica.
+
+    Parameters:
+    - maxsize (int): Maximum number of entries kept in this process. 0 disables the cache.
+    - ttl (float): Seconds an entry stays valid.
+    - backend (CacheBackend, optional): Shared store used instead of the in-process entries.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 30.0, backend: Optional[CacheBackend] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 or self.backend is not None
+
+    def token(self, task_id: int) -> Union[int, str]:
+        """Returns a token to take before reading `task_id` from the database and to pass to `set` with the result."""
+        if self.backend is not None:
+            return self.backend.version(str(task_id))
+        return self._invalidations
+
+    def get(self, task_id: int) -> Optional[dict]:
+        """Returns a copy of the cached record of `task_id`, or None on a miss."""
+        if not self.enabled:
+            return None
+        if self.backend is not None:
+            data = self.backend.get(str(task_id))
+            record = load_task_record(data) if data is not None else None
+            with self._lock:
+                if record is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            return record
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[task_id]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(task_id)
+            self.hits += 1
+            return dict(entry[1])
+
+    def set(self, task_id: int, record: dict, token: Union[int, str]):
+        """Stores the record of `task_id`, unless an invalidation happened since `token` was taken."""
+        if not self.enabled:
+            return
+        if self.backend is not None:
+            self.backend.set_if_version(str(task_id), dump_task_record(record), self.ttl, token)
+            return
+        with self._lock:
+            if token != self._invalidations:
+                return
+            self._entries[task_id] = (time.monotonic() + self.ttl, dict(record))
+            self._entries.move_to_end(task_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, task_ids: Iterable[int]):
+        """Removes the records of `task_ids`."""
+        task_ids = list(task_ids)
+        if not self.enabled or not task_ids:
+            return
+        with self._lock:
+            self._invalidations += 1
+            for task_id in task_ids:
+                self._entries.pop(task_id, None)
+        if self.backend is not None:
+            self.backend.invalidate(str(task_id) for task_id in task_ids)
+
+    def clear(self):
+        """Removes every record, for writes that cannot tell which tasks they modified."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._invalidations += 1
+            self._entries.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> dict:
+        """Returns the hit, miss and eviction counters and the number of entries held in this process."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self._entries)}
+
+class IdempotencyKeyCache:
+    """
+    Remembers which task was created for each recently seen `Idempotency-Key` header, so that a producer retrying
+    the same request is answered from the task cache without writing to the database.
+
+    Keys are kept in this process, bounded to `maxsize` entries evicted least recently used first, or in a shared
+    `backend` so that a retry reaching another replica is recognized too. Entries expire `ttl` seconds after they
+    were stored.
+
+    Parameters:
+    - maxsize (int): Maximum number of keys kept in this process. 0 disables the cache.
+    - ttl (float): Seconds a key is remembered.
+    - backend (CacheBackend, optional): Shared store used instead of the in-process entries.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 86400.0, backend: Optional[CacheBackend] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[int]:
+        """Returns the ID of the task created for `key`, or None if the key was not seen recently."""
+        if self.backend is not None:
+            value = self.backend.get(key)
+            return int(value) if value is not None else None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, task_id: int):
+        """Remembers that `key` created the task `task_id`."""
+        if self.backend is not None:
+            self.backend.set(key, str(task_id), self.ttl)
+            return
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, task_id)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: str):
+        """Forgets `key`, e.g. because its task was deleted."""
+        if self.backend is not None:
+            self.backend.delete([key])
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+
+def build_backend(prefix: str) -> Optional[CacheBackend]:
+    """Builds the shared backend configured by `task_cache_backend`, or returns None for the in-process cache."""
+    if settings.task_cache_backend == "redis":
+        return RedisBackend(settings.task_cache_url, prefix=prefix)
+    if settings.task_cache_backend == "memory":
+        return InMemoryBackend()
+    if settings.task_cache_backend != "local":
+        raise ValueError(f"Unknown task cache backend: {settings.task_cache_backend}")
+    return None
+
+def build_task_cache() -> TaskCache:
+    """Builds the task cache configured by the `task_cache_*` settings."""
+    return TaskCache(maxsize=settings.task_cache_size, ttl=settings.task_cache_ttl,
+                     backend=build_backend("taskscheduler:task:"))
+
+def build_idempotency_key_cache() -> IdempotencyKeyCache:
+    """Builds the cache of `Idempotency-Key` headers, sharing the backend of the task cache."""
+    return IdempotencyKeyCache(maxsize=settings.idempotency_cache_size, ttl=settings.idempotency_key_ttl,
+                               backend=build_backend("taskscheduler:idempotency:"))
+
+task_cache = build_task_cache()
+idempotency_keys = build_idempotency_key_cache()
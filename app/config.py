@@ -0,0 +1,174 @@
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import Dict, Optional
+import os
+import socket
+
+dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+
+class Settings(BaseSettings):
+    """
+    Runtime configuration of the application, read from environment variables (case-insensitive) and the `.env` file.
+
+    Attributes:
+    - mariadb_uri (str): URL of the database, e.g. `mysql+pymysql://user:password@db/taskscheduler`, or
+      `sqlite:////data/tasks.db` for an embedded SQLite database in WAL mode, for single-node deployments and tests.
+    - mariadb_async_uri (Optional[str]): URL used by the API's async engine. By default it is derived from
+      `mariadb_uri` by swapping the driver.
+    - db_api_pool_size (int): Connections kept open in the API's pool.
+    - db_api_max_overflow (int): Connections the API's pool may open beyond `db_api_pool_size` under load.
+    - db_executor_pool_size (Optional[int]): Connections kept open in the pool used by task execution, the queue
+      dispatcher and rehydration. By default one per task worker plus two for the scheduler's housekeeping.
+    - db_executor_max_overflow (int): Connections the executor pool may open beyond its size under load.
+    - db_pool_timeout (float): Seconds to wait for a free connection before failing, rather than queueing
+      indefinitely behind an exhausted pool.
+    - db_pool_recycle (int): Seconds after which a pooled connection is replaced. Keep it below the server's
+      `wait_timeout`.
+    - db_pool_pre_ping (bool): Whether connections are checked before being handed out, so connections closed by
+      the server are replaced transparently.
+    - db_isolation_level (Optional[str]): Transaction isolation level of both engines, e.g. `READ COMMITTED`.
+      None keeps the server default.
+    - db_statement_timeout (Optional[float]): Seconds after which MariaDB aborts a statement (`max_statement_time`).
+      None means no limit.
+    - sqlite_busy_timeout (float): Seconds a SQLite write transaction waits for the database's write lock.
+    - sqlite_synchronous (str): SQLite `synchronous` pragma. `NORMAL` may lose the last commits on a power loss, never
+      corrupts the database; `FULL` syncs every commit.
+    - sqlite_cache_size_mb (int): Page cache of each SQLite connection, in megabytes.
+    - sqlite_mmap_size_mb (int): Part of the SQLite database file read through memory mapping, in megabytes.
+    - dispatch_mode (str): How due tasks are executed. `scheduler` keeps jobs in this process' APScheduler instance,
+      `queue` has every replica poll the `tasks` table and claim due tasks with `SELECT ... FOR UPDATE SKIP LOCKED`.
+    - worker_id (str): Identifier written to `lease_owner` for tasks claimed or started by this process. Tasks still
+      leased to it when the process starts were left running by a previous run, and are put back to pending.
+    - dispatch_batch_size (int): Maximum number of due tasks claimed by one poll in queue mode.
+    - dispatch_poll_interval (float): Seconds between two polls when no due task was found.
+    - dispatch_lease_seconds (int): How long a claim stays valid without being renewed, in both dispatch modes. A task
+      whose lease expired (for example because its replica died) is put back to pending and run again.
+    - dispatch_workers (int): Number of threads executing claimed tasks in queue mode.
+    - dispatch_group_concurrency (Optional[int]): Maximum executions of one task group running at the same time in
+      this process. None means no limit.
+    - dispatch_group_rate (Optional[float]): Maximum executions of one task group started per second in this
+      process (token bucket). None means no limit.
+    - dispatch_group_burst (int): Executions of one task group that may start back to back within its rate.
+    - dispatch_group_limits (Dict[str, dict]): Limits of specific groups replacing the three above, as JSON, e.g.
+      `{"reports": {"concurrency": 2, "rate": 0.5, "burst": 5}}`.
+    - scheduler_thread_pool_size (int): Threads of the scheduler's default executor, which runs `execute_task`.
+    - scheduler_process_pool_size (int): Processes of the handler runtime running CPU-bound handlers.
+    - scheduler_asyncio_pool_size (int): I/O-bound handlers the handler runtime runs concurrently as coroutines.
+    - scheduler_queue_size (int): Jobs each executor accepts beyond its workers. Further due jobs wait in the job
+      store until a worker is free.
+    - scheduler_max_instances (int): Maximum concurrently running instances of the same job.
+    - scheduler_coalesce (bool): Whether missed runs of the same job are rolled into a single one.
+    - scheduler_misfire_grace_time (Optional[int]): Seconds after its run time a job of the scheduler's own may still
+      start. None means no limit. Task jobs are never dropped by APScheduler: late tasks follow their misfire policy.
+    - scheduler_backpressure_interval (float): Minimum seconds between two scheduling passes while an executor is saturated.
+    - misfire_grace_time (int): Seconds an occurrence may start late before it misfires and its task's misfire
+      policy applies.
+    - misfire_policy (str): Misfire policy of the tasks without one: `run_all`, `coalesce`, `skip` or `spread`.
+    - misfire_catchup_rate (Optional[float]): Maximum occurrences that misfired started per second in this process,
+      so that catching up after a restart or an outage does not flood the workers and the database. None means no
+      limit.
+    - misfire_spread_seconds (int): Window over which the misfired occurrences of `spread` tasks are started, at
+      random times.
+    - rehydration_horizon_seconds (int): Only tasks due within this many seconds are held as scheduler jobs.
+    - rehydration_chunk_size (int): Rows read per query when loading tasks into the scheduler.
+    - rehydration_refill_interval (int): Seconds between two loads of the next window of due tasks.
+    - timer_engine (str): What holds pending tasks until they are due in scheduler mode. `apscheduler` keeps one
+      APScheduler job per task; `native` keeps compact entries in `timer_engine.TimerEngine` and only creates an
+      APScheduler job when the task is due, which scales to millions of pending tasks.
+    - task_cache_size (int): Maximum number of task records cached in this process by `crud.get_task_by_id`.
+      0 disables the cache.
+    - task_cache_ttl (float): Seconds a cached task record stays valid.
+    - task_cache_backend (str): Where task records are cached. `local` keeps them in this process, which is only
+      coherent with a single replica; `redis` shares them between replicas through `task_cache_url`; `memory` is an
+      in-process stand-in for a shared store, for tests.
+    - task_cache_url (Optional[str]): Connection URL of the shared cache backend.
+    - idempotency_cache_size (int): Maximum number of `Idempotency-Key` headers remembered in this process. They are
+      kept in the task cache backend when it is shared.
+    - idempotency_key_ttl (float): Seconds an `Idempotency-Key` is remembered.
+    - result_writer_batch_size (int): Execution results written together by `result_writer.ResultWriter`.
+    - result_writer_flush_interval_ms (int): Maximum milliseconds an execution result waits before being written.
+    - result_writer_retry_seconds (float): Delay before retrying a batch of results that failed to be written.
+    - result_writer_max_attempts (int): Attempts at writing a batch of results before it is split in halves. Results
+      that still fail on their own are dropped, and their tasks run again once their lease expires.
+    - task_run_retention_days (int): Age in days after which execution history rows are deleted. 0 keeps them forever.
+    - task_run_retention_batch_size (int): History rows deleted per statement by the retention job.
+    - task_run_retention_interval (int): Seconds between two passes of the retention job.
+    - bulk_create_max_tasks (int): Maximum number of tasks in one `POST /api/tasks/bulk` request. Larger batches are
+      rejected as a whole, before any item is validated or inserted.
+    - task_count_exact_limit (int): Estimated number of matching rows above which `GET /api/tasks/count` returns the
+      estimate of the table statistics instead of counting, unless an exact count is requested.
+    - event_buffer_size (int): Task change events kept in this process for `GET /api/tasks/events` subscribers
+      that reconnect or fall behind.
+    - event_heartbeat_seconds (float): Seconds without events after which the change feed sends a keep-alive.
+    - admin_token (Optional[str]): Token expected in the `X-Admin-Token` header by the `/api/admin` endpoints, such
+      as profiling. None disables them.
+    """
+    model_config = SettingsConfigDict(env_file=dotenv_path, extra="ignore")
+
+    mariadb_uri: Optional[str] = None
+    mariadb_async_uri: Optional[str] = None
+    db_api_pool_size: int = 10
+    db_api_max_overflow: int = 10
+    db_executor_pool_size: Optional[int] = None
+    db_executor_max_overflow: int = 5
+    db_pool_timeout: float = 10.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_isolation_level: Optional[str] = None
+    db_statement_timeout: Optional[float] = None
+    sqlite_busy_timeout: float = 10.0
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_cache_size_mb: int = 64
+    sqlite_mmap_size_mb: int = 256
+    dispatch_mode: str = "scheduler"
+    worker_id: str = f"{socket.gethostname()}-{os.getpid()}"
+    dispatch_batch_size: int = 50
+    dispatch_poll_interval: float = 1.0
+    dispatch_lease_seconds: int = 300
+    dispatch_workers: int = 10
+    dispatch_group_concurrency: Optional[int] = None
+    dispatch_group_rate: Optional[float] = None
+    dispatch_group_burst: int = 1
+    dispatch_group_limits: Dict[str, dict] = {}
+    scheduler_thread_pool_size: int = 10
+    scheduler_process_pool_size: int = os.cpu_count() or 1
+    scheduler_asyncio_pool_size: int = 100
+    scheduler_queue_size: int = 100
+    scheduler_max_instances: int = 1
+    scheduler_coalesce: bool = False
+    scheduler_misfire_grace_time: Optional[int] = 15
+    scheduler_backpressure_interval: float = 0.5
+    misfire_grace_time: int = 15
+    misfire_policy: str = "coalesce"
+    misfire_catchup_rate: Optional[float] = None
+    misfire_spread_seconds: int = 300
+    rehydration_horizon_seconds: int = 900
+    rehydration_chunk_size: int = 1000
+    rehydration_refill_interval: int = 60
+    timer_engine: str = "apscheduler"
+    task_cache_size: int = 10000
+    task_cache_ttl: float = 30.0
+    task_cache_backend: str = "local"
+    task_cache_url: Optional[str] = None
+    idempotency_cache_size: int = 10000
+    idempotency_key_ttl: float = 86400.0
+    result_writer_batch_size: int = 100
+    result_writer_flush_interval_ms: int = 200
+    result_writer_retry_seconds: float = 1.0
+    result_writer_max_attempts: int = 5
+    task_run_retention_days: int = 30
+    task_run_retention_batch_size: int = 1000
+    task_run_retention_interval: int = 3600
+    bulk_create_max_tasks: int = 10000
+    task_count_exact_limit: int = 100000
+    event_buffer_size: int = 10000
+    event_heartbeat_seconds: float = 15.0
+    admin_token: Optional[str] = None
+
+    @property
+    def executor_pool_size(self) -> int:
+        """Size of the executor pool: `db_executor_pool_size`, or one connection per task worker plus two."""
+        if self.db_executor_pool_size is not None:
+            return self.db_executor_pool_size
+        return max(self.scheduler_thread_pool_size, self.dispatch_workers) + 2
+
+settings = Settings()
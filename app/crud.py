@@ -1,10 +1,36 @@
+from sqlalchemy import and_, bindparam, case, delete, func, insert, literal, or_, select, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
-from .schemas import TaskCreate
-from datetime import datetime
-from . import models
+from .schemas import TaskCreate, TaskFilter
+from datetime import datetime, timedelta
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+from . import events, models
+from .cache import task_cache, task_record
+from .events import task_events
+from .handlers import decode_payload, encode_payload
+from .metrics import observe_db
+from .recurrence import next_runs_after
+import numpy as np
+import base64
+import json
 
-def create_task(db: Session, task_name: str, scheduled_time: datetime, recurrence: models.RecurrenceFrequency = None) -> models.Task:
+# Columns of the `schemas.Task` response model, in its field order, read by the list and export queries without
+# building ORM instances
+TASK_RESPONSE_COLUMNS = (
+    models.Task.name, models.Task.scheduled_time, models.Task.recurrence, models.Task.cron_expression,
+    models.Task.handler, models.Task.payload, models.Task.priority, models.Task.group, models.Task.misfire_policy,
+    models.Task.id, models.Task.status, models.Task.started_at, models.Task.finished_at,
+)
+TASK_RESPONSE_KEYS = tuple(column.key for column in TASK_RESPONSE_COLUMNS)
+
+@observe_db("create_task")
+def create_task(db: Session, task_name: str, scheduled_time: datetime, recurrence: models.RecurrenceFrequency = None, cron_expression: str = None,
+                handler: str = None, payload: Any = None, priority: int = 0, group: str = None,
+                misfire_policy: models.MisfirePolicy = None) -> models.Task:
     """
     Creates a new task in the database with the specified details.
 
@@ -13,6 +39,13 @@ def create_task(db: Session, task_name: str, scheduled_time: datetime, recurrenc
     - task_name (str): Name of the task to be created.
     - scheduled_time (datetime): The time when the task is scheduled to be executed.
     - recurrence (models.RecurrenceFrequency, optional): The recurrence pattern of the task. Defaults to None.
+    - cron_expression (str, optional): A cron expression of the times the task recurs at, taking precedence over `recurrence`. Defaults to None.
+    - handler (str, optional): Name of the handler executing the task. Defaults to None, the default handler.
+    - payload (Any, optional): JSON-serializable argument passed to the handler. Defaults to None.
+    - priority (int, optional): Priority of the task among due tasks, higher first. Defaults to 0.
+    - group (str, optional): Group whose concurrency and rate limits the task shares. Defaults to None.
+    - misfire_policy (models.MisfirePolicy, optional): What happens to an occurrence that misfired. Defaults to None,
+      the `misfire_policy` setting.
 
     Returns:
     - models.Task: The created task object.
@@ -25,7 +58,9 @@ def create_task(db: Session, task_name: str, scheduled_time: datetime, recurrenc
     new_task = create_task(db, "Task Name", datetime.now(), models.RecurrenceFrequency.DAILY)
     ```
     """
-    db_task = models.Task(name=task_name, scheduled_time=scheduled_time, recurrence=recurrence)
+    db_task = models.Task(name=task_name, scheduled_time=scheduled_time, anchor_day=scheduled_time.day, recurrence=recurrence,
+                          cron_expression=cron_expression, handler=handler, payload=encode_payload(payload), priority=priority,
+                          group=group, misfire_policy=misfire_policy)
     db.add(db_task)
     try:
         db.commit()
@@ -33,30 +68,503 @@ def create_task(db: Session, task_name: str, scheduled_time: datetime, recurrenc
     except Exception as e:
         db.rollback()
         raise e
+    task_cache.invalidate([db_task.id])
+    task_events.publish(events.CREATED, db_task.id, task_event_record(db_task))
+    return db_task
+
+@observe_db("upsert_task")
+def upsert_task(db: Session, task_name: str, scheduled_time: datetime, recurrence: models.RecurrenceFrequency = None, cron_expression: str = None,
+                handler: str = None, payload: Any = None, priority: int = 0, group: str = None, misfire_policy: models.MisfirePolicy = None,
+                update_existing: bool = False) -> models.Task:
+    """
+    Creates a task, or resolves the conflict with the existing task of the same name in the same statement, without
+    raising an IntegrityError.
+
+    On MariaDB this is an `INSERT ... ON DUPLICATE KEY UPDATE` which, when the name exists, sets `id` to
+    `LAST_INSERT_ID(id)` so that the ID of the existing row is returned like a generated one. SQLite uses
+    `INSERT ... ON CONFLICT (name) DO UPDATE ... RETURNING id`. Other dialects fall back to `_upsert_portable`, which
+    takes two statements when the name exists.
+
+    The row of the same name is read first, by the unique index on `name`, and compared with the row left by the
+    statement: the cached record is invalidated and an event published only if the task was created or changed, so
+    retries of the same request cost no invalidation and reach no subscriber.
+
+    Args:
+    - db (Session): Database session for transaction management.
+    - task_name (str): Name of the task, the key on which duplicates are detected.
+    - scheduled_time (datetime): The time when the task is scheduled to be executed.
+    - recurrence (models.RecurrenceFrequency, optional): The recurrence pattern of the task. Defaults to None.
+    - cron_expression (str, optional): A cron expression of the times the task recurs at. Defaults to None.
+    - handler (str, optional): Name of the handler executing the task. Defaults to None.
+    - payload (Any, optional): JSON-serializable argument passed to the handler. Defaults to None.
+    - priority (int, optional): Priority of the task among due tasks, higher first. Defaults to 0.
+    - group (str, optional): Group whose concurrency and rate limits the task shares. Defaults to None.
+    - misfire_policy (models.MisfirePolicy, optional): What happens to an occurrence that misfired. Defaults to None.
+    - update_existing (bool): Whether an existing task takes the given values (an upsert), like `update_task` would
+      set them, or is returned unchanged (an idempotent create). Defaults to False.
+
+    Returns:
+    - models.Task: The created, updated or existing task.
+
+    Raises:
+    - Exception: If the statement fails, it rolls back the session and raises the exception.
+
+    Example usage:
+    ```python
+    task = upsert_task(db, "Weekly report", datetime(2030, 1, 6, 9), models.RecurrenceFrequency.WEEKLY)
+    ```
+    """
+    table = models.Task.__table__
+    values = {"name": task_name, "scheduled_time": scheduled_time, "anchor_day": scheduled_time.day, "recurrence": recurrence,
+              "cron_expression": cron_expression,
+              "handler": handler, "payload": encode_payload(payload), "priority": priority, "group": group,
+              "misfire_policy": misfire_policy}
+    dialect = db.get_bind().dialect.name
+    try:
+        # The stored row, to tell a retry that changes nothing from a creation or a real update
+        existing = db.execute(select(table).where(table.c.name == task_name)).mappings().first()
+        if dialect in ("mysql", "mariadb"):
+            statement = mysql.insert(table).values(values)
+            changes = {"id": func.LAST_INSERT_ID(table.c.id)}
+            if update_existing:
+                changes.update(_upsert_changes(table, statement.inserted))
+            task_id = db.execute(statement.on_duplicate_key_update(changes)).lastrowid
+        elif dialect == "sqlite":
+            statement = sqlite.insert(table).values(values)
+            # DO NOTHING would not return the existing row
+            changes = _upsert_changes(table, statement.excluded) if update_existing else {"name": statement.excluded.name}
+            task_id = db.execute(statement.on_conflict_do_update(index_elements=[table.c.name], set_=changes)
+                                 .returning(table.c.id)).scalar_one()
+        else:
+            task_id = _upsert_portable(db, table, values, update_existing)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    db_task = db.query(models.Task).filter(models.Task.id == task_id).first()
+    if existing is not None and dict(existing) == task_record(db_task):
+        # Cached records and subscribers are still up to date
+        return db_task
+    task_cache.invalidate([task_id])
+    task_events.publish(events.UPDATED if existing is not None else events.CREATED, task_id, task_event_record(db_task))
     return db_task
 
-def get_tasks(db: Session, skip: int = 0, limit: int = 100):
+def _upsert_portable(db: Session, table, values: dict, update_existing: bool) -> int:
+    """
+    Upsert for dialects without one: inserts the task within a savepoint and, if the insert hits the unique name,
+    reads the ID of the existing task and updates it when `update_existing`. Returns the ID of the task.
+
+    Raises:
+    - IntegrityError: If the insert failed for another reason than an existing task of the same name.
+    """
+    try:
+        with db.begin_nested():
+            return db.execute(insert(table).values(values)).inserted_primary_key[0]
+    except IntegrityError:
+        task_id = db.execute(select(table.c.id).where(table.c.name == values["name"])).scalar()
+        if task_id is None:
+            raise
+    if update_existing:
+        db.execute(update(table).where(table.c.id == task_id).values(_upsert_changes(table, values)))
+    return task_id
+
+def _upsert_changes(table, new) -> dict:
+    """SET clause of an upsert: the new definition of the task, and back to PENDING if it had finished, like `update_task`."""
+    changes = {name: new[name] for name in ("scheduled_time", "anchor_day", "recurrence", "cron_expression", "handler", "payload", "priority", "group",
+                                                 "misfire_policy")}
+    changes["status"] = case(
+        (table.c.status.in_(models.FINISHED_STATUSES), literal(models.TaskStatus.PENDING, table.c.status.type)),
+        else_=table.c.status,
+    )
+    return changes
+
+@observe_db("create_tasks")
+def create_tasks(db: Session, tasks: List[TaskCreate], chunk_size: int = 1000) -> Tuple[List[models.Task], List[dict]]:
+    """
+    Creates many tasks at once, inserting each chunk with a single multi-row INSERT inside one transaction.
+
+    Names that already exist in the database, or that appear more than once in the batch, are reported as
+    per-item errors instead of failing the whole batch. If a chunk still hits an IntegrityError (for example
+    because a concurrent request inserted the same name), only that chunk is retried row by row inside
+    savepoints so the offending items can be isolated.
+
+    Args:
+    - db (Session): Database session for transaction management.
+    - tasks (List[TaskCreate]): The validated tasks to create, in request order.
+    - chunk_size (int): Maximum number of rows sent in one INSERT statement. Defaults to 1000.
+
+    Returns:
+    - Tuple[List[models.Task], List[dict]]: The created task objects, and one error dict per rejected item
+      with its `index` in the input list, its `name` and a `detail` message.
+
+    Raises:
+    - Exception: If the transaction fails as a whole, it rolls back the session and raises the exception.
+
+    Example usage:
+    ```python
+    created, errors = create_tasks(db, [TaskCreate(name="A", scheduled_time=when)])
+    ```
+    """
+    created: List[models.Task] = []
+    errors: List[dict] = []
+    seen = set()
+    try:
+        for start in range(0, len(tasks), chunk_size):
+            chunk = list(enumerate(tasks[start:start + chunk_size], start=start))
+            names = [task.name for _, task in chunk]
+            existing = set(db.scalars(select(models.Task.name).where(models.Task.name.in_(names))))
+
+            rows = []
+            for index, task in chunk:
+                if task.name in existing or task.name in seen:
+                    errors.append({"index": index, "name": task.name, "detail": "Task name already exists"})
+                    continue
+                seen.add(task.name)
+                rows.append((index, {"name": task.name, "scheduled_time": task.scheduled_time, "anchor_day": task.scheduled_time.day,
+                             "recurrence": task.recurrence,
+                             "cron_expression": task.cron_expression, "handler": task.handler,
+                             "payload": encode_payload(task.payload), "priority": task.priority, "group": task.group,
+                             "misfire_policy": task.misfire_policy}))
+            if not rows:
+                continue
+
+            try:
+                with db.begin_nested():
+                    db.execute(insert(models.Task), [row for _, row in rows])
+                inserted = [row["name"] for _, row in rows]
+            except IntegrityError:
+                inserted = []
+                for index, row in rows:
+                    try:
+                        with db.begin_nested():
+                            db.execute(insert(models.Task), [row])
+                        inserted.append(row["name"])
+                    except IntegrityError:
+                        errors.append({"index": index, "name": row["name"], "detail": "Task name already exists"})
+
+            if inserted:
+                by_name = {task.name: task for task in db.scalars(select(models.Task).where(models.Task.name.in_(inserted)))}
+                created.extend(by_name[name] for name in inserted)
+        # Detach the rows so commit does not expire them and trigger one refresh query per task.
+        for db_task in created:
+            db.expunge(db_task)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    task_cache.invalidate(db_task.id for db_task in created)
+    task_events.publish_many((events.CREATED, db_task.id, task_event_record(db_task)) for db_task in created)
+    errors.sort(key=lambda error: error["index"])
+    return created, errors
+
+def filter_tasks(query, task_filter: Optional[TaskFilter]):
+    """
+    Adds the conditions of a `TaskFilter` to a query on `tasks`.
+
+    Each filter is served by an index: scheduled time ranges by `ix_tasks_scheduled_time`, or together with a status
+    or recurrence by `ix_tasks_status_scheduled_time` and `ix_tasks_recurrence_scheduled_time`, and name prefixes
+    by the unique index on `name`, as a `LIKE 'prefix%'` range.
+
+    Args:
+    - query (Select): The query to filter.
+    - task_filter (TaskFilter, optional): The filters. None returns the query unchanged.
+
+    Returns:
+    - Select: The filtered query.
+    """
+    if task_filter is None:
+        return query
+    if task_filter.scheduled_after is not None:
+        query = query.where(models.Task.scheduled_time >= task_filter.scheduled_after)
+    if task_filter.scheduled_before is not None:
+        query = query.where(models.Task.scheduled_time < task_filter.scheduled_before)
+    if task_filter.recurrence is not None:
+        query = query.where(models.Task.recurrence == task_filter.recurrence)
+    if task_filter.status is not None:
+        query = query.where(models.Task.status == task_filter.status)
+    if task_filter.name_prefix:
+        # A constant pattern, unlike `startswith`, so that MariaDB can use it as an index range
+        escaped = task_filter.name_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.where(models.Task.name.like(escaped + "%", escape="\\"))
+    return query
+
+@observe_db("get_tasks")
+def get_tasks(db: Session, skip: int = 0, limit: int = 100, task_filter: Optional[TaskFilter] = None) -> List[dict]:
     """
     Retrieves a list of tasks from the database with pagination.
 
+    Only the columns of the response are selected, and the rows are returned as plain dictionaries (see
+    `task_response_records`), ready to be serialized without building ORM instances or response models.
+
     Args:
     - db (Session): Database session for fetching data.
     - skip (int): Number of records to skip (for pagination). Defaults to 0.
     - limit (int): Maximum number of records to return (for pagination). Defaults to 100.
+    - task_filter (TaskFilter, optional): Conditions the tasks must match, see `filter_tasks`. Defaults to None.
 
     Returns:
-    - List[models.Task]: A list of task objects.
+    - List[dict]: The tasks, with the same keys as the `schemas.Task` response model.
 
     Example usage:
     ```python
     tasks = get_tasks(db, skip=10, limit=5)
     ```
     """
-    return db.query(models.Task).offset(skip).limit(limit).all()
+    query = filter_tasks(select(*TASK_RESPONSE_COLUMNS), task_filter).offset(skip).limit(limit)
+    return task_response_records(db.execute(query))
+
+def encode_cursor(scheduled_time: datetime, task_id: int) -> str:
+    """
+    Encodes the position of a task in `(scheduled_time, id)` order as an opaque pagination cursor.
+
+    Args:
+    - scheduled_time (datetime): Scheduled time of the last task of a page.
+    - task_id (int): ID of the last task of a page.
+
+    Returns:
+    - str: A URL-safe cursor string.
+    """
+    raw = json.dumps([scheduled_time.isoformat(), task_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decodes a cursor produced by `encode_cursor`.
+
+    Args:
+    - cursor (str): The opaque cursor string.
+
+    Returns:
+    - Tuple[datetime, int]: The `(scheduled_time, id)` position encoded in the cursor.
+
+    Raises:
+    - ValueError: If the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        scheduled_time, task_id = json.loads(raw)
+        return datetime.fromisoformat(scheduled_time), int(task_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+@observe_db("get_tasks_page")
+def get_tasks_page(db: Session, limit: int = 100, cursor: Optional[str] = None,
+                   task_filter: Optional[TaskFilter] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Retrieves one page of tasks ordered by `(scheduled_time, id)` using keyset pagination.
+
+    Unlike `get_tasks`, the page is located with an index range scan starting right after the cursor
+    position, so the cost of a page does not grow with its depth.
+
+    Args:
+    - db (Session): Database session for fetching data.
+    - limit (int): Maximum number of records to return. Defaults to 100.
+    - cursor (str, optional): Cursor returned with the previous page. Defaults to None, the first page.
+    - task_filter (TaskFilter, optional): Conditions the tasks must match, see `filter_tasks`. Pass the same filter
+      with every page. Defaults to None.
+
+    Returns:
+    - Tuple[List[dict], Optional[str]]: The tasks of the page, as returned by `get_tasks`, and the cursor of the
+      next page or None when there are no more tasks.
+
+    Raises:
+    - ValueError: If the cursor is malformed.
+
+    Example usage:
+    ```python
+    tasks, next_cursor = get_tasks_page(db, limit=50)
+    more_tasks, next_cursor = get_tasks_page(db, limit=50, cursor=next_cursor)
+    ```
+    """
+    query = filter_tasks(select(*TASK_RESPONSE_COLUMNS), task_filter).order_by(models.Task.scheduled_time, models.Task.id)
+    if cursor:
+        scheduled_time, task_id = decode_cursor(cursor)
+        query = query.where(or_(
+            models.Task.scheduled_time > scheduled_time,
+            and_(models.Task.scheduled_time == scheduled_time, models.Task.id > task_id),
+        ))
+    tasks = task_response_records(db.execute(query.limit(limit + 1)))
+    if len(tasks) <= limit:
+        return tasks, None
+    tasks = tasks[:limit]
+    return tasks, encode_cursor(tasks[-1]["scheduled_time"], tasks[-1]["id"])
+
+class _Explain(Executable, ClauseElement):
+    """`EXPLAIN <statement>`, compiled with the parameters of the statement."""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(_Explain)
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN " + compiler.process(element.statement, **kw)
+
+@observe_db("count_tasks")
+def count_tasks(db: Session, task_filter: Optional[TaskFilter] = None, exact_limit: Optional[int] = None) -> Tuple[int, bool]:
+    """
+    Counts the tasks matching a filter, or estimates their number when counting them would read too many rows.
+
+    An exact `COUNT(*)` reads every matching index entry, which takes seconds for millions of rows (the whole table
+    without a filter). On MariaDB, when `exact_limit` is given, the query is first explained: the optimizer's row
+    estimate comes from index statistics and range dives, in about a millisecond. If it exceeds `exact_limit`, the
+    estimate is returned instead of counting. Other databases always count.
+
+    Args:
+    - db (Session): Database session for fetching data.
+    - task_filter (TaskFilter, optional): Conditions the tasks must match, see `filter_tasks`. Defaults to None.
+    - exact_limit (int, optional): Estimated number of rows above which the estimate is returned. Defaults to None,
+      always count.
+
+    Returns:
+    - Tuple[int, bool]: The number of tasks, and whether it is exact.
+
+    Example usage:
+    ```python
+    count, exact = count_tasks(db, TaskFilter(status=models.TaskStatus.PENDING), exact_limit=100000)
+    ```
+    """
+    if exact_limit is not None and db.get_bind().dialect.name in ("mysql", "mariadb"):
+        plan = db.execute(_Explain(filter_tasks(select(models.Task.id), task_filter))).mappings().first()
+        if plan is not None and plan["rows"] is not None:
+            estimate = int(plan["rows"] * float(plan.get("filtered") or 100) / 100)
+            if estimate > exact_limit:
+                return estimate, False
+    return db.scalar(filter_tasks(select(func.count()).select_from(models.Task), task_filter)), True
+
+def export_record(row) -> dict:
+    """
+    Converts a row of `export_query` to the dictionary streamed by the export, with the payload parsed.
+
+    Args:
+    - row (Row): One row of `export_query`.
+
+    Returns:
+    - dict: The task with the same keys as the `schemas.Task` response model.
+    """
+    record = dict(zip(TASK_RESPONSE_KEYS, row))
+    record["payload"] = decode_payload(record["payload"])
+    return record
+
+def task_response_records(rows: Iterable) -> List[dict]:
+    """
+    Converts rows of `TASK_RESPONSE_COLUMNS` to dictionaries with the keys and values of the `schemas.Task` response
+    model: enums and datetimes are kept as is, and payloads are parsed (once per distinct payload, see
+    `decode_payload`). The rows come from the database, so they are not validated again.
+
+    Args:
+    - rows (Iterable[Row]): The rows, e.g. a query result.
+
+    Returns:
+    - List[dict]: One dictionary per row, in order.
+    """
+    records = [dict(zip(TASK_RESPONSE_KEYS, row)) for row in rows]
+    for record in records:
+        if record["payload"] is not None:
+            record["payload"] = decode_payload(record["payload"])
+    return records
+
+def task_event_record(task: models.Task) -> dict:
+    """
+    Converts a task to the data of its `created` and `updated` change events: the keys of the `schemas.Task`
+    response model, with the payload parsed.
+    """
+    record = task_record(task)
+    record["payload"] = decode_payload(record["payload"])
+    del record["lease_owner"], record["lease_expires_at"]
+    return record
+
+def export_query(chunk_size: int = 1000):
+    """
+    Builds the column-only, server-side cursor query used to stream every task in `(scheduled_time, id)` order.
+
+    Args:
+    - chunk_size (int): Number of rows fetched from the server at a time. Defaults to 1000.
+
+    Returns:
+    - Select: The query, shared by the sync and async export paths.
+    """
+    return (
+        select(*TASK_RESPONSE_COLUMNS)
+        .order_by(models.Task.scheduled_time, models.Task.id)
+        .execution_options(stream_results=True, yield_per=chunk_size)
+    )
+
+def iter_tasks(db: Session, chunk_size: int = 1000) -> Iterator[dict]:
+    """
+    Streams every task in `(scheduled_time, id)` order as plain dictionaries.
+
+    The rows are read through a server-side cursor in chunks of `chunk_size`, so memory stays flat
+    regardless of the size of the table. ORM instances are not built for the streamed rows.
+
+    Args:
+    - db (Session): Database session for fetching data. It must stay open while the iterator is consumed.
+    - chunk_size (int): Number of rows fetched from the server at a time. Defaults to 1000.
+
+    Yields:
+    - dict: One task with the same keys as the `schemas.Task` response model.
+
+    Example usage:
+    ```python
+    for task in iter_tasks(db):
+        print(task["name"])
+    ```
+    """
+    query = export_query(chunk_size)
+    for partition in db.execute(query).partitions():
+        for row in partition:
+            yield export_record(row)
+
+def iter_pending_task_chunks(db: Session, start: Optional[datetime], end: datetime, chunk_size: int = 1000) -> Iterator[list]:
+    """
+    Streams the pending tasks scheduled in `[start, end)` in chunks, ordered by `(scheduled_time, id)`.
+
+    Each chunk is a separate keyset query on the `(status, scheduled_time)` index that resumes right after the
+    last row of the previous chunk, so no chunk scans rows outside the window and only one chunk is held in memory.
+
+    Args:
+    - db (Session): Database session for fetching data.
+    - start (Optional[datetime]): Inclusive lower bound of the scheduled time. None includes every overdue task.
+    - end (datetime): Exclusive upper bound of the scheduled time.
+    - chunk_size (int): Maximum number of rows per chunk. Defaults to 1000.
+
+    Yields:
+    - list: Rows with the `id`, `scheduled_time`, `misfire_policy`, `recurrence`, `cron_expression` and `anchor_day` of
+      the tasks of one chunk.
+
+    Example usage:
+    ```python
+    for chunk in iter_pending_task_chunks(db, datetime.now(), datetime.now() + timedelta(minutes=15)):
+        schedule_tasks_execution(chunk)
+    ```
+    """
+    query = (
+        select(models.Task.id, models.Task.scheduled_time, models.Task.misfire_policy, models.Task.recurrence,
+               models.Task.cron_expression, models.Task.anchor_day)
+        .where(models.Task.status == models.TaskStatus.PENDING, models.Task.scheduled_time < end)
+        .order_by(models.Task.scheduled_time, models.Task.id)
+        .limit(chunk_size)
+    )
+    if start is not None:
+        query = query.where(models.Task.scheduled_time >= start)
+    chunk = db.execute(query).all()
+    while chunk:
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1]
+        chunk = db.execute(query.where(or_(
+            models.Task.scheduled_time > last.scheduled_time,
+            and_(models.Task.scheduled_time == last.scheduled_time, models.Task.id > last.id),
+        ))).all()
 
+@observe_db("get_task_by_id")
 def get_task_by_id(db: Session, task_id: int):
     """
-    Retrieves a single task by its ID.
+    Retrieves a single task by its ID, through the read-through `task_cache`.
+
+    On a cache hit no query is made and the returned task is a new, transient `models.Task` built from the cached
+    record: read its attributes, but do not add it to a session. Use a query to load a task that is modified.
 
     Args:
     - db (Session): Database session for fetching data.
@@ -75,9 +583,19 @@ def get_task_by_id(db: Session, task_id: int):
         raise HTTPException(status_code=404, detail="Task not found")
     ```
     """
-    return db.query(models.Task).filter(models.Task.id == task_id).first()
+    record = task_cache.get(task_id)
+    if record is not None:
+        return models.Task(**record)
+    token = task_cache.token(task_id)
+    db_task = db.query(models.Task).filter(models.Task.id == task_id).first()
+    if db_task is not None:
+        task_cache.set(task_id, task_record(db_task), token)
+    return db_task
 
-def update_task(db: Session, task_id: int, new_name: str = None, new_scheduled_time: datetime = None, new_recurrence: models.RecurrenceFrequency = None) -> models.Task:
+@observe_db("update_task")
+def update_task(db: Session, task_id: int, new_name: str = None, new_scheduled_time: datetime = None, new_recurrence: models.RecurrenceFrequency = None,
+                new_cron_expression: str = None, new_handler: str = None, new_payload: Any = None, new_priority: int = None,
+                new_group: str = None, new_misfire_policy: models.MisfirePolicy = None) -> models.Task:
     """
     Updates an existing task in the database with new values provided.
 
@@ -87,6 +605,12 @@ def update_task(db: Session, task_id: int, new_name: str = None, new_scheduled_t
     - new_name (str, optional): New name for the task. Defaults to None.
     - new_scheduled_time (datetime, optional): New scheduled time for the task. Defaults to None.
     - new_recurrence (models.RecurrenceFrequency, optional): New recurrence frequency for the task. Defaults to None.
+    - new_cron_expression (str, optional): New cron expression for the task. Defaults to None.
+    - new_handler (str, optional): New handler for the task. Defaults to None.
+    - new_payload (Any, optional): New handler payload for the task. Defaults to None.
+    - new_priority (int, optional): New priority for the task. Defaults to None.
+    - new_group (str, optional): New group for the task. Defaults to None.
+    - new_misfire_policy (models.MisfirePolicy, optional): New misfire policy for the task. Defaults to None.
 
     Returns:
     - models.Task: The updated task object.
@@ -108,8 +632,24 @@ def update_task(db: Session, task_id: int, new_name: str = None, new_scheduled_t
         db_task.name = new_name
     if new_scheduled_time is not None:
         db_task.scheduled_time = new_scheduled_time
+        db_task.anchor_day = new_scheduled_time.day
+        # A finished task that is given a new time runs again
+        if db_task.status in models.FINISHED_STATUSES:
+            db_task.status = models.TaskStatus.PENDING
     if new_recurrence is not None:
         db_task.recurrence = new_recurrence
+    if new_cron_expression is not None:
+        db_task.cron_expression = new_cron_expression
+    if new_handler is not None:
+        db_task.handler = new_handler
+    if new_payload is not None:
+        db_task.payload = encode_payload(new_payload)
+    if new_priority is not None:
+        db_task.priority = new_priority
+    if new_group is not None:
+        db_task.group = new_group
+    if new_misfire_policy is not None:
+        db_task.misfire_policy = new_misfire_policy
     
     try:
         db.commit()
@@ -117,9 +657,12 @@ def update_task(db: Session, task_id: int, new_name: str = None, new_scheduled_t
         db.rollback()
         # Logging the exception might be beneficial here
         raise HTTPException(status_code=500, detail="Failed to update task")
+    task_cache.invalidate([task_id])
+    task_events.publish(events.UPDATED, task_id, task_event_record(db_task))
     
     return db_task
 
+@observe_db("delete_task")
 def delete_task(db: Session, task_id: int):
     """
     Deletes a task by its ID from the database.
@@ -145,5 +688,468 @@ def delete_task(db: Session, task_id: int):
     if db_task:
         db.delete(db_task)
         db.commit()
+        task_cache.invalidate([task_id])
+        task_events.publish(events.DELETED, task_id, {})
         return True
     return False
+
+@observe_db("skip_misfired_tasks")
+def skip_misfired_tasks(db: Session, tasks: list, now: datetime, worker_id: Optional[str] = None) -> List[Tuple[int, datetime]]:
+    """
+    Records the misfired occurrence of many pending recurring tasks as skipped, and moves each task to its next
+    occurrence after `now`, without executing them.
+
+    The next runs of all the tasks are computed at once with `next_runs_after`, the rows still pending at the
+    scheduled time that was read are locked, and the tasks are moved with a single executemany UPDATE by primary
+    key, in the same transaction as the SKIPPED `task_runs` rows recording the skip. Tasks that do not recur, or that
+    changed since they were read, are left as they are.
+
+    Args:
+    - db (Session): Database session for transaction management.
+    - tasks (list): Rows with the `id`, `scheduled_time`, `recurrence`, `cron_expression` and `anchor_day` of the tasks, e.g.
+      from `iter_pending_task_chunks`.
+    - now (datetime): Occurrences at or before this time are skipped.
+    - worker_id (str, optional): Worker recorded in the run history. Defaults to None.
+
+    Returns:
+    - List[Tuple[int, datetime]]: ID and next scheduled time of the tasks moved.
+
+    Raises:
+    - Exception: If the transaction fails, it rolls back the session and raises the exception.
+
+    Example usage:
+    ```python
+    moved = skip_misfired_tasks(db, rows, datetime.now(), worker_id="replica-1")
+    ```
+    """
+    next_runs = next_runs_after(
+        np.array([task.scheduled_time for task in tasks], dtype="datetime64[us]"),
+        [task.recurrence for task in tasks], now, [task.cron_expression for task in tasks], [task.anchor_day for task in tasks],
+    ).tolist()
+    recurring = {task.id: (task.scheduled_time, next_run) for task, next_run in zip(tasks, next_runs) if next_run is not None}
+    if not recurring:
+        return []
+    table = models.Task.__table__
+    try:
+        locked = db.execute(
+            select(table.c.id, table.c.scheduled_time)
+            .where(table.c.id.in_(recurring), table.c.status == models.TaskStatus.PENDING)
+            .with_for_update()
+        ).all()
+        moved = [(row.id, row.scheduled_time, recurring[row.id][1],
+                  f"Skipped: {(now - row.scheduled_time).total_seconds():.0f}s late, beyond the misfire grace time")
+                 for row in locked if row.scheduled_time == recurring[row.id][0]]
+        if moved:
+            db.execute(
+                update(table)
+                .where(table.c.id == bindparam("b_id"), table.c.status == models.TaskStatus.PENDING,
+                       table.c.scheduled_time == bindparam("b_scheduled_time"))
+                .values(scheduled_time=bindparam("b_next_scheduled_time")),
+                [{"b_id": task_id, "b_scheduled_time": scheduled_time, "b_next_scheduled_time": next_run}
+                 for task_id, scheduled_time, next_run, _ in moved],
+            )
+            db.execute(insert(models.TaskRun), [
+                {"task_id": task_id, "scheduled_time": scheduled_time, "started_at": None, "finished_at": now,
+                 "status": models.TaskStatus.SKIPPED, "worker": worker_id, "error": error}
+                for task_id, scheduled_time, _, error in moved
+            ])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    task_cache.invalidate(task_id for task_id, _, _, _ in moved)
+    task_events.publish_many(
+        (events.FINISHED, task_id, {"status": models.TaskStatus.SKIPPED, "finished_at": now, "next_scheduled_time": next_run,
+                                    "error": error})
+        for task_id, _, next_run, error in moved
+    )
+    return [(task_id, next_run) for task_id, _, next_run, _ in moved]
+
+@observe_db("claim_due_tasks")
+def claim_due_tasks(db: Session, worker_id: str, limit: int, lease_seconds: int, excluded_groups: Iterable[Optional[str]] = (),
+                    admit: Optional[Callable[[Optional[str], datetime], bool]] = None,
+                    scheduled_after: Optional[datetime] = None) -> List[Tuple[int, Optional[str]]]:
+    """
+    Claims up to `limit` pending tasks that are due, highest priority first, for execution by the calling worker.
+
+    The priorities of the due tasks are read first, without locking. The due rows of each priority, highest first,
+    are then read in scheduled time order from the `(status, priority, scheduled_time)` index, up to the number of
+    tasks still to claim, and locked with `SELECT ... FOR UPDATE SKIP LOCKED`. Every query is thus a range of that
+    index needing no sort, and only the rows about to be claimed are locked rather than the whole due backlog, so
+    concurrent replicas never wait on, nor claim, the same rows. The claimed tasks are moved to RUNNING with a lease
+    owned by `worker_id` in the same transaction.
+
+    Args:
+    - db (Session): Database session for transaction management.
+    - worker_id (str): Identifier of the claiming worker, stored as the lease owner.
+    - limit (int): Maximum number of tasks to claim.
+    - lease_seconds (int): Validity of the lease, after which the claim can be reclaimed by another worker.
+    - excluded_groups (Iterable[Optional[str]]): Groups whose tasks are not claimed, e.g. because they reached
+      their concurrency or rate limit. `None` stands for the tasks without a group.
+    - admit (Callable[[Optional[str], datetime], bool], optional): Called with the group and scheduled time of each
+      locked task, in order; tasks it returns False for are left pending (and unlocked on commit) for other workers.
+    - scheduled_after (datetime, optional): Only claim tasks scheduled at or after this time, e.g. to leave the
+      misfired tasks for later while catching up is throttled.
+
+    Returns:
+    - List[Tuple[int, Optional[str]]]: ID and group of the claimed tasks, highest priority and then earliest
+      scheduled first.
+
+    Example usage:
+    ```python
+    claimed = claim_due_tasks(db, worker_id="replica-1", limit=50, lease_seconds=300)
+    ```
+    """
+    now = datetime.now()
+    conditions = [models.Task.status == models.TaskStatus.PENDING, models.Task.scheduled_time <= now]
+    if scheduled_after is not None:
+        conditions.append(models.Task.scheduled_time >= scheduled_after)
+    excluded_groups = set(excluded_groups)
+    if None in excluded_groups:
+        conditions.append(models.Task.group.is_not(None))
+        excluded_groups.discard(None)
+    if excluded_groups:
+        conditions.append(or_(models.Task.group.is_(None), models.Task.group.not_in(excluded_groups)))
+    try:
+        priorities = db.execute(
+            select(models.Task.priority).where(*conditions).group_by(models.Task.priority).order_by(models.Task.priority.desc())
+        ).scalars().all()
+        rows = []
+        for priority in priorities:
+            if len(rows) >= limit:
+                break
+            rows.extend(db.execute(
+                select(models.Task.id, models.Task.group, models.Task.scheduled_time)
+                .where(*conditions, models.Task.priority == priority)
+                .order_by(models.Task.scheduled_time)
+                .limit(limit - len(rows))
+                .with_for_update(skip_locked=True)
+            ).all())
+        claimed = [(row.id, row.group) for row in rows if admit is None or admit(row.group, row.scheduled_time)]
+        task_ids = [task_id for task_id, _ in claimed]
+        if task_ids:
+            db.execute(
+                update(models.Task)
+                .where(models.Task.id.in_(task_ids))
+                .values(status=models.TaskStatus.RUNNING, started_at=now, finished_at=None,
+                        lease_owner=worker_id, lease_expires_at=now + timedelta(seconds=lease_seconds))
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    task_cache.invalidate(task_ids)
+    task_events.publish_many((events.STARTED, task_id, {"started_at": now, "worker": worker_id}) for task_id in task_ids)
+    return claimed
+
+@observe_db("get_task_lanes")
+def get_task_lanes(db: Session, task_ids: List[int], chunk_size: int = 1000) -> List[Tuple[int, int, Optional[str]]]:
+    """
+    Fetches the priority and group of many tasks at once, by primary key, `chunk_size` IDs per query.
+
+    Args:
+    - db (Session): Database session for fetching data.
+    - task_ids (List[int]): IDs of the tasks.
+    - chunk_size (int): Maximum number of IDs per query. Defaults to 1000.
+
+    Returns:
+    - List[Tuple[int, int, Optional[str]]]: The `(id, priority, group)` of the tasks that exist, in no particular order.
+
+    Example usage:
+    ```python
+    for task_id, priority, group in get_task_lanes(db, [1, 2, 3]):
+        print(task_id, priority, group)
+    ```
+    """
+    lanes = []
+    for start in range(0, len(task_ids), chunk_size):
+        lanes.extend(tuple(row) for row in db.execute(
+            select(models.Task.id, models.Task.priority, models.Task.group)
+            .where(models.Task.id.in_(task_ids[start:start + chunk_size]))
+        ))
+    return lanes
+
+@observe_db("renew_leases")
+def renew_leases(db: Session, worker_id: str, task_ids: List[int], lease_seconds: int) -> int:
+    """
+    Extends the leases held by `worker_id` on tasks that are still executing.
+
+    Args:
+    - db (Session): Database session for transaction management.
+    - worker_id (str): Identifier of the worker owning the leases.
+    - task_ids (List[int]): IDs of the tasks still executing on this worker.
+    - lease_seconds (int): New validity of the leases, counted from now.
+
+    Returns:
+    - int: Number of leases renewed. Leases that were already reclaimed by another worker are not renewed.
+
+    Raises:
+    - Exception: If the update fails, it rolls back the session and raises the exception.
+    """
+    if not task_ids:
+        return 0
+    try:
+        result = db.execute(
+            update(models.Task)
+            .where(models.Task.id.in_(task_ids), models.Task.lease_owner == worker_id, models.Task.status == models.TaskStatus.RUNNING)
+            .values(lease_expires_at=datetime.now() + timedelta(seconds=lease_seconds))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    task_cache.invalidate(task_ids)
+    return result.rowcount
+
+@observe_db("reclaim_expired_leases")
+def reclaim_expired_leases(db: Session, stale_owner: Optional[str] = None) -> List[Tuple[int, datetime, Optional[models.MisfirePolicy]]]:
+    """
+    Puts RUNNING tasks whose lease has expired back to PENDING so that another worker can claim them.
+
+    The rows are locked with `SELECT ... FOR UPDATE SKIP LOCKED` before being updated, so replicas reclaiming at the
+    same time split the expired leases between them instead of waiting on each other.
+
+    Args:
+    - db (Session): Database session for transaction management.
+    - stale_owner (str, optional): A worker whose leases are all reclaimed, expired or not, e.g. this process'
+      `worker_id` at startup: the tasks it held before a crash or restart are no longer executing. RUNNING tasks
+      without a lease, left by versions that did not lease tasks started by the scheduler, are reclaimed with them.
+
+    Returns:
+    - List[Tuple[int, datetime, Optional[models.MisfirePolicy]]]: Rows with the `id`, `scheduled_time` and
+      `misfire_policy` of the reclaimed tasks, e.g. to schedule them again with `schedule_tasks_execution`.
+
+    Example usage:
+    ```python
+    reclaimed = reclaim_expired_leases(db, stale_owner="replica-1")
+    ```
+    """
+    condition = models.Task.lease_expires_at < datetime.now()
+    if stale_owner is not None:
+        condition = or_(condition, models.Task.lease_owner == stale_owner, models.Task.lease_owner.is_(None))
+    try:
+        rows = db.execute(
+            select(models.Task.id, models.Task.scheduled_time, models.Task.misfire_policy)
+            .where(models.Task.status == models.TaskStatus.RUNNING, condition)
+            .with_for_update(skip_locked=True)
+        ).all()
+        task_ids = [row.id for row in rows]
+        if task_ids:
+            db.execute(
+                update(models.Task)
+                .where(models.Task.id.in_(task_ids))
+                .values(status=models.TaskStatus.PENDING, lease_owner=None, lease_expires_at=None)
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    task_cache.invalidate(task_ids)
+    return rows
+
+@observe_db("start_task")
+def start_task(db: Session, task_id: int, worker_id: Optional[str] = None, lease_seconds: Optional[int] = None) -> Optional[models.Task]:
+    """
+    Moves a due task from PENDING to RUNNING and records its start time.
+
+    The transition is a single conditional UPDATE, so when the same task is fired twice (for example by a
+    stale timer) only one execution starts.
+
+    Args:
+    - db (Session): Database session for transaction management.
+    - task_id (int): ID of the task to start.
+    - worker_id (str, optional): Worker executing the task, stored as the owner of a lease valid for `lease_seconds`.
+      The worker renews it with `renew_leases` while the task runs; if the worker dies, the lease expires and
+      `reclaim_expired_leases` puts the task back to PENDING instead of leaving it RUNNING forever.
+    - lease_seconds (int, optional): Validity of the lease, required with `worker_id`.
+
+    Returns:
+    - models.Task or None: The started task, or None if the task does not exist, is not pending or is not due yet.
+    """
+    now = datetime.now()
+    values = {"status": models.TaskStatus.RUNNING, "started_at": now, "finished_at": None}
+    if worker_id is not None:
+        values.update(lease_owner=worker_id, lease_expires_at=now + timedelta(seconds=lease_seconds))
+    result = db.execute(
+        update(models.Task)
+        .where(models.Task.id == task_id, models.Task.status == models.TaskStatus.PENDING, models.Task.scheduled_time <= now)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if result.rowcount != 1:
+        return None
+    task_cache.invalidate([task_id])
+    task_events.publish(events.STARTED, task_id, {"started_at": now, "worker": worker_id})
+    return get_task_by_id(db, task_id)
+
+@observe_db("finish_task")
+def finish_task(db: Session, task_id: int, status: models.TaskStatus, worker_id: Optional[str] = None, next_scheduled_time: Optional[datetime] = None) -> bool:
+    """
+    Moves a RUNNING task to its final status, records its finish time and releases its lease.
+
+    For a recurring task, pass `next_scheduled_time`: the same row is then advanced to its next occurrence and
+    put back to PENDING in the same statement that records the run, instead of inserting a row per occurrence.
+
+    When `worker_id` is given the update only applies while that worker still owns the lease, so a worker whose
+    lease was reclaimed cannot overwrite the state of the new claim.
+
+    Args:
+    - db (Session): Database session for transaction management.
+    - task_id (int): ID of the executed task.
+    - status (models.TaskStatus): Final status of the execution, SUCCEEDED, FAILED or SKIPPED.
+    - worker_id (str, optional): Identifier of the worker that claimed the task in queue dispatch mode.
+    - next_scheduled_time (datetime, optional): Next occurrence of a recurring task.
+
+    Returns:
+    - bool: True if the outcome was recorded, False if the task was not running (or no longer leased by `worker_id`).
+    """
+    if not models.can_transition(models.TaskStatus.RUNNING, status):
+        raise ValueError(f"Invalid final status: {status}")
+    values = {"status": status, "finished_at": datetime.now(), "lease_owner": None, "lease_expires_at": None}
+    if next_scheduled_time is not None:
+        values.update(status=models.TaskStatus.PENDING, scheduled_time=next_scheduled_time)
+    conditions = [models.Task.id == task_id, models.Task.status == models.TaskStatus.RUNNING]
+    if worker_id is not None:
+        conditions.append(models.Task.lease_owner == worker_id)
+    result = db.execute(
+        update(models.Task)
+        .where(*conditions)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if result.rowcount:
+        task_cache.invalidate([task_id])
+        task_events.publish(events.FINISHED, task_id, {"status": status, "finished_at": values["finished_at"],
+                                                       "next_scheduled_time": next_scheduled_time})
+    return result.rowcount == 1
+
+@observe_db("finish_tasks")
+def finish_tasks(db: Session, results: list):
+    """
+    Records the outcome of many executions at once, like one `finish_task` call per result, in a single transaction,
+    and appends one `task_runs` row per execution to the run history.
+
+    The results are grouped by the shape of their UPDATE (recurring or not, leased or not), and each group is sent as
+    one executemany statement, so a batch costs at most five statements (with the history INSERT) and one commit.
+
+    Args:
+    - db (Session): Database session for transaction management.
+    - results (list): Objects with the `task_id`, `status`, `finished_at`, `worker_id` and `next_scheduled_time`
+      attributes of a `finish_task` call, and the `scheduled_time`, `started_at` and `error` of the execution,
+      e.g. `result_writer.TaskResult`.
+
+    Raises:
+    - ValueError: If a status is not a final status.
+    - Exception: If the transaction fails, it rolls back the session and raises the exception.
+
+    Example usage:
+    ```python
+    finish_tasks(db, [TaskResult(1, models.TaskStatus.SUCCEEDED, datetime.now())])
+    ```
+    """
+    groups = {}
+    for result in results:
+        if not models.can_transition(models.TaskStatus.RUNNING, result.status):
+            raise ValueError(f"Invalid final status: {result.status}")
+        recurring = result.next_scheduled_time is not None
+        groups.setdefault((recurring, result.worker_id is not None), []).append({
+            "b_id": result.task_id,
+            "b_status": models.TaskStatus.PENDING if recurring else result.status,
+            "b_finished_at": result.finished_at,
+            "b_worker_id": result.worker_id,
+            "b_scheduled_time": result.next_scheduled_time,
+        })
+    table = models.Task.__table__
+    try:
+        for (recurring, leased), params in groups.items():
+            statement = (
+                update(table)
+                .where(table.c.id == bindparam("b_id"), table.c.status == models.TaskStatus.RUNNING)
+                .values(status=bindparam("b_status"), finished_at=bindparam("b_finished_at"), lease_owner=None, lease_expires_at=None)
+            )
+            if leased:
+                statement = statement.where(table.c.lease_owner == bindparam("b_worker_id"))
+            if recurring:
+                statement = statement.values(scheduled_time=bindparam("b_scheduled_time"))
+            db.execute(statement, params)
+        db.execute(insert(models.TaskRun), [
+            {"task_id": result.task_id, "scheduled_time": result.scheduled_time, "started_at": result.started_at,
+             "finished_at": result.finished_at, "status": result.status, "worker": result.worker_id, "error": result.error}
+            for result in results
+        ])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    task_cache.invalidate(result.task_id for result in results)
+    task_events.publish_many(
+        (events.FINISHED, result.task_id, {"status": result.status, "finished_at": result.finished_at,
+                                           "next_scheduled_time": result.next_scheduled_time, "error": result.error})
+        for result in results
+    )
+
+@observe_db("get_task_runs")
+def get_task_runs(db: Session, task_id: int, limit: int = 50, before_id: Optional[int] = None) -> List[models.TaskRun]:
+    """
+    Fetches the most recent runs of a task, newest first, from the `(task_id, id)` index of `task_runs`.
+
+    Args:
+    - db (Session): Database session for fetching data.
+    - task_id (int): ID of the task.
+    - limit (int): Maximum number of runs to return. Defaults to 50.
+    - before_id (int, optional): Only return runs older than the run with this ID, to page through the history.
+
+    Returns:
+    - List[models.TaskRun]: The runs, ordered from the newest.
+
+    Example usage:
+    ```python
+    runs = get_task_runs(db, task_id=1, limit=10)
+    older = get_task_runs(db, task_id=1, limit=10, before_id=runs[-1].id)
+    ```
+    """
+    query = select(models.TaskRun).where(models.TaskRun.task_id == task_id)
+    if before_id is not None:
+        query = query.where(models.TaskRun.id < before_id)
+    return list(db.scalars(query.order_by(models.TaskRun.id.desc()).limit(limit)))
+
+@observe_db("delete_task_runs_before")
+def delete_task_runs_before(db: Session, cutoff: datetime, batch_size: int = 1000) -> int:
+    """
+    Deletes up to `batch_size` of the oldest runs that finished before `cutoff`, in one short transaction.
+
+    The IDs are read from the `finished_at` index first and deleted by primary key, so each call only locks the rows
+    it deletes. Call it repeatedly until it returns less than `batch_size`.
+
+    Args:
+    - db (Session): Database session for transaction management.
+    - cutoff (datetime): Runs that finished before this time are deleted.
+    - batch_size (int): Maximum number of runs deleted. Defaults to 1000.
+
+    Returns:
+    - int: Number of runs deleted.
+
+    Example usage:
+    ```python
+    while delete_task_runs_before(db, datetime.now() - timedelta(days=30)) == 1000:
+        pass
+    ```
+    """
+    ids = list(db.scalars(
+        select(models.TaskRun.id).where(models.TaskRun.finished_at < cutoff)
+        .order_by(models.TaskRun.finished_at).limit(batch_size)
+    ))
+    if not ids:
+        return 0
+    try:
+        db.execute(delete(models.TaskRun).where(models.TaskRun.id.in_(ids)))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    return len(ids)
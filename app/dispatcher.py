@@ -0,0 +1,162 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
+from . import crud
+from .lanes import GroupLimits
+from .misfire import CatchUp
+from .task_executor import execute_task, get_db_session, maintain_leases
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TaskDispatcher:
+    """
+    Executes due tasks by polling the `tasks` table, for deployments running several replicas.
+
+    Every replica runs one dispatcher. A poll claims due tasks with `crud.claim_due_tasks`, which locks rows with
+    `FOR UPDATE SKIP LOCKED` and leases them to this worker, so each task is executed by exactly one replica and
+    throughput grows with the number of replicas. The dispatcher never claims more tasks than it has idle worker
+    threads, renews the leases of tasks that are still executing or whose result is not written yet, and puts tasks
+    whose lease expired (because their replica died) back to pending. On its first poll it also puts back the tasks
+    still leased to its own `worker_id`, left RUNNING by a previous run of this replica.
+
+    Due tasks are claimed highest priority first. Tasks of groups that reached their concurrency or rate limit in
+    `limits` are not claimed, and stay pending for the other replicas or a later poll. Misfired tasks, left overdue
+    beyond the grace time of `catch_up` (for example while every replica was down), are claimed at most at its
+    catch-up rate, and only the tasks on time are claimed while that rate is exhausted.
+
+    Parameters:
+    - worker_id (str): Identifier of this replica, stored as the lease owner of claimed tasks.
+    - batch_size (int): Maximum number of tasks claimed by one poll.
+    - poll_interval (float): Seconds to wait before polling again when no task was due.
+    - lease_seconds (int): Validity of a lease. Leases are renewed every third of this duration.
+    - max_workers (int): Number of threads executing claimed tasks.
+    - limits (GroupLimits, optional): Concurrency and rate limits of the task groups. Defaults to no limits.
+    - catch_up (CatchUp, optional): Misfire grace time and catch-up rate. Defaults to a 15 second grace time and no
+      rate limit.
+    """
+
+    def __init__(self, worker_id: str, batch_size: int = 50, poll_interval: float = 1.0, lease_seconds: int = 300, max_workers: int = 10,
+                 limits: Optional[GroupLimits] = None, catch_up: Optional[CatchUp] = None):
+        self.worker_id = worker_id
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_workers = max_workers
+        self.limits = limits or GroupLimits()
+        self.catch_up = catch_up or CatchUp()
+        self._executor = None
+        self._thread = None
+        self._stopped = threading.Event()
+        # Group of each claimed task still executing
+        self._in_flight: Dict[int, Optional[str]] = {}
+        # Claimed tasks holding a worker thread, the others run on in `handlers.handler_runtime`
+        self._busy = 0
+        self._lock = threading.Lock()
+
+    @property
+    def busy_workers(self) -> int:
+        """Number of worker threads currently executing a claimed task."""
+        return self._busy
+
+    def start(self):
+        """Starts the polling thread and the worker pool."""
+        self._stopped.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dispatch-worker")
+        self._thread = threading.Thread(target=self._run, name="task-dispatcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Task dispatcher {self.worker_id} started with {self.max_workers} workers.")
+
+    def stop(self, wait: bool = True):
+        """Stops polling. If `wait` is True, blocks until the tasks already claimed have finished."""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+        if self._executor:
+            self._executor.shutdown(wait=wait)
+        logger.info(f"Task dispatcher {self.worker_id} stopped.")
+
+    def _run(self):
+        last_maintenance = None
+        while not self._stopped.is_set():
+            claimed = 0
+            try:
+                if last_maintenance is None or time.monotonic() - last_maintenance >= self.lease_seconds / 3:
+                    # Nothing is executing yet on the first run, so any task leased to this worker was left by a crash
+                    self._maintain_leases(stale_owner=self.worker_id if last_maintenance is None else None)
+                    last_maintenance = time.monotonic()
+                claimed = self._poll()
+            except Exception as e:
+                logger.error(f"Task dispatcher poll failed: {e}")
+            # Poll again right away while there is due work and idle workers
+            if claimed == 0:
+                self._stopped.wait(self.poll_interval)
+
+    def _maintain_leases(self, stale_owner: Optional[str] = None):
+        with self._lock:
+            in_flight = list(self._in_flight)
+        maintain_leases(self.worker_id, self.lease_seconds, task_ids=in_flight, stale_owner=stale_owner)
+
+    def _admit(self, group: Optional[str], misfired: bool, admitted: list) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if misfired and not self.catch_up.can_acquire(now):
+                return False
+            if self.limits.acquire(group, now) > 0:
+                return False
+            if misfired:
+                self.catch_up.acquire(now)
+        admitted.append(group)
+        return True
+
+    def _poll(self) -> int:
+        with self._lock:
+            idle = self.max_workers - self._busy
+            if idle <= 0:
+                return 0
+            excluded_groups = self.limits.blocked_groups(time.monotonic())
+            catching_up = self.catch_up.can_acquire(time.monotonic())
+        cutoff = self.catch_up.cutoff(datetime.now())
+        admitted = []
+        try:
+            with get_db_session() as db:
+                claimed = crud.claim_due_tasks(
+                    db=db, worker_id=self.worker_id, limit=min(idle, self.batch_size), lease_seconds=self.lease_seconds,
+                    excluded_groups=excluded_groups, scheduled_after=None if catching_up else cutoff,
+                    admit=lambda group, scheduled_time: self._admit(group, scheduled_time < cutoff, admitted),
+                )
+        except Exception:
+            with self._lock:
+                for group in admitted:
+                    self.limits.release(group)
+            raise
+        with self._lock:
+            self._in_flight.update(claimed)
+            self._busy += len(claimed)
+        for task_id, _ in claimed:
+            self._executor.submit(self._execute, task_id)
+        return len(claimed)
+
+    def _execute(self, task_id: int):
+        pending = None
+        try:
+            # The executor records the outcome, guarded by this worker's lease
+            pending = execute_task(task_id, worker_id=self.worker_id)
+        except Exception as e:
+            logger.error(f"Task {task_id} failed: {e}")
+        finally:
+            with self._lock:
+                self._busy -= 1
+                if pending is None:
+                    self.limits.release(self._in_flight.pop(task_id, None))
+        if pending is not None:
+            # The handler runs on in the handler runtime: this thread may take another task, the group keeps its slot
+            pending.add_done_callback(lambda future: self._finish(task_id, future))
+
+    def _finish(self, task_id: int, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Task {task_id} failed: {future.exception()}")
+        with self._lock:
+            self.limits.release(self._in_flight.pop(task_id, None))
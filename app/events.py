@@ -0,0 +1,185 @@
+import asyncio
+import enum
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Iterable, List, Optional, Set, Tuple
+from .config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Types of the events of the task change feed
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+STARTED = "started"
+FINISHED = "finished"
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class TaskEvent:
+    """
+    One change of a task, as published to the change feed.
+
+    The event is serialized once, the first time it is sent, however many subscribers receive it.
+
+    Attributes:
+    - seq (int): Position of the event in the feed of this process, increasing by one.
+    - type (str): `created`, `updated`, `deleted`, `started` or `finished`.
+    - task_id (int): ID of the changed task.
+    - data (dict): The changed values, such as the whole task for `created` and `updated`.
+    """
+    __slots__ = ("seq", "type", "task_id", "data", "_encoded")
+
+    def __init__(self, seq: int, type: str, task_id: int, data: dict):
+        self.seq = seq
+        self.type = type
+        self.task_id = task_id
+        self.data = data
+        self._encoded = None
+
+    def encode(self) -> str:
+        """Returns the event as JSON: its type, task ID and data."""
+        if self._encoded is None:
+            self._encoded = json.dumps({"type": self.type, "task_id": self.task_id, **self.data}, default=_json_default)
+        return self._encoded
+
+class Subscription:
+    """
+    A reader of an `EventBus`, holding nothing but its position in the bus' ring buffer.
+
+    Use `next_events` from the event loop it was created on.
+    """
+
+    def __init__(self, bus: "EventBus", after: int):
+        self.bus = bus
+        self.after = after
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+
+    async def next_events(self, timeout: float) -> Tuple[List[TaskEvent], bool]:
+        """
+        Waits up to `timeout` seconds for events published after the position of the subscription.
+
+        Returns:
+        - Tuple[List[TaskEvent], bool]: The events, oldest first, and whether events were missed because the
+          subscriber fell behind the ring buffer. After a miss the subscription continues from the oldest event
+          still held.
+        """
+        events, missed = self.bus.read(self)
+        if events or missed:
+            return events, missed
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.bus.stop_waiting(self)
+        return self.bus.read(self)
+
+class EventBus:
+    """
+    In-process publish/subscribe of task changes, feeding `GET /api/tasks/events`.
+
+    Events are published from any thread into a ring buffer of the last `buffer_size` events. Subscribers do not
+    get a queue of their own: each one only keeps the sequence number of the last event it read, and reads the
+    following ones from the ring buffer. A slow subscriber therefore cannot hold memory; once it falls more than
+    `buffer_size` events behind, the events it missed are gone and it is told so, to resynchronize with a list
+    query. Reading at most `max_batch` events at a time bounds the work of one send.
+
+    Positions are exposed as resume tokens `<epoch>-<seq>`, where the epoch identifies this process, so a client
+    reconnecting with the token of its last event only gets the events it missed, and a token from another process
+    or an older run is recognized as a gap.
+
+    Parameters:
+    - buffer_size (int): Number of recent events held for replay and for slow subscribers.
+    - max_batch (int): Maximum number of events returned by one read.
+    """
+
+    def __init__(self, buffer_size: int = 10000, max_batch: int = 500):
+        self.buffer_size = buffer_size
+        self.max_batch = max_batch
+        self.epoch = f"{os.getpid():x}{int(datetime.now().timestamp() * 1000):x}"
+        self._buffer: List[Optional[TaskEvent]] = [None] * buffer_size
+        self._seq = 0
+        self._waiting: Set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def last_seq(self) -> int:
+        """Sequence number of the last event published."""
+        return self._seq
+
+    def token(self, seq: int) -> str:
+        """Returns the resume token of the position after the event `seq`."""
+        return f"{self.epoch}-{seq}"
+
+    def parse_token(self, token: Optional[str]) -> Optional[int]:
+        """
+        Returns the sequence number of a resume token, or None if the token does not come from this process (so the
+        events after it cannot be known) or is malformed.
+        """
+        if not token:
+            return None
+        epoch, _, seq = token.rpartition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self._seq:
+            return None
+        return int(seq)
+
+    def publish(self, type: str, task_id: int, data: dict):
+        """Publishes one event. Safe to call from any thread, cheap when nobody listens."""
+        self.publish_many([(type, task_id, data)])
+
+    def publish_many(self, events: Iterable[Tuple[str, int, dict]]):
+        """Publishes several events under a single lock acquisition and a single wakeup of the subscribers."""
+        with self._lock:
+            for type, task_id, data in events:
+                self._seq += 1
+                self._buffer[self._seq % self.buffer_size] = TaskEvent(self._seq, type, task_id, data)
+            waiting, self._waiting = self._waiting, set()
+        for subscription in waiting:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.wakeup.set)
+            except RuntimeError:
+                # The subscriber's event loop is closed
+                pass
+
+    def subscribe(self, after: Optional[int] = None) -> Subscription:
+        """
+        Creates a subscription reading the events published after `after`, or only new events if None. Call it
+        from the event loop that reads the subscription.
+        """
+        return Subscription(self, self._seq if after is None else after)
+
+    def read(self, subscription: Subscription) -> Tuple[List[TaskEvent], bool]:
+        """
+        Returns the next events of `subscription` and advances it, registering it for a wakeup when there are none.
+        See `Subscription.next_events`.
+        """
+        with self._lock:
+            last = self._seq
+            oldest = max(last - self.buffer_size + 1, 1)
+            missed = subscription.after + 1 < oldest
+            if missed:
+                subscription.after = oldest - 1
+            end = min(last, subscription.after + self.max_batch)
+            events = [self._buffer[seq % self.buffer_size] for seq in range(subscription.after + 1, end + 1)]
+            subscription.after = end
+            if not events:
+                subscription.wakeup.clear()
+                self._waiting.add(subscription)
+        return events, missed
+
+    def stop_waiting(self, subscription: Subscription):
+        """Unregisters a subscription that stopped waiting, e.g. because its client disconnected."""
+        with self._lock:
+            self._waiting.discard(subscription)
+
+task_events = EventBus(settings.event_buffer_size)
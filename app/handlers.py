@@ -0,0 +1,232 @@
+import asyncio
+import enum
+import hashlib
+import json
+import multiprocessing
+import random
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, NamedTuple, Optional
+import httpx
+import orjson
+from .config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# What a task does when it has no handler, as before handlers existed
+DEFAULT_HANDLER = "simulate"
+
+class ExecutionClass(enum.Enum):
+    """Where a handler runs. See `HandlerRuntime`."""
+    THREAD = 'thread'
+    CPU = 'cpu'
+    IO = 'io'
+
+class Handler(NamedTuple):
+    """
+    A registered task handler.
+
+    Attributes:
+    - name (str): Name referenced by `models.Task.handler`.
+    - function (Callable[[Any], Any]): Called with the decoded payload of the task. For CPU-bound handlers it must
+      be a module-level function, since it is sent to a worker process; for I/O-bound handlers it must be a
+      coroutine function.
+    - execution (ExecutionClass): Where the handler runs.
+    """
+    name: str
+    function: Callable[[Any], Any]
+    execution: ExecutionClass
+
+HANDLERS: Dict[str, Handler] = {}
+
+def handler(name: str, execution: ExecutionClass = ExecutionClass.THREAD) -> Callable:
+    """
+    Decorator registering a function as the task handler `name`.
+
+    Example usage:
+    ```python
+    @handler("monthly_report", ExecutionClass.CPU)
+    def monthly_report(payload):
+        ...
+    ```
+    """
+    def decorator(function):
+        if execution == ExecutionClass.IO and not asyncio.iscoroutinefunction(function):
+            raise TypeError(f"I/O-bound handler {name} must be a coroutine function")
+        HANDLERS[name] = Handler(name, function, execution)
+        return function
+    return decorator
+
+def get_handler(name: Optional[str]) -> Handler:
+    """
+    Returns the handler registered under `name`, or the default handler when `name` is None.
+
+    Raises:
+    - KeyError: If no handler is registered under `name`.
+    """
+    return HANDLERS[name or DEFAULT_HANDLER]
+
+def encode_payload(payload: Any) -> Optional[str]:
+    """Serializes a payload for `models.Task.payload`. Keys are sorted so that equal payloads are stored as the same text."""
+    if payload is None:
+        return None
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"))
+
+def decode_payload(payload: Optional[str]) -> Any:
+    """
+    Parses a payload stored by `encode_payload` into new objects, which the handler is free to modify.
+
+    orjson parses it several times faster than `json`; integers beyond 64 bits, which it rejects, fall back to `json`.
+    """
+    if payload is None:
+        return None
+    try:
+        return orjson.loads(payload)
+    except orjson.JSONDecodeError:
+        return json.loads(payload)
+
+class HandlerRuntime:
+    """
+    Runs handlers according to their execution class, on behalf of `task_executor.execute_task`. It owns the only
+    process pool and event loop of the application.
+
+    - `THREAD` handlers run in the calling worker thread.
+    - `CPU` handlers run in a process pool of `process_pool_size` processes (one per core by default), so that they
+      are not serialized by the GIL. The payload is pickled to the worker process. The processes are started by a
+      `forkserver` (`spawn` where it is unavailable), never forked from this process: a fork would copy the locks
+      held by its other threads, the scheduler's, the database pools' and the event loop's, and could deadlock.
+    - `IO` handlers run as coroutines on an event loop owned by the runtime.
+
+    `submit` hands a CPU or I/O handler over and returns the future of its outcome, so the worker thread can start
+    another task while it runs instead of waiting for it. At most `process_pool_size` CPU-bound and `max_coroutines`
+    I/O-bound handlers are in progress at a time: beyond that `submit` blocks the worker until one finishes, which
+    bounds the executions in progress and holds back the dispatch of further tasks. The pool and the loop are
+    created on first use.
+
+    Parameters:
+    - process_pool_size (int): Processes running CPU-bound handlers.
+    - max_coroutines (int): I/O-bound handlers running concurrently.
+    """
+
+    def __init__(self, process_pool_size: int, max_coroutines: int):
+        self.process_pool_size = process_pool_size
+        self.max_coroutines = max_coroutines
+        self._slots = {
+            ExecutionClass.CPU: threading.BoundedSemaphore(process_pool_size),
+            ExecutionClass.IO: threading.BoundedSemaphore(max_coroutines),
+        }
+        self._running = {ExecutionClass.CPU: 0, ExecutionClass.IO: 0}
+        self._process_pool = None
+        self._loop = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def running(self, execution: ExecutionClass) -> int:
+        """Number of handlers of the `CPU` or `IO` execution class in progress."""
+        return self._running[execution]
+
+    def offloaded(self, handler: Handler) -> bool:
+        """Returns True if `handler` runs outside of the worker thread, and must be started with `submit`."""
+        return handler.execution != ExecutionClass.THREAD
+
+    def run(self, handler: Handler, payload: Any) -> Any:
+        """Runs `handler` with `payload` and returns its result, raising what the handler raised."""
+        if not self.offloaded(handler):
+            return handler.function(payload)
+        return self.submit(handler, payload).result()
+
+    def submit(self, handler: Handler, payload: Any) -> Future:
+        """
+        Starts a `CPU` or `IO` handler with `payload`, waiting while its execution class is at capacity.
+
+        Returns:
+        - Future: Resolved with the result of the handler, or with what it raised.
+        """
+        slots = self._slots[handler.execution]
+        slots.acquire()
+        try:
+            if handler.execution == ExecutionClass.CPU:
+                future = self._get_process_pool().submit(handler.function, payload)
+            else:
+                future = asyncio.run_coroutine_threadsafe(handler.function(payload), self._get_loop())
+        except BaseException:
+            slots.release()
+            raise
+        with self._lock:
+            self._running[handler.execution] += 1
+        future.add_done_callback(lambda _: self._done(handler.execution))
+        return future
+
+    def shutdown(self, timeout: float = 30.0):
+        """
+        Waits up to `timeout` seconds for the handlers in progress, so that their outcome is recorded, then stops the
+        process pool and the event loop, if they were started.
+        """
+        with self._idle:
+            if not self._idle.wait_for(lambda: not any(self._running.values()), timeout):
+                logger.warning(f"Stopping with handlers still running: {self._running[ExecutionClass.CPU]} CPU-bound, "
+                               f"{self._running[ExecutionClass.IO]} I/O-bound.")
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=True)
+                self._process_pool = None
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+
+    def _done(self, execution: ExecutionClass):
+        with self._idle:
+            self._running[execution] -= 1
+            self._idle.notify_all()
+        self._slots[execution].release()
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._process_pool is None:
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                context = multiprocessing.get_context(method)
+                if method == "forkserver":
+                    # Each worker starts from a server that already imported the handlers
+                    context.set_forkserver_preload(["app.handlers"])
+                self._process_pool = ProcessPoolExecutor(max_workers=self.process_pool_size, mp_context=context)
+            return self._process_pool
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="handler-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+handler_runtime = HandlerRuntime(settings.scheduler_process_pool_size, settings.scheduler_asyncio_pool_size)
+
+@handler("simulate")
+def simulate(payload: Any):
+    """Simulates work by sleeping for a random number of seconds (1 to 10)."""
+    sleep_time = random.randint(1, 10)
+    logger.info(f"Simulating work for {sleep_time} seconds.")
+    time.sleep(sleep_time)
+
+@handler("checksum", ExecutionClass.CPU)
+def checksum(payload: dict) -> str:
+    """
+    CPU-bound example: hashes `payload["size"]` bytes (1 MB by default) `payload["rounds"]` times (100 by default).
+    """
+    payload = payload or {}
+    data = bytes(payload.get("size", 1_000_000))
+    digest = b""
+    for _ in range(payload.get("rounds", 100)):
+        digest = hashlib.sha256(digest + data).digest()
+    return digest.hex()
+
+@handler("http_request", ExecutionClass.IO)
+async def http_request(payload: dict) -> int:
+    """
+    I/O-bound example: sends `payload["method"]` (GET by default) to `payload["url"]` and fails on an error status.
+    """
+    async with httpx.AsyncClient(timeout=payload.get("timeout", 30)) as client:
+        response = await client.request(payload.get("method", "GET"), payload["url"], json=payload.get("json"))
+        response.raise_for_status()
+        return response.status_code
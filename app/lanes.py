@@ -0,0 +1,303 @@
+import heapq
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from .config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """
+    A token bucket holding up to `burst` tokens and refilled with `rate` tokens per second.
+
+    Parameters:
+    - rate (float): Tokens added per second.
+    - burst (int): Capacity of the bucket, i.e. how many executions may start back to back.
+    """
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Returns 0 if a token is available, or the seconds until one is."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        """Consumes a token. Only call it after `wait_time` returned 0."""
+        self.tokens -= 1
+
+class GroupLimits:
+    """
+    Per-group concurrency caps and rate limits applied by both dispatch modes, so that the tasks of one group
+    (a tenant, or the tasks calling one downstream system) cannot take every worker nor exceed a rate.
+
+    Every group, including tasks without a group (`None`), gets the default limits unless `overrides` gives it its
+    own. Limits apply to the executions started by this process, i.e. per replica. Not thread-safe: callers hold
+    their own lock.
+
+    Parameters:
+    - concurrency (Optional[int]): Default maximum of executions of a group running at the same time. None means
+      no limit.
+    - rate (Optional[float]): Default maximum of executions of a group started per second. None means no limit.
+    - burst (int): Default number of executions of a group that may start back to back within the rate.
+    - overrides (Dict[str, dict]): Limits of specific groups, by group name, with `concurrency`, `rate` and `burst`
+      keys replacing the defaults.
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, rate: Optional[float] = None, burst: int = 1,
+                 overrides: Optional[Dict[str, dict]] = None):
+        self.defaults = {"concurrency": concurrency, "rate": rate, "burst": burst}
+        self.overrides = overrides or {}
+        self._running: Dict[Optional[str], int] = {}
+        self._buckets: Dict[Optional[str], Optional[TokenBucket]] = {}
+
+    def _limits(self, group: Optional[str]) -> dict:
+        overrides = self.overrides.get(group)
+        return {**self.defaults, **overrides} if overrides else self.defaults
+
+    def _bucket(self, group: Optional[str]) -> Optional[TokenBucket]:
+        if group not in self._buckets:
+            limits = self._limits(group)
+            self._buckets[group] = TokenBucket(limits["rate"], limits["burst"]) if limits["rate"] else None
+        return self._buckets[group]
+
+    def wait_time(self, group: Optional[str], now: float) -> float:
+        """
+        Returns 0 if an execution of `group` may start now, `math.inf` if the group is at its concurrency cap (until
+        one of its executions finishes), or the seconds until its rate limit allows one.
+        """
+        concurrency = self._limits(group)["concurrency"]
+        if concurrency is not None and self._running.get(group, 0) >= concurrency:
+            return math.inf
+        bucket = self._bucket(group)
+        return bucket.wait_time(now) if bucket else 0.0
+
+    def acquire(self, group: Optional[str], now: float) -> float:
+        """Like `wait_time`, and records the start of an execution of `group` when it returns 0."""
+        wait = self.wait_time(group, now)
+        if wait == 0:
+            self._running[group] = self._running.get(group, 0) + 1
+            bucket = self._bucket(group)
+            if bucket:
+                bucket.take()
+        return wait
+
+    def release(self, group: Optional[str]):
+        """Records the end of an execution of `group`."""
+        running = self._running.get(group, 0) - 1
+        if running > 0:
+            self._running[group] = running
+        else:
+            self._running.pop(group, None)
+
+    def blocked_groups(self, now: float) -> List[Optional[str]]:
+        """Returns the groups seen so far that may not start an execution now."""
+        groups = set(self._running) | set(self._buckets)
+        return [group for group in groups if self.wait_time(group, now) > 0]
+
+class PriorityLanes:
+    """
+    The queue of due tasks in scheduler mode, handing them to the workers by priority under `GroupLimits`.
+
+    Due tasks are `offer`ed by ID. A dispatcher thread loads their priority and group in batches, then starts the
+    highest-priority admissible task whenever fewer than `max_in_flight` hold a worker:
+
+    - Each group has a heap of its due tasks, ordered by priority and then by arrival.
+    - A ready heap holds each admissible group once, keyed by the priority of its first task and by the round in
+      which it was queued, so groups of equal priority take turns (round-robin) instead of a noisy group starving
+      the others.
+    - A group at its concurrency cap is parked until one of its executions is `release`d; a rate-limited group is
+      parked in a heap of wake-up times. Parked groups are never looked at, however many tasks they hold.
+
+    Every operation is O(log n) in the number of queued tasks. Stale entries of the ready heap are skipped lazily.
+
+    Parameters:
+    - limits (GroupLimits): Concurrency caps and rate limits of the groups.
+    - max_in_flight (int): Maximum number of tasks started and holding a worker.
+    - load (Callable[[List[int]], Iterable[Tuple[int, int, Optional[str]]]]): Returns the `(id, priority, group)` of
+      the given task IDs. Tasks it does not return (e.g. deleted ones) are dropped.
+    - submit (Callable[[int, Optional[str]], None]): Starts the execution of a task. `release(group)` must be called
+      once it finishes, or `free_worker()` once it no longer holds a worker (its handler runs on elsewhere) and
+      `release(group, worker=False)` once it finishes.
+    """
+
+    def __init__(self, limits: GroupLimits, max_in_flight: int, load: Callable, submit: Callable):
+        self.limits = limits
+        self.max_in_flight = max_in_flight
+        self.load = load
+        self.submit = submit
+        self.in_flight = 0
+        self._incoming: List[int] = []
+        self._queues: Dict[Optional[str], list] = {}
+        self._ready: list = []
+        self._ready_keys: Dict[Optional[str], Tuple[int, int]] = {}
+        self._capped: Set[Optional[str]] = set()
+        self._rate_limited: list = []
+        self._rate_limited_groups: Set[Optional[str]] = set()
+        self._seq = 0
+        self._round = 0
+        self._size = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def __len__(self) -> int:
+        """Number of due tasks waiting to start."""
+        return self._size + len(self._incoming)
+
+    def offer(self, task_id: int):
+        """Queues a due task. Cheap enough to be called from the timer and scheduler threads."""
+        with self._condition:
+            self._incoming.append(task_id)
+            if len(self._incoming) == 1:
+                self._condition.notify()
+
+    def free_worker(self):
+        """Records that an execution started by `submit` no longer holds a worker, while its group's slot is kept."""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def release(self, group: Optional[str], worker: bool = True):
+        """Records the end of an execution started by `submit`, which still holds a worker unless `worker` is False."""
+        with self._condition:
+            if worker:
+                self.in_flight -= 1
+            self.limits.release(group)
+            if group in self._capped:
+                self._capped.discard(group)
+                if group in self._queues:
+                    self._make_ready(group)
+            self._condition.notify()
+
+    def start(self):
+        """Starts the dispatcher thread."""
+        with self._condition:
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="priority-lanes", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the dispatcher thread. Queued tasks are dropped; they are still pending in the database."""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread:
+            self._thread.join()
+
+    def push(self, task_id: int, priority: int, group: Optional[str]):
+        """Adds a due task whose priority and group are known. The caller holds the condition."""
+        self._seq += 1
+        self._size += 1
+        queue = self._queues.setdefault(group, [])
+        entry = (-priority, self._seq, task_id)
+        heapq.heappush(queue, entry)
+        if group in self._capped or group in self._rate_limited_groups:
+            return
+        key = self._ready_keys.get(group)
+        # A new group, or a task jumping ahead of the queued ones of its group
+        if key is None or entry[0] < key[0]:
+            self._make_ready(group)
+
+    def pop(self, now: float) -> Optional[Tuple[int, Optional[str]]]:
+        """
+        Takes the highest-priority task whose group is admissible, recording its start in `limits`.
+        The caller holds the condition.
+        """
+        while self._rate_limited and self._rate_limited[0][0] <= now:
+            _, _, group = heapq.heappop(self._rate_limited)
+            self._rate_limited_groups.discard(group)
+            self._make_ready(group)
+        while self._ready:
+            neg_priority, round_, group = heapq.heappop(self._ready)
+            if self._ready_keys.get(group) != (neg_priority, round_):
+                continue
+            del self._ready_keys[group]
+            wait = self.limits.acquire(group, now)
+            if wait == math.inf:
+                self._capped.add(group)
+                continue
+            if wait > 0:
+                self._round += 1
+                heapq.heappush(self._rate_limited, (now + wait, self._round, group))
+                self._rate_limited_groups.add(group)
+                continue
+            queue = self._queues[group]
+            _, _, task_id = heapq.heappop(queue)
+            self._size -= 1
+            if queue:
+                self._make_ready(group)
+            else:
+                del self._queues[group]
+            return task_id, group
+        return None
+
+    def _make_ready(self, group: Optional[str]):
+        self._round += 1
+        key = (self._queues[group][0][0], self._round)
+        self._ready_keys[group] = key
+        heapq.heappush(self._ready, (*key, group))
+
+    def _load_incoming(self):
+        with self._condition:
+            task_ids, self._incoming = self._incoming, []
+        try:
+            rows = list(self.load(task_ids))
+        except Exception as e:
+            logger.error(f"Failed to load the priorities of {len(task_ids)} due tasks, retrying: {e}")
+            with self._condition:
+                self._incoming[:0] = task_ids
+                self._condition.wait(1.0)
+            return
+        with self._condition:
+            for task_id, priority, group in rows:
+                self.push(task_id, priority or 0, group)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._running:
+                    return
+                has_incoming = bool(self._incoming)
+            # The priorities are read without holding the condition
+            if has_incoming:
+                self._load_incoming()
+            started = []
+            with self._condition:
+                now = time.monotonic()
+                while self.in_flight < self.max_in_flight:
+                    item = self.pop(now)
+                    if item is None:
+                        break
+                    self.in_flight += 1
+                    started.append(item)
+                if not started and not self._incoming and self._running:
+                    timeout = None
+                    if self._rate_limited and self.in_flight < self.max_in_flight:
+                        timeout = max(self._rate_limited[0][0] - now, 0)
+                    self._condition.wait(timeout)
+            for task_id, group in started:
+                try:
+                    self.submit(task_id, group)
+                except Exception as e:
+                    logger.error(f"Failed to start task {task_id}: {e}")
+                    self.release(group)
+
+def build_group_limits() -> GroupLimits:
+    """Builds the group limits configured by the `dispatch_group_*` settings."""
+    return GroupLimits(settings.dispatch_group_concurrency, settings.dispatch_group_rate, settings.dispatch_group_burst,
+                       settings.dispatch_group_limits)
+
+group_limits = build_group_limits()
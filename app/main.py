@@ -1,10 +1,19 @@
-from fastapi import FastAPI, Depends, HTTPException, Response
-from sqlalchemy.orm import Session
-from .database import SessionLocal
-from . import crud, models, task_executor, schemas
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.date import DateTrigger
-from datetime import datetime
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from .cache import task_cache
+from .database import get_async_engine, get_engine, is_sqlite
+from .metrics import MetricsMiddleware, register_runtime_collector
+from .profiling import ProfilingMiddleware, allocations, profiler
+from .handlers import handler_runtime
+from .result_writer import result_writer
+from .retention import run_retention
+from . import models
+from .config import settings
+from .dispatcher import TaskDispatcher
+from .lanes import group_limits
+from .misfire import catch_up
+from .scheduler import scheduler, start_lease_maintenance, task_lanes, timer_engine, window_loader
+from app.routes.admin_router import router as admin_router
 from app.routes.task_router import router as task_router
 import uvicorn
 import logging
@@ -14,32 +23,44 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Task Scheduler API!", version="0.1")
-scheduler = BackgroundScheduler()
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def schedule_task_execution(task_id: int, run_date: datetime):
-    if run_date <= datetime.now():
-        logger.warning(f"Task {task_id} scheduled time is in the past. Running immediately.")
-    scheduler.add_job(task_executor.execute_task, trigger=DateTrigger(run_date=run_date), args=[task_id], misfire_grace_time=15)
+dispatcher = TaskDispatcher(
+    worker_id=settings.worker_id,
+    batch_size=settings.dispatch_batch_size,
+    poll_interval=settings.dispatch_poll_interval,
+    lease_seconds=settings.dispatch_lease_seconds,
+    max_workers=settings.dispatch_workers,
+    limits=group_limits,
+    catch_up=catch_up,
+)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
+register_runtime_collector(scheduler, timer_engine, dispatcher,
+                           engines={"executor": get_engine, "api": lambda: get_async_engine().sync_engine}, cache=task_cache,
+                           handler_runtime=handler_runtime)
 
 @app.on_event("startup")
 def start_scheduler():
+    if is_sqlite():
+        # An embedded database has no init-db.sql run before the application
+        models.init_schema()
+    result_writer.start()
+    run_retention.start()
+    if settings.dispatch_mode == "queue":
+        # Due tasks are claimed from the database, nothing needs to be loaded into the scheduler
+        logger.info("Starting task dispatcher in queue mode...")
+        dispatcher.start()
+        return
     logger.info("Starting scheduler and loading tasks...")
     try:
         scheduler.start()
-        db = next(get_db())
-        tasks = crud.get_tasks(db=db)
-        for task in tasks:
-            if task.scheduled_time >= datetime.now():
-                schedule_task_execution(task.id, task.scheduled_time)
-        db.close()
-        logger.info(f"Scheduled tasks for execution: {len(tasks)}")
+        task_lanes.start()
+        if settings.timer_engine == "native":
+            timer_engine.start()
+        count = window_loader.start(refill_interval=settings.rehydration_refill_interval)
+        logger.info(f"Scheduled tasks for execution: {count}")
+        reclaimed = start_lease_maintenance()
+        if reclaimed:
+            logger.info(f"Rescheduled {reclaimed} tasks left running by a previous run.")
     except Exception as e:
         logger.error(f"Error during scheduler startup: {e}")
 
@@ -47,15 +68,34 @@ def start_scheduler():
 def shutdown_scheduler():
     logger.info("Shutting down scheduler...")
     try:
-        scheduler.shutdown()
+        if settings.dispatch_mode == "queue":
+            dispatcher.stop()
+        else:
+            if settings.timer_engine == "native":
+                timer_engine.stop()
+            task_lanes.stop()
+            scheduler.shutdown()
     except Exception as e:
         logger.error(f"Error during scheduler shutdown: {e}")
+    handler_runtime.shutdown()
+    run_retention.stop()
+    profiler.stop()
+    if allocations.active:
+        allocations.stop()
+    # Executions finished by now have their results written before exiting
+    result_writer.stop()
 
 app.include_router(task_router, prefix="/api", tags=["Tasks"])
+app.include_router(admin_router, prefix="/api/admin", tags=["Admin"])
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Task Scheduler API!"}
 
+@app.get("/metrics")
+def metrics():
+    """Exposes the application metrics in Prometheus text format."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
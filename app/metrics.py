@@ -0,0 +1,148 @@
+import time
+from functools import wraps
+from typing import Callable, Dict
+from prometheus_client import Counter, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from .handlers import ExecutionClass
+from .profiling import profiler
+
+# Metrics of the application, exposed in Prometheus text format by `GET /metrics`.
+#
+# Hot paths only pay for a `perf_counter` call and a histogram observation on a pre-labelled child. Gauges of live
+# state (scheduler jobs, busy workers, connection pools, cache counters) are read by collectors at scrape time.
+
+DISPATCH_LAG = Histogram(
+    "task_dispatch_lag_seconds", "Delay between the scheduled time of a task and the start of its execution.",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+RUN_DURATION = Histogram(
+    "task_run_duration_seconds", "Duration of task executions.", ["status"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900),
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Duration of the database operations in `crud`.", ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests.", ["method", "route", "status"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10),
+)
+TASKS_SCHEDULED = Counter(
+    "tasks_scheduled_total", "Tasks passed to `schedule_task_execution`, by where they were put.", ["target"],
+)
+TASKS_MISFIRED = Counter(
+    "tasks_misfired_total", "Occurrences that started later than the misfire grace time, by misfire policy.", ["policy"],
+)
+
+def observe_db(operation: str) -> Callable:
+    """
+    Decorator recording the duration of a `crud` function in `db_query_duration_seconds`, and in the trace of the
+    current execution while profiling.
+    """
+    histogram = DB_QUERY_DURATION.labels(operation)
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                histogram.observe(elapsed)
+                if profiler.active:
+                    profiler.add_db_time(elapsed)
+        return wrapper
+    return decorator
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency of every HTTP request in `http_request_duration_seconds`.
+
+    Requests are labelled with the path template of the matched route (e.g. `/api/tasks/{task_id}`), so that the
+    number of series does not grow with the IDs requested.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_DURATION.labels(scope["method"], getattr(route, "path", "unmatched"), str(status)).observe(
+                time.perf_counter() - start)
+
+class RuntimeCollector:
+    """
+    Collects gauges of the scheduler, timer engine, dispatcher, handler runtime, connection pools and task cache
+    when scraped.
+
+    Parameters:
+    - scheduler (TaskScheduler): The application's scheduler.
+    - timer_engine (TimerEngine): The native timer engine.
+    - dispatcher (TaskDispatcher): The queue mode dispatcher.
+    - engines (Dict[str, Callable[[], Engine]]): Functions returning the sync engines whose connection pools are
+      reported, by pool name.
+    - cache (TaskCache): The task lookup cache.
+    - handler_runtime (HandlerRuntime, optional): The runtime of CPU-bound and I/O-bound handlers, whose handlers in
+      progress are reported as the `handler-cpu` and `handler-io` executors.
+    """
+
+    def __init__(self, scheduler, timer_engine, dispatcher, engines: Dict[str, Callable], cache, handler_runtime=None):
+        self.scheduler = scheduler
+        self.timer_engine = timer_engine
+        self.dispatcher = dispatcher
+        self.engines = engines
+        self.cache = cache
+        self.handler_runtime = handler_runtime
+
+    def collect(self):
+        pending = GaugeMetricFamily("scheduler_pending_jobs", "Tasks waiting to come due in this process.", labels=["store"])
+        pending.add_metric(["apscheduler"], self.scheduler.task_jobs)
+        pending.add_metric(["timer_engine"], len(self.timer_engine))
+        yield pending
+
+        busy = GaugeMetricFamily("executor_busy_workers", "Workers executing a job.", labels=["executor"])
+        for alias, executor in self.scheduler._executors.items():
+            if hasattr(executor, "busy_workers"):
+                busy.add_metric([alias], executor.busy_workers)
+        busy.add_metric(["dispatcher"], self.dispatcher.busy_workers)
+        if self.handler_runtime is not None:
+            for execution in (ExecutionClass.CPU, ExecutionClass.IO):
+                busy.add_metric([f"handler-{execution.value}"], self.handler_runtime.running(execution))
+        yield busy
+
+        checked_out = GaugeMetricFamily("db_pool_checked_out_connections", "Connections checked out of the pool.", labels=["pool"])
+        size = GaugeMetricFamily("db_pool_size", "Configured size of the connection pool.", labels=["pool"])
+        for name, get_engine in self.engines.items():
+            pool = get_engine().pool
+            if hasattr(pool, "checkedout"):
+                checked_out.add_metric([name], pool.checkedout())
+            if hasattr(pool, "size"):
+                size.add_metric([name], pool.size())
+        yield checked_out
+        yield size
+
+        stats = self.cache.stats()
+        for name in ("hits", "misses", "evictions"):
+            counter = CounterMetricFamily(f"task_cache_{name}", f"Task cache {name}.")
+            counter.add_metric([], stats[name])
+            yield counter
+
+def register_runtime_collector(scheduler, timer_engine, dispatcher, engines: Dict[str, Callable], cache, handler_runtime=None):
+    """Registers a `RuntimeCollector` with the default registry, read by `GET /metrics`."""
+    REGISTRY.register(RuntimeCollector(scheduler, timer_engine, dispatcher, engines, cache, handler_runtime))
@@ -0,0 +1,107 @@
+import math
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from .config import settings
+from .lanes import TokenBucket
+from .models import MisfirePolicy
+
+class CatchUp:
+    """
+    Decides when an occurrence misfired, and paces the catch-up of the occurrences that did.
+
+    An occurrence misfires when it starts more than `grace_seconds` after its scheduled time, for example after a
+    restart, an outage or while the workers were saturated. The misfire policy of its task (`default_policy` when
+    the task has none) then applies when it executes:
+
+    - `RUN_ALL`: the occurrence runs, and a recurring task replays every occurrence it missed, one after the other.
+    - `COALESCE`: the occurrence runs once, and a recurring task moves on to its next occurrence after now.
+    - `SKIP`: the occurrence does not run. It is recorded as a skipped run, and a recurring task moves on to its next
+      occurrence after now.
+    - `SPREAD`: like `COALESCE`, but in scheduler mode the occurrence starts at a random time within
+      `spread_seconds`, so that the tasks missed during an outage do not all start at once.
+
+    On top of that, at most `rate` misfired occurrences start per second in this process. In scheduler mode they
+    are given start times `1 / rate` seconds apart with `defer`; in queue mode the dispatcher takes a token from a
+    bucket holding one second of starts with `acquire` before claiming one. Not thread-safe in queue mode: the
+    dispatcher holds its own lock around `can_acquire` and `acquire`.
+
+    Parameters:
+    - grace_seconds (int): Seconds an occurrence may start late without misfiring.
+    - default_policy (MisfirePolicy): Policy of the tasks without one.
+    - rate (Optional[float]): Maximum misfired occurrences started per second. None means no limit.
+    - spread_seconds (int): Window over which the misfired occurrences of `SPREAD` tasks start.
+    """
+
+    def __init__(self, grace_seconds: int = 15, default_policy: MisfirePolicy = MisfirePolicy.COALESCE,
+                 rate: Optional[float] = None, spread_seconds: int = 300):
+        self.grace = timedelta(seconds=grace_seconds)
+        self.default_policy = default_policy
+        self.rate = rate
+        self.spread_seconds = spread_seconds
+        self._bucket = TokenBucket(rate, max(1, math.ceil(rate))) if rate else None
+        # Start slots reserved by `defer`, as a union-find pointing each taken slot to a later candidate
+        self._next_free: Dict[int, int] = {}
+        self._last_slot = -1
+        self._lock = threading.Lock()
+
+    def policy_of(self, policy: Optional[MisfirePolicy]) -> MisfirePolicy:
+        """Returns the policy that applies to a task with the given `misfire_policy`."""
+        return policy or self.default_policy
+
+    def cutoff(self, now: datetime) -> datetime:
+        """Returns the scheduled time before which an occurrence starting at `now` has misfired."""
+        return now - self.grace
+
+    def is_misfired(self, scheduled_time: datetime, now: datetime) -> bool:
+        """Returns True if an occurrence scheduled at `scheduled_time` misfires when it starts at `now`."""
+        return scheduled_time < now - self.grace
+
+    def defer(self, now: datetime, policy: MisfirePolicy) -> datetime:
+        """
+        Returns when a misfired occurrence should start in scheduler mode: at a random time within the spread
+        window for `SPREAD` tasks, right away otherwise, and then at the first start slot left under `rate`.
+        """
+        run_at = now
+        if policy == MisfirePolicy.SPREAD and self.spread_seconds > 0:
+            run_at += timedelta(seconds=random.uniform(0, self.spread_seconds))
+        if not self.rate:
+            return run_at
+        with self._lock:
+            slot = math.ceil(run_at.timestamp() * self.rate)
+            if self._last_slot < math.floor(now.timestamp() * self.rate):
+                # Every reserved slot has passed
+                self._next_free.clear()
+            slot = self._find(slot)
+            self._next_free[slot] = slot + 1
+            self._last_slot = max(self._last_slot, slot)
+        return datetime.fromtimestamp(slot / self.rate)
+
+    def _find(self, slot: int) -> int:
+        root = slot
+        while root in self._next_free:
+            root = self._next_free[root]
+        # Path compression, so that a long run of taken slots is crossed once
+        while slot != root:
+            self._next_free[slot], slot = root, self._next_free[slot]
+        return root
+
+    def can_acquire(self, now: float) -> bool:
+        """Returns True if a misfired occurrence may start at the monotonic time `now` in queue mode."""
+        return self._bucket is None or self._bucket.wait_time(now) == 0
+
+    def acquire(self, now: float) -> bool:
+        """Records the start of a misfired occurrence in queue mode, if `can_acquire`. Returns whether it may start."""
+        if not self.can_acquire(now):
+            return False
+        if self._bucket:
+            self._bucket.take()
+        return True
+
+def build_catch_up() -> CatchUp:
+    """Builds the misfire handling configured by the `misfire_*` settings."""
+    return CatchUp(settings.misfire_grace_time, MisfirePolicy(settings.misfire_policy), settings.misfire_catchup_rate,
+                   settings.misfire_spread_seconds)
+
+catch_up = build_catch_up()
@@ -0,0 +1,456 @@
+import cProfile
+import enum
+import io
+import marshal
+import os
+import pstats
+import random
+import site
+import sys
+import sysconfig
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# On-demand profiling of API requests and task executions, driven by the `/api/admin/profiling` endpoints.
+#
+# Nothing is measured until a profiling window is started: the hooks in `ProfilingMiddleware`, `profile_execution`,
+# `metrics.observe_db` and `Profiler.span` only read `profiler.active` and return.
+
+class ProfilingMode(str, enum.Enum):
+    """How a profiling window measures requests and executions."""
+    CPROFILE = "cprofile"
+    SAMPLING = "sampling"
+
+class ExecutionTrace:
+    """
+    Timings of one task execution, recorded while a profiling window with tracing is active.
+
+    Attributes:
+    - task_id (int): ID of the executed task.
+    - started_at (datetime): When the execution started.
+    - duration (float): Seconds spent in `execute_task`.
+    - spans (Dict[str, float]): Seconds spent in each part of the execution: `db` for the queries of `crud`,
+      `handler` for the handler body and `commit` for handing the outcome to the result writer.
+    - db_queries (int): Number of `crud` operations of the execution.
+    """
+    __slots__ = ("task_id", "started_at", "duration", "spans", "db_queries")
+
+    def __init__(self, task_id: int):
+        self.task_id = task_id
+        self.started_at = datetime.now()
+        self.duration = 0.0
+        self.spans: Dict[str, float] = {}
+        self.db_queries = 0
+
+    def add(self, name: str, seconds: float):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def as_dict(self) -> dict:
+        return {"task_id": self.task_id, "started_at": self.started_at, "duration": self.duration,
+                "spans": self.spans, "db_queries": self.db_queries}
+
+class _Span:
+    """Context manager adding its duration to the trace of the current execution, if it has one."""
+    __slots__ = ("profiler", "name", "trace", "start")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.trace = self.profiler.current_trace() if self.profiler.active else None
+        if self.trace is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.trace is not None:
+            self.trace.add(self.name, time.perf_counter() - self.start)
+        return False
+
+class Profiler:
+    """
+    Profiles API requests and task executions for a limited window, on demand.
+
+    A window is opened with `start` and closes by itself after `duration` seconds, or with `stop`. Its results stay
+    available until the next window starts:
+
+    - `cprofile` mode runs `cProfile` on a `sample_rate` fraction of the requests and executions. An execution is
+      profiled in its worker thread. Requests share the event loop thread, so while a sampled request is in flight
+      everything running on the loop is profiled with it. The merged statistics are exported by `pstats_dump`, in
+      the format of `pstats.Stats.dump_stats`.
+    - `sampling` mode has a thread record the stacks of the threads executing a request or a task every `interval`
+      seconds. The overhead depends on the interval, not on the code profiled. The stacks are exported by
+      `collapsed_stacks` in the collapsed format read by flame graph tools (`flamegraph.pl`, speedscope).
+
+    With `trace`, each execution also records an `ExecutionTrace` of where its time went, kept for the last
+    `trace_buffer_size` executions.
+
+    Handlers running in the process pool are not profiled, only the wait for them.
+
+    Parameters:
+    - trace_buffer_size (int): Number of execution traces kept.
+    """
+
+    def __init__(self, trace_buffer_size: int = 1000):
+        self.active = False
+        self.mode: Optional[ProfilingMode] = None
+        self.sample_rate = 1.0
+        self.interval = 0.01
+        self.tracing = False
+        self.started_at: Optional[datetime] = None
+        self.ends_at: Optional[datetime] = None
+        self.requests_profiled = 0
+        self.executions_profiled = 0
+        self._stats: Optional[pstats.Stats] = None
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._traces = deque(maxlen=trace_buffer_size)
+        self._local = threading.local()
+        # Threads currently running a request or an execution, with their label and nesting depth
+        self._scoped: Dict[int, list] = {}
+        self._loop_profile: Optional[cProfile.Profile] = None
+        self._loop_depth = 0
+        self._timer: Optional[threading.Timer] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._sampler_stopped = threading.Event()
+        self._frame_labels: Dict[object, str] = {}
+        # Prefixes stripped from file names in stack frames, longest first
+        self._source_roots = sorted({os.path.join(path, "") for path in (*site.getsitepackages(), sysconfig.get_paths()["stdlib"], os.getcwd())},
+                                    key=len, reverse=True)
+        self._lock = threading.Lock()
+
+    def start(self, mode: ProfilingMode, duration: float, sample_rate: float = 1.0, interval: float = 0.01, trace: bool = True):
+        """
+        Opens a profiling window of `duration` seconds, discarding the results of the previous one.
+
+        Raises:
+        - RuntimeError: If a window is already open.
+        """
+        with self._lock:
+            if self.active:
+                raise RuntimeError("A profiling window is already active")
+            self.mode = mode
+            self.sample_rate = sample_rate
+            self.interval = interval
+            self.tracing = trace
+            self.started_at = datetime.now()
+            self.ends_at = self.started_at + timedelta(seconds=duration)
+            self.requests_profiled = 0
+            self.executions_profiled = 0
+            self._stats = None
+            self._stacks = Counter()
+            self._samples = 0
+            self._traces.clear()
+            self._scoped.clear()
+            if mode == ProfilingMode.SAMPLING:
+                self._sampler_stopped.clear()
+                self._sampler = threading.Thread(target=self._sample, name="profiling-sampler", daemon=True)
+                self._sampler.start()
+            self._timer = threading.Timer(duration, self.stop)
+            self._timer.daemon = True
+            self._timer.start()
+            self.active = True
+        logger.info(f"Profiling started in {mode.value} mode for {duration}s.")
+
+    def stop(self):
+        """Closes the profiling window, if one is open. The requests and executions in flight are still recorded."""
+        with self._lock:
+            if not self.active:
+                return
+            self.active = False
+            self.ends_at = datetime.now()
+            if self._timer is not None and self._timer is not threading.current_thread():
+                self._timer.cancel()
+            sampler, self._sampler = self._sampler, None
+        self._sampler_stopped.set()
+        if sampler is not None:
+            sampler.join()
+        logger.info(f"Profiling stopped: {self.requests_profiled} requests and {self.executions_profiled} executions profiled.")
+
+    def status(self) -> dict:
+        """Returns the settings and counters of the current or last profiling window."""
+        return {
+            "active": self.active, "mode": self.mode, "started_at": self.started_at, "ends_at": self.ends_at,
+            "sample_rate": self.sample_rate, "interval": self.interval, "trace": self.tracing,
+            "requests_profiled": self.requests_profiled, "executions_profiled": self.executions_profiled,
+            "samples": self._samples, "traces": len(self._traces),
+        }
+
+    def _sampled(self) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def _enter_scope(self, label: str):
+        ident = threading.get_ident()
+        with self._lock:
+            scope = self._scoped.get(ident)
+            if scope is None:
+                self._scoped[ident] = [label, 1]
+            else:
+                scope[1] += 1
+
+    def _exit_scope(self):
+        ident = threading.get_ident()
+        with self._lock:
+            scope = self._scoped.get(ident)
+            if scope is not None:
+                scope[1] -= 1
+                if scope[1] <= 0:
+                    del self._scoped[ident]
+
+    def _start_profile(self) -> Optional[cProfile.Profile]:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active in this thread (or in the process, on Python 3.12+)
+            return None
+        return profile
+
+    def _add_profile(self, profile: cProfile.Profile):
+        profile.disable()
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+
+    def run_execution(self, function, task_id: int, *args, **kwargs):
+        """Runs `execute_task` under the active profiling window. See `profile_execution`."""
+        profile = None
+        sampling = self.mode == ProfilingMode.SAMPLING
+        if sampling:
+            self._enter_scope("execute_task")
+        elif self._sampled():
+            profile = self._start_profile()
+        trace = ExecutionTrace(task_id) if self.tracing else None
+        self._local.trace = trace
+        start = time.perf_counter()
+        try:
+            return function(task_id, *args, **kwargs)
+        finally:
+            self._local.trace = None
+            if profile is not None:
+                self._add_profile(profile)
+            if sampling:
+                self._exit_scope()
+            if trace is not None:
+                trace.duration = time.perf_counter() - start
+                self._traces.append(trace)
+            if sampling or profile is not None:
+                with self._lock:
+                    self.executions_profiled += 1
+
+    def enter_request(self) -> bool:
+        """Starts profiling a request on the event loop thread. Returns whether the request is profiled."""
+        if self.mode == ProfilingMode.SAMPLING:
+            self._enter_scope("request")
+            return True
+        if not self._sampled():
+            return False
+        if self._loop_depth == 0:
+            self._loop_profile = self._start_profile()
+            if self._loop_profile is None:
+                return False
+        self._loop_depth += 1
+        return True
+
+    def exit_request(self):
+        """Ends the profiling of a request started by `enter_request`."""
+        with self._lock:
+            self.requests_profiled += 1
+        if self.mode == ProfilingMode.SAMPLING:
+            self._exit_scope()
+            return
+        self._loop_depth -= 1
+        if self._loop_depth == 0 and self._loop_profile is not None:
+            self._add_profile(self._loop_profile)
+            self._loop_profile = None
+
+    def current_trace(self) -> Optional[ExecutionTrace]:
+        """Returns the trace of the execution running in this thread, if it is traced."""
+        return getattr(self._local, "trace", None)
+
+    def span(self, name: str) -> _Span:
+        """
+        Returns a context manager adding the time spent in its block to span `name` of the trace of the current
+        execution. It does nothing outside of traced executions.
+        """
+        return _Span(self, name)
+
+    def add_db_time(self, seconds: float):
+        """Adds one `crud` operation to the trace of the current execution, if it is traced."""
+        trace = self.current_trace()
+        if trace is not None:
+            trace.add("db", seconds)
+            trace.db_queries += 1
+
+    def traces(self) -> List[dict]:
+        """Returns the execution traces of the current or last window, oldest first."""
+        return [trace.as_dict() for trace in list(self._traces)]
+
+    def pstats_dump(self) -> Optional[bytes]:
+        """Returns the merged cProfile statistics in the file format of `pstats`, or None if nothing was profiled."""
+        with self._lock:
+            if self._stats is None:
+                return None
+            return marshal.dumps(self._stats.stats)
+
+    def pstats_report(self, sort: str = "cumulative", limit: int = 50) -> Optional[str]:
+        """Returns the merged cProfile statistics as the text report of `pstats`, or None if nothing was profiled."""
+        with self._lock:
+            if self._stats is None:
+                return None
+            output = io.StringIO()
+            self._stats.stream = output
+            self._stats.sort_stats(sort).print_stats(limit)
+            self._stats.stream = sys.stdout
+        return output.getvalue()
+
+    def collapsed_stacks(self) -> Optional[str]:
+        """Returns the sampled stacks in collapsed format, one `frame;frame;... count` line per stack."""
+        with self._lock:
+            if not self._stacks:
+                return None
+            return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def _frame_label(self, code) -> str:
+        label = self._frame_labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            for directory in self._source_roots:
+                if filename.startswith(directory):
+                    filename = filename[len(directory):]
+                    break
+            # `;` separates frames in collapsed stacks, the count follows the last space
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+            self._frame_labels[code] = label
+        return label
+
+    def _sample(self):
+        while not self._sampler_stopped.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                scoped = [(ident, scope[0]) for ident, scope in self._scoped.items()]
+            samples = []
+            for ident, label in scoped:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(label)
+                stack.reverse()
+                samples.append(";".join(stack))
+            del frames
+            # Walked without the lock, recorded under it so that `collapsed_stacks` and `start` see whole samples
+            with self._lock:
+                self._stacks.update(samples)
+                self._samples += len(samples)
+
+profiler = Profiler()
+
+def profile_execution(function):
+    """Decorator of `execute_task`, profiling and tracing it while a profiling window is active."""
+    @wraps(function)
+    def wrapper(task_id, *args, **kwargs):
+        if not profiler.active:
+            return function(task_id, *args, **kwargs)
+        return profiler.run_execution(function, task_id, *args, **kwargs)
+    return wrapper
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling HTTP requests while a profiling window is active."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not profiler.active or scope["type"] != "http" or scope["path"].startswith("/api/admin/"):
+            await self.app(scope, receive, send)
+            return
+        profiled = profiler.enter_request()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if profiled:
+                profiler.exit_request()
+
+class AllocationTracker:
+    """
+    Tracks memory allocations with `tracemalloc` on demand, to find what grows between two snapshots.
+
+    Tracing slows every allocation down (by about a third with the default depth), so it only runs between
+    `start` and `stop`.
+    """
+
+    def __init__(self):
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10):
+        """Starts tracing allocations with `frames` frames of traceback, and takes the baseline snapshot."""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self._previous = self._snapshot()
+
+    def stop(self):
+        """Stops tracing allocations and frees the snapshots."""
+        with self._lock:
+            self._previous = None
+            tracemalloc.stop()
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def snapshot_diff(self, limit: int = 20, key_type: str = "lineno") -> dict:
+        """
+        Takes a snapshot and compares it with the previous one (the baseline for the first call).
+
+        Parameters:
+        - limit (int): Number of allocation sites returned, largest growth first.
+        - key_type (str): `lineno` groups allocations by line, `traceback` by their whole traceback.
+
+        Returns:
+        - dict: The `current` and `peak` traced memory in bytes, and the `top` allocation sites with their
+          `size`, `count`, `size_diff` and `count_diff`.
+
+        Raises:
+        - RuntimeError: If allocations are not being traced.
+        """
+        with self._lock:
+            if not tracemalloc.is_tracing() or self._previous is None:
+                raise RuntimeError("Allocations are not being traced")
+            snapshot = self._snapshot()
+            stats = snapshot.compare_to(self._previous, key_type)
+            self._previous = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        top = []
+        for stat in stats[:limit]:
+            top.append({
+                # Frames from the oldest to the allocating one
+                "location": ";".join(f"{frame.filename}:{frame.lineno}" for frame in stat.traceback),
+                "size": stat.size, "count": stat.count, "size_diff": stat.size_diff, "count_diff": stat.count_diff,
+            })
+        return {"current": current, "peak": peak, "top": top}
+
+allocations = AllocationTracker()
@@ -0,0 +1,279 @@
+import calendar
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple
+import numpy as np
+from .models import RecurrenceFrequency
+
+# Fixed-length recurrence steps
+FIXED_STEPS = {
+    RecurrenceFrequency.DAILY: timedelta(days=1),
+    RecurrenceFrequency.WEEKLY: timedelta(weeks=1),
+    RecurrenceFrequency.BIWEEKLY: timedelta(weeks=2),
+}
+
+# Calendar recurrence steps, in months
+MONTH_STEPS = {
+    RecurrenceFrequency.MONTHLY: 1,
+    RecurrenceFrequency.QUARTERLY: 3,
+    RecurrenceFrequency.YEARLY: 12,
+}
+
+CRON_MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+MONTH_NAMES = {name.lower(): number for number, name in enumerate(calendar.month_abbr) if name}
+WEEKDAY_NAMES = {"sun": 0, "mon": 1, "tue": 2, "wed": 3, "thu": 4, "fri": 5, "sat": 6}
+
+# How far ahead a cron expression is searched before it is considered to never fire (e.g. "0 0 30 2 *")
+MAX_SEARCH_YEARS = 5
+
+def add_months(value: datetime, months: int, day: Optional[int] = None) -> datetime:
+    """
+    Adds a number of calendar months to a datetime, keeping the time of day and the day of month, or moving to
+    `day` if given.
+
+    The day is clamped to the last day of shorter months, e.g. January 31 plus one month is February 28 (or 29).
+    Pass the anchor day of a recurring task as `day` so that the clamping does not carry over: February 28 plus one
+    month with `day=31` is March 31.
+    """
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(day or value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+def _parse_field(field: str, low: int, high: int, names: dict = None) -> Tuple[int, ...]:
+    values = set()
+    for part in field.lower().split(","):
+        range_part, _, step_part = part.partition("/")
+        step = int(step_part) if step_part else 1
+        if step < 1:
+            raise ValueError(f"Invalid step in cron field: {field}")
+        if range_part == "*":
+            start, end = low, high
+        else:
+            start_text, _, end_text = range_part.partition("-")
+            start = names[start_text] if names and start_text in names else int(start_text)
+            if end_text:
+                end = names[end_text] if names and end_text in names else int(end_text)
+            else:
+                end = high if step_part else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"Cron field out of range: {field}")
+        values.update(range(start, end + 1, step))
+    return tuple(sorted(values))
+
+class CronSchedule:
+    """
+    A cron expression compiled into sorted tuples of allowed values, one per field.
+
+    Supports the five standard fields (minute, hour, day of month, month, day of week), `*`, lists, ranges,
+    steps, month and weekday names, and the `@daily`-style macros. As in Vixie cron, when both the day of month
+    and the day of week are restricted, a day matching either of them matches.
+
+    Use `compile_cron` rather than this constructor so that expressions are only parsed once.
+    """
+    __slots__ = ("expression", "minutes", "hours", "days", "months", "weekdays", "_any_day", "_any_weekday")
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = CRON_MACROS.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: {expression}")
+        minute, hour, day, month, weekday = fields
+        self.minutes = _parse_field(minute, 0, 59)
+        self.hours = _parse_field(hour, 0, 23)
+        self.days = _parse_field(day, 1, 31)
+        self.months = _parse_field(month, 1, 12, MONTH_NAMES)
+        # Both 0 and 7 mean Sunday
+        self.weekdays = tuple(sorted({value % 7 for value in _parse_field(weekday, 0, 7, WEEKDAY_NAMES)}))
+        self._any_day = day.startswith("*")
+        self._any_weekday = weekday.startswith("*")
+
+    def _day_matches(self, value: datetime) -> bool:
+        day_match = value.day in self.days
+        weekday_match = (value.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_match and weekday_match
+        return day_match or weekday_match
+
+    def next_after(self, after: datetime) -> datetime:
+        """
+        Returns the first time strictly after `after` matching the expression, at minute resolution.
+
+        Raises:
+        - ValueError: If the expression does not fire within the next few years.
+        """
+        value = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        last_year = value.year + MAX_SEARCH_YEARS
+        while value.year <= last_year:
+            if value.month not in self.months:
+                index = bisect_left(self.months, value.month)
+                if index < len(self.months):
+                    value = value.replace(month=self.months[index], day=1, hour=0, minute=0)
+                else:
+                    value = value.replace(year=value.year + 1, month=self.months[0], day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(value):
+                value = value.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if value.hour not in self.hours:
+                index = bisect_left(self.hours, value.hour)
+                if index < len(self.hours):
+                    value = value.replace(hour=self.hours[index], minute=0)
+                else:
+                    value = value.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if value.minute not in self.minutes:
+                index = bisect_left(self.minutes, value.minute)
+                if index < len(self.minutes):
+                    value = value.replace(minute=self.minutes[index])
+                else:
+                    value = value.replace(minute=0) + timedelta(hours=1)
+                continue
+            return value
+        raise ValueError(f"Cron expression never fires: {self.expression}")
+
+@lru_cache(maxsize=1024)
+def compile_cron(expression: str) -> CronSchedule:
+    """
+    Parses a cron expression once and returns its compiled schedule, cached by expression.
+
+    Raises:
+    - ValueError: If the expression is invalid.
+    """
+    return CronSchedule(expression)
+
+def calculate_next_run(scheduled_time: datetime, recurrence: Optional[RecurrenceFrequency], cron_expression: Optional[str] = None,
+                       anchor_day: Optional[int] = None) -> Optional[datetime]:
+    """
+    Calculates the next scheduled time for a task based on its cron expression or recurrence frequency.
+
+    Parameters:
+    - scheduled_time (datetime): The current scheduled time of the task.
+    - recurrence (RecurrenceFrequency): The recurrence frequency of the task. DAILY, WEEKLY and BIWEEKLY add a
+      fixed number of days; MONTHLY, QUARTERLY and YEARLY add calendar months (see `add_months`).
+    - cron_expression (str, optional): A cron expression, which takes precedence over `recurrence`.
+    - anchor_day (int, optional): Day of month of the month-based occurrences, `models.Task.anchor_day`. Defaults
+      to the day of `scheduled_time`.
+
+    Returns:
+    - datetime: The next scheduled time of the task, or None if the task does not recur.
+
+    Examples:
+    - If the task is scheduled for 2023-01-31 and has a MONTHLY recurrence, the next scheduled
+      time will be 2023-02-28, and the one after that 2023-03-31 with `anchor_day=31`.
+    - If the task has the cron expression "0 9 * * mon-fri", the next scheduled time is the next
+      weekday at 09:00.
+    """
+    if cron_expression:
+        return compile_cron(cron_expression).next_after(scheduled_time)
+    if recurrence in FIXED_STEPS:
+        return scheduled_time + FIXED_STEPS[recurrence]
+    if recurrence in MONTH_STEPS:
+        return add_months(scheduled_time, MONTH_STEPS[recurrence], anchor_day)
+    return None
+
+def next_run_after(scheduled_time: datetime, recurrence: Optional[RecurrenceFrequency], after: datetime,
+                   cron_expression: Optional[str] = None, anchor_day: Optional[int] = None) -> Optional[datetime]:
+    """
+    Single-task variant of `next_runs_after`: the next occurrence of a task after `after`, skipping the missed ones.
+
+    Returns:
+    - datetime: The next scheduled time of the task, or None if the task does not recur.
+    """
+    next_run = next_runs_after(np.array([scheduled_time], dtype="datetime64[us]"), [recurrence], after, [cron_expression],
+                               [anchor_day])[0]
+    return None if np.isnat(next_run) else next_run.item()
+
+def add_months_array(values: np.ndarray, months: np.ndarray, days: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Vectorized `add_months` over a `datetime64[us]` array and an integer array of month counts, with an optional
+    integer array of the days of month to move to.
+    """
+    month_starts = values.astype("datetime64[M]")
+    offset = values - month_starts.astype("datetime64[us]")
+    day_offsets = offset.astype("timedelta64[D]")
+    time_of_day = offset - day_offsets.astype("timedelta64[us]")
+    days = day_offsets if days is None else (np.asarray(days, dtype=np.int64) - 1).astype("timedelta64[D]")
+    targets = month_starts + months.astype("timedelta64[M]")
+    month_lengths = (targets + 1).astype("datetime64[D]") - targets.astype("datetime64[D]")
+    days = np.minimum(days, month_lengths - np.timedelta64(1, "D"))
+    return targets.astype("datetime64[D]").astype("datetime64[us]") + days.astype("timedelta64[us]") + time_of_day
+
+def next_runs_after(scheduled_times: np.ndarray, recurrences: Sequence[Optional[RecurrenceFrequency]], after: datetime,
+                    cron_expressions: Optional[Sequence[Optional[str]]] = None,
+                    anchor_days: Optional[Sequence[Optional[int]]] = None) -> np.ndarray:
+    """
+    Computes, in one pass, the next run of many recurring tasks, skipping every occurrence at or before `after`.
+
+    The result is at least one step from the scheduled time. Instead of stepping with `calculate_next_run` until the
+    result is later than `after`, the number of steps is computed arithmetically over the whole array. Month-based
+    occurrences fall on the anchor day of their task, clamped to shorter months, like `calculate_next_run`: a task
+    anchored on the 31st lands on the 31st again in long months, whether it got there step by step or not.
+    Cron occurrences do not depend on the scheduled time, so each distinct expression is evaluated once.
+    Tasks that do not recur get `NaT`.
+
+    Parameters:
+    - scheduled_times (np.ndarray): Scheduled times, as a `datetime64` array.
+    - recurrences (Sequence[Optional[RecurrenceFrequency]]): Recurrence of each task.
+    - after (datetime): Occurrences at or before this time are skipped.
+    - cron_expressions (Sequence[Optional[str]], optional): Cron expression of each task, taking precedence.
+    - anchor_days (Sequence[Optional[int]], optional): Anchor day of each task, `models.Task.anchor_day`. Tasks
+      without one use the day of their scheduled time.
+
+    Returns:
+    - np.ndarray: A `datetime64[us]` array of next run times.
+
+    Example usage:
+    ```python
+    next_times = next_runs_after(np.array(times, dtype="datetime64[us]"), recurrences, datetime.now())
+    ```
+    """
+    times = np.asarray(scheduled_times, dtype="datetime64[us]")
+    after_value = np.datetime64(after, "us")
+    result = np.full(times.shape, np.datetime64("NaT"), dtype="datetime64[us]")
+    recurrences = np.asarray(recurrences, dtype=object)
+    days = times.astype("datetime64[D]") - times.astype("datetime64[M]").astype("datetime64[D]")
+    days = days.astype(np.int64) + 1
+    if anchor_days is not None:
+        anchors = np.array([day or 0 for day in anchor_days], dtype=np.int64)
+        days = np.where(anchors > 0, anchors, days)
+
+    for recurrence, step in FIXED_STEPS.items():
+        mask = recurrences == recurrence
+        if mask.any():
+            step_value = np.timedelta64(step, "us")
+            steps = np.maximum((after_value - times[mask]) // step_value + 1, 1)
+            result[mask] = times[mask] + steps * step_value
+
+    for recurrence, step in MONTH_STEPS.items():
+        mask = recurrences == recurrence
+        if mask.any():
+            elapsed = (after_value.astype("datetime64[M]") - times[mask].astype("datetime64[M]")).astype(np.int64)
+            months = np.maximum(elapsed // step, 1) * step
+            candidates = add_months_array(times[mask], months, days[mask])
+            # Same month as `after` but not later than it: one more step
+            late = candidates <= after_value
+            candidates[late] = add_months_array(times[mask][late], months[late] + step, days[mask][late])
+            result[mask] = candidates
+
+    if cron_expressions is not None:
+        expressions = np.asarray(cron_expressions, dtype=object)
+        for expression in {expression for expression in expressions if expression}:
+            mask = expressions == expression
+            schedule = compile_cron(expression)
+            result[mask] = np.datetime64(schedule.next_after(after), "us")
+            # Tasks still scheduled in the future fire after their own scheduled time
+            for index in np.flatnonzero(mask & (times > after_value)):
+                result[index] = np.datetime64(schedule.next_after(times[index].astype(datetime)), "us")
+    return result
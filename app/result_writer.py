@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+from . import crud, models
+from .config import settings
+from .database import SessionLocal
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TaskResult(NamedTuple):
+    """
+    The outcome of one execution, recorded by `crud.finish_tasks` on its task and in the run history.
+
+    Attributes:
+    - task_id (int): ID of the executed task.
+    - status (models.TaskStatus): SUCCEEDED, FAILED or SKIPPED.
+    - finished_at (datetime): When the execution finished.
+    - worker_id (Optional[str]): Owner of the task's lease. The result is only recorded while it still owns it.
+    - next_scheduled_time (Optional[datetime]): Next occurrence of a recurring task.
+    - on_written (Optional[Callable[[], None]]): Called once the result is committed, e.g. to schedule the next
+      occurrence only after the row has been moved back to PENDING.
+    - scheduled_time (Optional[datetime]): The occurrence that was executed, recorded in the run history.
+    - started_at (Optional[datetime]): When the execution started.
+    - error (Optional[str]): Why the execution failed.
+    """
+    task_id: int
+    status: models.TaskStatus
+    finished_at: datetime
+    worker_id: Optional[str] = None
+    next_scheduled_time: Optional[datetime] = None
+    on_written: Optional[Callable[[], None]] = None
+    scheduled_time: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+class ResultWriter:
+    """
+    Write-behind stage collecting the results of executions and recording them in batches.
+
+    Workers hand their results to `submit` and return immediately. A writer thread flushes the pending results
+    with `crud.finish_tasks` once `batch_size` of them are waiting or the oldest has waited `flush_interval_ms`,
+    so the database sees one commit per batch instead of one per task when many tasks finish together.
+
+    A batch that fails is retried up to `max_attempts` times in all, waiting `retry_seconds` after the first failure
+    and twice as long after each further one, up to a minute. If it still fails, it is split in halves, each written
+    once and split again on failure, so that a result the database keeps rejecting does not hold back the others.
+    A single result that still fails is logged and dropped. `stop` flushes what is still pending the same way.
+
+    Results are only held in memory: the leases of their tasks are renewed until they are written or dropped (see
+    `pending_task_ids`). The task of a dropped result, or of a result lost because the process died before a flush,
+    stays RUNNING until its lease expires, and is then run again.
+
+    When the writer is not running, `submit` records the result synchronously.
+
+    Parameters:
+    - batch_size (int): Number of pending results that triggers a flush, and maximum size of a batch.
+    - flush_interval_ms (int): Maximum time a result waits before being flushed.
+    - retry_seconds (float): Delay before retrying a failed batch.
+    - max_attempts (int): Attempts at writing a batch before it is split.
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval_ms: int = 200, retry_seconds: float = 1.0, max_attempts: int = 5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.retry_seconds = retry_seconds
+        self.max_attempts = max_attempts
+        self._pending = deque()
+        # The batch being written by the writer thread
+        self._batch: List[TaskResult] = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def __len__(self) -> int:
+        """Number of results waiting to be written."""
+        return len(self._pending)
+
+    def pending_task_ids(self) -> List[int]:
+        """IDs of the tasks whose results are waiting to be written or being written."""
+        with self._condition:
+            return [result.task_id for _, result in self._pending] + [result.task_id for result in self._batch]
+
+    def submit(self, result: TaskResult):
+        """Queues a result for the next batch, or writes it right away if the writer is not running."""
+        with self._condition:
+            if self._running:
+                self._pending.append((time.monotonic(), result))
+                # The writer thread waits without a timeout while the queue is empty
+                if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                    self._condition.notify()
+                return
+        self._write([result])
+
+    def start(self):
+        """Starts the writer thread."""
+        with self._condition:
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, retries: int = 3):
+        """
+        Stops the writer thread, then flushes the pending results, trying each batch up to `retries` times before
+        splitting it. The writer thread stops waiting between the attempts at its current batch.
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread:
+            self._thread.join()
+        while self._pending:
+            self._write_batch(self._take_batch(), retries, time.sleep)
+        with self._condition:
+            self._batch = []
+
+    def _take_batch(self) -> List[TaskResult]:
+        with self._condition:
+            count = min(len(self._pending), self.batch_size)
+            self._batch = [self._pending.popleft()[1] for _ in range(count)]
+            return self._batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running:
+                    if len(self._pending) >= self.batch_size:
+                        break
+                    if self._pending:
+                        timeout = self._pending[0][0] + self.flush_interval - time.monotonic()
+                        if timeout <= 0:
+                            break
+                    else:
+                        timeout = None
+                    self._condition.wait(timeout)
+                if not self._running:
+                    return
+            self._write_batch(self._take_batch(), self.max_attempts, self._wait)
+            with self._condition:
+                self._batch = []
+
+    def _wait(self, delay: float):
+        # Waits between two attempts of the writer thread, unless the writer is stopped meanwhile
+        deadline = time.monotonic() + delay
+        with self._condition:
+            while self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                self._condition.wait(remaining)
+
+    def _write_batch(self, batch: List[TaskResult], attempts: int, wait: Callable[[float], None]) -> int:
+        """
+        Writes `batch`, trying up to `attempts` times with a growing delay, then in halves written once each, down to
+        single results, which are dropped if they still fail.
+
+        Returns:
+        - int: Number of results dropped.
+        """
+        delay = self.retry_seconds
+        for attempt in range(1, attempts + 1):
+            try:
+                self._write(batch)
+                return 0
+            except Exception as e:
+                error = e
+                if attempt < attempts:
+                    logger.error(f"Failed to write {len(batch)} task results (attempt {attempt} of {attempts}), retrying in {delay} seconds: {e}")
+                    wait(delay)
+                    delay = min(delay * 2, 60.0)
+        if len(batch) == 1:
+            logger.error(f"Dropped the result of task {batch[0].task_id} after {attempts} failed attempts, the task runs "
+                         f"again once its lease expires: {error}")
+            return 1
+        logger.error(f"Failed to write {len(batch)} task results {attempts} times, writing them in halves: {error}")
+        middle = len(batch) // 2
+        return self._write_batch(batch[:middle], 1, wait) + self._write_batch(batch[middle:], 1, wait)
+
+    def _write(self, batch: List[TaskResult]):
+        db = SessionLocal()
+        try:
+            crud.finish_tasks(db=db, results=batch)
+        finally:
+            db.close()
+        for result in batch:
+            if result.on_written:
+                try:
+                    result.on_written()
+                except Exception as e:
+                    logger.error(f"Post-write callback failed for task {result.task_id}: {e}")
+
+result_writer = ResultWriter(settings.result_writer_batch_size, settings.result_writer_flush_interval_ms,
+                             settings.result_writer_retry_seconds, settings.result_writer_max_attempts)
@@ -0,0 +1,78 @@
+import threading
+from datetime import datetime, timedelta
+from . import crud
+from .config import settings
+from .database import SessionLocal
+import logging
+
+logger = logging.getLogger(__name__)
+
+class RunRetention:
+    """
+    Background job deleting the execution history (`task_runs`) older than `retention_days`.
+
+    Every `interval_seconds` the job deletes the runs that finished before the cutoff with
+    `crud.delete_task_runs_before`, `batch_size` rows per transaction, so that it never holds many locks or a long
+    transaction next to the appends of the result writer. It stops between two batches when asked to. Every
+    replica may run it: the batches of concurrent passes simply find fewer rows to delete.
+
+    Parameters:
+    - retention_days (int): Age in days after which runs are deleted. 0 disables the job.
+    - batch_size (int): Runs deleted per transaction.
+    - interval_seconds (int): Seconds between two passes.
+    """
+
+    def __init__(self, retention_days: int, batch_size: int = 1000, interval_seconds: int = 3600):
+        self.retention = timedelta(days=retention_days)
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts the retention thread, unless retention is disabled."""
+        if not self.retention:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="run-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the retention thread after its current batch."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def purge(self) -> int:
+        """
+        Deletes the runs older than the retention period, batch by batch.
+
+        Returns:
+        - int: Number of runs deleted.
+        """
+        cutoff = datetime.now() - self.retention
+        deleted = 0
+        db = SessionLocal()
+        try:
+            while not self._stop.is_set():
+                count = crud.delete_task_runs_before(db=db, cutoff=cutoff, batch_size=self.batch_size)
+                deleted += count
+                if count < self.batch_size:
+                    break
+        finally:
+            db.close()
+        if deleted:
+            logger.info(f"Deleted {deleted} task runs finished before {cutoff}.")
+        return deleted
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.purge()
+            except Exception as e:
+                logger.error(f"Failed to delete old task runs: {e}")
+            self._stop.wait(self.interval_seconds)
+
+run_retention = RunRetention(settings.task_run_retention_days, settings.task_run_retention_batch_size,
+                             settings.task_run_retention_interval)
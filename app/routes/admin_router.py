@@ -0,0 +1,173 @@
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
+from fastapi.responses import PlainTextResponse, Response
+from typing import List, Literal, Optional
+from .. import schemas
+from ..config import settings
+from ..profiling import allocations, profiler
+import secrets
+import logging
+
+logger = logging.getLogger(__name__)
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    Dependency restricting the admin endpoints to callers sending the `ADMIN_TOKEN` setting in the `X-Admin-Token`
+    header.
+
+    Raises:
+    - HTTPException: An exception with a 404 status code while no admin token is configured, so the endpoints do
+      not exist, and with a 403 status code if the header does not match.
+    """
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.post("/profiling", response_model=schemas.ProfilingStatus)
+async def start_profiling(request: schemas.ProfilingStart):
+    """
+    Opens a profiling window over the requests and task executions of the replica serving the request.
+
+    Parameters:
+    - request (schemas.ProfilingStart): The mode, duration and sampling of the window.
+
+    Returns:
+    - schemas.ProfilingStatus: The window just opened. It closes by itself after `duration` seconds.
+
+    Raises:
+    - HTTPException: An exception with a 409 status code is raised if a window is already open.
+    """
+    try:
+        profiler.start(request.mode, request.duration, sample_rate=request.sample_rate,
+                       interval=request.interval_ms / 1000, trace=request.trace)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profiler.status()
+
+@router.get("/profiling", response_model=schemas.ProfilingStatus)
+async def read_profiling():
+    """
+    Returns the current or last profiling window of the replica serving the request.
+
+    Returns:
+    - schemas.ProfilingStatus: The settings and counters of the window.
+    """
+    return profiler.status()
+
+@router.delete("/profiling", response_model=schemas.ProfilingStatus)
+def stop_profiling():
+    """
+    Closes the profiling window before its end. Its results stay available until the next window opens.
+
+    Returns:
+    - schemas.ProfilingStatus: The closed window.
+    """
+    profiler.stop()
+    return profiler.status()
+
+@router.get("/profiling/pstats")
+async def download_pstats():
+    """
+    Downloads the cProfile statistics of a `cprofile` window, merged over the profiled requests and executions.
+
+    Returns:
+    - Response: A binary file in the format of `pstats.Stats.dump_stats`, to open with `pstats.Stats(path)`,
+      snakeviz or gprof2dot.
+
+    Raises:
+    - HTTPException: An exception with a 404 status code is raised if nothing was profiled with cProfile.
+    """
+    data = profiler.pstats_dump()
+    if data is None:
+        raise HTTPException(status_code=404, detail="No cProfile statistics recorded")
+    return Response(data, media_type="application/octet-stream",
+                    headers={"Content-Disposition": 'attachment; filename="profile.pstats"'})
+
+@router.get("/profiling/report", response_class=PlainTextResponse)
+async def read_pstats_report(sort: Literal["cumulative", "tottime", "calls"] = "cumulative",
+                             limit: int = Query(50, ge=1, le=1000)):
+    """
+    Returns the cProfile statistics of a `cprofile` window as a text report, for a quick look without `pstats`.
+
+    Parameters:
+    - sort (str, optional): `cumulative`, `tottime` or `calls`. Defaults to `cumulative`.
+    - limit (int, optional): Number of functions listed. Defaults to 50.
+
+    Raises:
+    - HTTPException: An exception with a 404 status code is raised if nothing was profiled with cProfile.
+    """
+    report = profiler.pstats_report(sort, limit)
+    if report is None:
+        raise HTTPException(status_code=404, detail="No cProfile statistics recorded")
+    return report
+
+@router.get("/profiling/collapsed", response_class=PlainTextResponse)
+async def download_collapsed_stacks():
+    """
+    Downloads the stacks recorded by a `sampling` window in collapsed format, one `frame;frame;... count` line per
+    distinct stack, rooted at `request` or `execute_task`.
+
+    Returns:
+    - PlainTextResponse: The stacks, to render with `flamegraph.pl` or speedscope.
+
+    Raises:
+    - HTTPException: An exception with a 404 status code is raised if no stack was sampled.
+    """
+    stacks = profiler.collapsed_stacks()
+    if stacks is None:
+        raise HTTPException(status_code=404, detail="No stacks sampled")
+    return PlainTextResponse(stacks, headers={"Content-Disposition": 'attachment; filename="stacks.collapsed"'})
+
+@router.get("/profiling/traces", response_model=List[schemas.ExecutionTrace])
+async def read_execution_traces(limit: int = Query(100, ge=1, le=1000)):
+    """
+    Returns the timings of the last task executions traced by the current or last profiling window.
+
+    Parameters:
+    - limit (int, optional): Maximum number of executions returned, the most recent ones. Defaults to 100.
+
+    Returns:
+    - List[schemas.ExecutionTrace]: The executions, oldest first.
+    """
+    return profiler.traces()[-limit:]
+
+@router.post("/profiling/allocations", status_code=204)
+def start_allocation_tracing(request: schemas.AllocationStart):
+    """
+    Starts tracing memory allocations with `tracemalloc` and takes a baseline snapshot. Tracing slows down every
+    allocation of the process until it is stopped.
+
+    Parameters:
+    - request (schemas.AllocationStart): The traceback depth of the allocations.
+    """
+    allocations.start(request.frames)
+    logger.warning(f"Tracing memory allocations with {request.frames} frames.")
+    return Response(status_code=204)
+
+@router.post("/profiling/allocations/snapshot", response_model=schemas.AllocationReport)
+def take_allocation_snapshot(limit: int = Query(20, ge=1, le=500), group_by: Literal["lineno", "traceback"] = "lineno"):
+    """
+    Takes a memory snapshot and compares it with the previous one, or with the baseline for the first snapshot.
+
+    Parameters:
+    - limit (int, optional): Number of allocation sites returned, largest change first. Defaults to 20.
+    - group_by (str, optional): `lineno` to group allocations by line, `traceback` by their whole traceback.
+
+    Returns:
+    - schemas.AllocationReport: The traced memory and the top allocation sites.
+
+    Raises:
+    - HTTPException: An exception with a 409 status code is raised if allocations are not being traced.
+    """
+    try:
+        return allocations.snapshot_diff(limit, group_by)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.delete("/profiling/allocations", status_code=204)
+def stop_allocation_tracing():
+    """Stops tracing memory allocations and frees the snapshots."""
+    allocations.stop()
+    return Response(status_code=204)
@@ -1,95 +1,335 @@
-from fastapi import APIRouter, HTTPException, Depends, Path
-from sqlalchemy.orm import Session
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.date import DateTrigger
+from fastapi import APIRouter, Body, HTTPException, Depends, Header, Path, Query
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.util import greenlet_spawn
 from datetime import datetime
-from typing import List
-from ..database import SessionLocal
-from fastapi.responses import Response
-from .. import crud, models, task_executor, schemas
+from enum import Enum
+from typing import Any, List, Optional, Tuple
+from ..database import AsyncSessionLocal
+from fastapi.responses import Response, StreamingResponse
+from .. import async_crud, schemas
+from ..cache import idempotency_keys, task_cache
+from ..config import settings
+from ..events import Subscription, task_events
+from ..models import TaskStatus
+from ..scheduler import schedule_task_execution, schedule_tasks_execution
+import json
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-scheduler = BackgroundScheduler()
-scheduler.start()
 
-def get_db():
+async def get_db():
     """
-    Dependency that creates and yields a database session from a SQLAlchemy SessionLocal instance, ensuring
+    Dependency that creates and yields an async database session from the AsyncSessionLocal factory, ensuring
     that the session is closed after request processing is complete.
 
     Yields:
-    - A SQLAlchemy SessionLocal instance that can be used to execute database operations.
+    - A SQLAlchemy AsyncSession instance that can be used to execute database operations without blocking the event loop.
     """
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
-
-def schedule_task_execution(task_id: int, run_date: datetime):
-    """
-    Schedules a task for execution using APScheduler at the specified run_date. If the run_date is in the past, 
-    the task is executed immediately.
-
-    Parameters:
-    - task_id (int): The unique identifier of the task to be executed.
-    - run_date (datetime): The scheduled datetime for the task to be executed.
-
-    The task is scheduled with a job in APScheduler using a DateTrigger with the specified run_date. 
-    A warning is logged if the run_date is in the past.
-    """
-    if run_date <= datetime.now():
-        logger.warning(f"Task {task_id} scheduled time is in the past. Running immediately.")
-    scheduler.add_job(task_executor.execute_task, trigger=DateTrigger(run_date=run_date), args=[task_id], misfire_grace_time=15)
 
 @router.post("/tasks/", response_model=schemas.Task)
-async def create_task(task: schemas.TaskCreate, db: Session = Depends(get_db)):
+async def create_task(task: schemas.TaskCreate, upsert: bool = False,
+                      idempotency_key: Optional[str] = Header(None, max_length=255), db: AsyncSession = Depends(get_db)):
     """
     Creates a new task based on the provided details in the request body and schedules it for execution.
 
     Parameters:
     - task (schemas.TaskCreate): A Pydantic model representing the task to be created, including its name, 
-      scheduled_time, and optional recurrence.
-    - db (Session, Depends(get_db)): A database session dependency injected by FastAPI, used for database operations.
+      scheduled_time, optional recurrence or cron_expression, and optional handler and payload.
+    - upsert (bool): If a task with the same name exists, update it with the request body instead of failing.
+      This is a query parameter. Defaults to False.
+    - idempotency_key (Optional[str]): The `Idempotency-Key` header. If a task with the same name exists, it is
+      returned unchanged instead of failing, and a retry with the same key is answered without writing to the
+      database for `IDEMPOTENCY_KEY_TTL` seconds.
+    - db (AsyncSession, Depends(get_db)): A database session dependency injected by FastAPI, used for database operations.
 
     Returns:
-    - schemas.Task: The created task, including its generated ID and other details as specified in the request.
+    - schemas.Task: The created task, including its generated ID and other details as specified in the request. With
+      `upsert` or an `Idempotency-Key`, the existing task of the same name, updated or not, with the same 200 status.
 
     The task is created in the database, and if it has a scheduled time, it is also scheduled for execution using 
-    the `schedule_task_execution` function.
+    the `schedule_task_execution` function. With `upsert` or an `Idempotency-Key`, the conflict with an existing task
+    is resolved by the insert statement itself (`INSERT ... ON DUPLICATE KEY UPDATE`), so producers repeating the same
+    creation do not cause errors.
     """
+    if idempotency_key is not None:
+        # In a greenlet, like the `crud` calls, so that a shared cache backend awaits its round trips
+        task_id = await greenlet_spawn(idempotency_keys.get, idempotency_key)
+        if task_id is not None:
+            existing_task = await async_crud.get_task_by_id(db=db, task_id=task_id)
+            if existing_task:
+                return existing_task
+            await greenlet_spawn(idempotency_keys.discard, idempotency_key)
+    if upsert or idempotency_key is not None:
+        logger.info(f"Creating or {'updating' if upsert else 'reusing'} task: {task.name}")
+        new_task = await async_crud.upsert_task(
+            db=db,
+            task_name=task.name,
+            scheduled_time=task.scheduled_time,
+            recurrence=task.recurrence,
+            cron_expression=task.cron_expression,
+            handler=task.handler,
+            payload=task.payload,
+            priority=task.priority,
+            group=task.group,
+            misfire_policy=task.misfire_policy,
+            update_existing=upsert
+        )
+        if idempotency_key is not None:
+            await greenlet_spawn(idempotency_keys.set, idempotency_key, new_task.id)
+        if new_task.status == TaskStatus.PENDING:
+            schedule_task_execution(new_task.id, new_task.scheduled_time, misfire_policy=new_task.misfire_policy)
+        return new_task
     logger.info(f"Creating new task: {task.name}")
-    new_task = crud.create_task(
+    new_task = await async_crud.create_task(
         db=db, 
         task_name=task.name, 
         scheduled_time=task.scheduled_time, 
-        recurrence=task.recurrence
+        recurrence=task.recurrence,
+        cron_expression=task.cron_expression,
+        handler=task.handler,
+        payload=task.payload,
+        priority=task.priority,
+        group=task.group,
+        misfire_policy=task.misfire_policy
     )
-    schedule_task_execution(new_task.id, new_task.scheduled_time)
+    schedule_task_execution(new_task.id, new_task.scheduled_time, misfire_policy=new_task.misfire_policy)
     return new_task
 
+def _validate_bulk_items(items: List[Any]) -> Tuple[List[int], List[schemas.TaskCreate], List[dict]]:
+    """
+    Validates the items of a bulk creation request one by one, like single `POST /tasks/` bodies, so that an invalid
+    item is rejected on its own.
+
+    Returns:
+    - Tuple[List[int], List[schemas.TaskCreate], List[dict]]: The position in the request body of each valid item,
+      the valid items, and one `schemas.TaskBulkError` dict per invalid item.
+    """
+    positions, tasks, errors = [], [], []
+    for index, item in enumerate(items):
+        try:
+            task = schemas.TaskCreate.model_validate(item)
+        except ValidationError as e:
+            name = item.get("name") if isinstance(item, dict) else None
+            detail = "; ".join(f"{'.'.join(str(part) for part in error['loc']) or 'item'}: {error['msg']}" for error in e.errors())
+            errors.append({"index": index, "name": name if isinstance(name, str) else None, "detail": detail})
+            continue
+        positions.append(index)
+        tasks.append(task)
+    return positions, tasks, errors
+
+@router.post("/tasks/bulk", response_model=schemas.TaskBulkResult)
+async def create_tasks(tasks: List[Any] = Body(..., description="The tasks to create, each a `schemas.TaskCreate` object"),
+                       db: AsyncSession = Depends(get_db)):
+    """
+    Creates many tasks in a single request and schedules all of them for execution.
+
+    Parameters:
+    - tasks (List[Any]): The tasks to be created, each validated on its own like a single `POST /tasks/` body. At
+      most `BULK_CREATE_MAX_TASKS` items.
+    - db (AsyncSession, Depends(get_db)): A database session dependency injected by FastAPI, used for database operations.
+
+    Returns:
+    - schemas.TaskBulkResult: The created tasks, plus one entry per rejected item: an item that fails validation (for
+      example a scheduled time in the past or an invalid cron expression) or a duplicate name. Rejected items do not
+      fail the rest of the batch.
+
+    Raises:
+    - HTTPException: An exception with a 413 status code is raised if the batch has more than `BULK_CREATE_MAX_TASKS`
+      items. Nothing is created then.
+
+    The valid tasks are inserted with multi-row INSERT statements inside one transaction, and the resulting jobs are
+    registered with the scheduler together using `schedule_tasks_execution`.
+
+    Example request:
+    `POST /tasks/bulk`
+    ```json
+    [
+        {"name": "Task A", "scheduled_time": "2030-01-01T10:00:00", "recurrence": "once"},
+        {"name": "Task B", "scheduled_time": "2030-01-01T11:00:00"}
+    ]
+    ```
+    """
+    if len(tasks) > settings.bulk_create_max_tasks:
+        raise HTTPException(status_code=413, detail=f"A bulk request may create at most {settings.bulk_create_max_tasks} tasks")
+    logger.info(f"Creating {len(tasks)} tasks in bulk")
+    positions, valid_tasks, errors = _validate_bulk_items(tasks)
+    created, duplicates = await async_crud.create_tasks(db=db, tasks=valid_tasks)
+    for error in duplicates:
+        error["index"] = positions[error["index"]]
+    schedule_tasks_execution(created)
+    errors = sorted(errors + duplicates, key=lambda error: error["index"])
+    if errors:
+        logger.warning(f"Rejected {len(errors)} of {len(tasks)} tasks in bulk creation")
+    return {"created": created, "errors": errors}
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _task_list_response(content) -> Response:
+    """
+    Encodes task records from `crud.get_tasks` to a JSON response with orjson, bypassing the validation and
+    generic encoding of the response model, which dominate the cost of large lists. orjson writes datetimes and
+    enums like the response model does. Integers beyond 64 bits, only possible in payloads, fall back to `json`.
+    """
+    try:
+        body = orjson.dumps(content)
+    except orjson.JSONEncodeError:
+        body = json.dumps(content, default=_json_default, separators=(",", ":"))
+    return Response(body, media_type="application/json")
+
 @router.get("/tasks/", response_model=List[schemas.Task])
-async def read_tasks(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def read_tasks(skip: int = 0, limit: int = 100, filters: schemas.TaskFilter = Depends(), db: AsyncSession = Depends(get_db)):
     """
     Retrieves a paginated list of tasks from the database.
 
     Parameters:
     - skip (int, optional): The number of records to skip from the start. Useful for pagination. Defaults to 0.
     - limit (int, optional): The maximum number of records to return. Useful for pagination. Defaults to 100.
-    - db (Session, Depends(get_db)): A database session dependency injected by FastAPI, used for database operations.
+    - filters (schemas.TaskFilter): Optional query parameters restricting the tasks returned: `scheduled_after`,
+      `scheduled_before`, `recurrence`, `status` and `name_prefix`.
+    - db (AsyncSession, Depends(get_db)): A database session dependency injected by FastAPI, used for database operations.
 
     Returns:
     - A list of task objects, each represented by the schemas.Task Pydantic model. This list may be empty if no tasks match the pagination criteria.
     """
     logger.info("Fetching list of tasks")
-    tasks = crud.get_tasks(db=db, skip=skip, limit=limit)
-    return tasks
+    tasks = await async_crud.get_tasks(db=db, skip=skip, limit=limit, task_filter=filters)
+    return _task_list_response(tasks)
+
+@router.get("/tasks/page", response_model=schemas.TaskPage)
+async def read_tasks_page(limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None, filters: schemas.TaskFilter = Depends(),
+                          db: AsyncSession = Depends(get_db)):
+    """
+    Retrieves one page of tasks ordered by scheduled time, using cursor-based (keyset) pagination.
+
+    Parameters:
+    - limit (int, optional): The maximum number of records to return. Defaults to 100, at most 1000.
+    - cursor (str, optional): The `next_cursor` value returned with the previous page. Omit it for the first page.
+    - filters (schemas.TaskFilter): Optional query parameters restricting the tasks returned, like for `GET /tasks/`.
+      Pass the same filters with every page.
+    - db (AsyncSession, Depends(get_db)): A database session dependency injected by FastAPI, used for database operations.
+
+    Returns:
+    - schemas.TaskPage: The tasks of the page and the cursor of the next page, which is null on the last page.
+
+    Raises:
+    - HTTPException: An exception with a 400 status code is raised if the cursor is malformed.
+    """
+    logger.info("Fetching page of tasks")
+    try:
+        tasks, next_cursor = await async_crud.get_tasks_page(db=db, limit=limit, cursor=cursor, task_filter=filters)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return _task_list_response({"items": tasks, "next_cursor": next_cursor})
+
+@router.get("/tasks/count", response_model=schemas.TaskCount)
+async def count_tasks(exact: bool = False, filters: schemas.TaskFilter = Depends(), db: AsyncSession = Depends(get_db)):
+    """
+    Returns the number of tasks matching the filters.
+
+    Parameters:
+    - exact (bool, optional): Always count the matching rows, however many there are. Defaults to False.
+    - filters (schemas.TaskFilter): Optional query parameters restricting the tasks counted, like for `GET /tasks/`.
+    - db (AsyncSession, Depends(get_db)): A database session dependency injected by FastAPI, used for database operations.
+
+    Returns:
+    - schemas.TaskCount: The count, and whether it is exact. Unless `exact` is set, when the table statistics estimate
+      more than `TASK_COUNT_EXACT_LIMIT` matching rows, that estimate is returned in milliseconds instead of counting.
+    """
+    count, is_exact = await async_crud.count_tasks(db=db, task_filter=filters,
+                                                   exact_limit=None if exact else settings.task_count_exact_limit)
+    return {"count": count, "exact": is_exact}
+
+async def _export_tasks():
+    """
+    Yields every task as one NDJSON line. The generator owns its database session because it is consumed
+    while the response is being streamed, after request dependencies have been closed.
+    """
+    async with AsyncSessionLocal() as db:
+        async for task in async_crud.iter_tasks(db=db):
+            yield json.dumps(task, default=_json_default) + "\n"
+
+@router.get("/tasks/export")
+async def export_tasks():
+    """
+    Streams every task as newline-delimited JSON (NDJSON), one `schemas.Task` object per line.
+
+    Rows are read through a server-side cursor and sent as they are fetched, so memory use stays flat no matter
+    how large the table is.
+
+    Returns:
+    - StreamingResponse: An `application/x-ndjson` response.
+    """
+    logger.info("Exporting tasks")
+    return StreamingResponse(_export_tasks(), media_type="application/x-ndjson")
+
+async def _stream_events(subscription: Subscription, missed: bool):
+    """
+    Yields the events of a change feed subscription in Server-Sent Events format, a `reset` event whenever events
+    were missed, and a comment line as keep-alive when nothing happened for `EVENT_HEARTBEAT_SECONDS`.
+    """
+    if missed:
+        yield f"id: {task_events.token(subscription.after)}\nevent: reset\ndata: {{}}\n\n"
+    while True:
+        events, missed = await subscription.next_events(settings.event_heartbeat_seconds)
+        if missed:
+            # The reset comes before the events that follow the gap
+            after = events[0].seq - 1 if events else subscription.after
+            yield f"id: {task_events.token(after)}\nevent: reset\ndata: {{}}\n\n"
+        if events:
+            yield "".join(f"id: {task_events.token(event.seq)}\nevent: {event.type}\ndata: {event.encode()}\n\n" for event in events)
+        elif not missed:
+            yield ": keep-alive\n\n"
+
+@router.get("/tasks/events")
+async def stream_task_events(since: Optional[str] = None, last_event_id: Optional[str] = Header(None)):
+    """
+    Streams the changes of tasks as Server-Sent Events, instead of polling the task list.
+
+    Parameters:
+    - since (str, optional): Resume token (the `id` of the last event received) to continue from. This is a query
+      parameter. Omit it to only receive new events.
+    - last_event_id (str, optional): The `Last-Event-ID` header, sent by `EventSource` clients when they reconnect.
+      It takes precedence over `since`.
+
+    Returns:
+    - StreamingResponse: A `text/event-stream` response. Each event is named after its type (`created`,
+      `updated`, `deleted`, `started` or `finished`), carries a JSON object with the `task_id` and the changed
+      values, and has a resume token as its `id`.
+
+    Events are fanned out in process from the writes of `crud`, so a replica streams the changes made by itself.
+    A reconnecting client only gets the events it missed, as long as they are still among the last
+    `EVENT_BUFFER_SIZE` events. Otherwise, and whenever the client reads too slowly to keep up, it receives a
+    `reset` event and should reload the tasks it follows.
+    """
+    token = last_event_id or since
+    after = task_events.parse_token(token)
+    subscription = task_events.subscribe(after)
+    return StreamingResponse(_stream_events(subscription, missed=token is not None and after is None), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/tasks/cache", response_model=schemas.CacheStats)
+async def read_cache_stats():
+    """
+    Returns the hit, miss and eviction counters of the task lookup cache of the replica serving the request.
+
+    Returns:
+    - schemas.CacheStats: The counters, since the replica started.
+    """
+    return task_cache.stats()
 
 @router.get("/tasks/{task_id}", response_model=schemas.Task)
-async def get_task(task_id: int, db: Session = Depends(get_db)):
+async def get_task(task_id: int, db: AsyncSession = Depends(get_db)):
     """
     Retrieves a single task by its ID.
 
@@ -98,7 +338,7 @@ async def get_task(task_id: int, db: Session = Depends(get_db)):
 
     Parameters:
     - task_id (int): The unique identifier of the task. This is a path parameter.
-    - db (Session, auto-injected): SQLAlchemy Session dependency that is automatically injected by FastAPI's 
+    - db (AsyncSession, auto-injected): SQLAlchemy AsyncSession dependency that is automatically injected by FastAPI's 
       dependency injection system. It represents a database session that is used to query the database.
 
     Returns:
@@ -129,25 +369,60 @@ async def get_task(task_id: int, db: Session = Depends(get_db)):
     ```
     """
     logger.info(f"Fetching task with ID: {task_id}")
-    task = crud.get_task_by_id(db=db, task_id=task_id)
+    task = await async_crud.get_task_by_id(db=db, task_id=task_id)
     if not task:
         logger.error(f"Task not found: {task_id}")
         raise HTTPException(status_code=404, detail="Task not found")
     return task
 
+@router.get("/tasks/{task_id}/runs", response_model=List[schemas.TaskRun])
+async def read_task_runs(task_id: int, limit: int = Query(50, ge=1, le=1000), before_id: Optional[int] = None,
+                         db: AsyncSession = Depends(get_db)):
+    """
+    Retrieves the most recent executions of a task from the run history, newest first.
+
+    Runs are kept for `TASK_RUN_RETENTION_DAYS` days, including those of deleted tasks, so an unknown task ID
+    returns an empty list rather than a 404 error.
+
+    Parameters:
+    - task_id (int): The unique identifier of the task. This is a path parameter.
+    - limit (int): Maximum number of runs to return, between 1 and 1000. Defaults to 50.
+    - before_id (Optional[int]): Only return runs older than this run ID. Pass the `id` of the last run of a response
+      to fetch the next page.
+    - db (AsyncSession, auto-injected): SQLAlchemy AsyncSession dependency that is automatically injected by FastAPI.
+
+    Returns:
+    - List[schemas.TaskRun]: The runs of the task.
+
+    Example request:
+    `GET /tasks/1/runs?limit=2`
+
+    Successful response:
+    ```json
+    [
+        {"id": 42, "task_id": 1, "scheduled_time": "2023-01-02T10:00:00", "started_at": "2023-01-02T10:00:00",
+         "finished_at": "2023-01-02T10:00:05", "status": "failed", "worker": null, "error": "TimeoutError: ..."},
+        {"id": 17, "task_id": 1, "scheduled_time": "2023-01-01T10:00:00", "started_at": "2023-01-01T10:00:01",
+         "finished_at": "2023-01-01T10:00:04", "status": "succeeded", "worker": null, "error": null}
+    ]
+    ```
+    """
+    logger.info(f"Fetching runs of task {task_id}")
+    return await async_crud.get_task_runs(db=db, task_id=task_id, limit=limit, before_id=before_id)
+
 @router.put("/tasks/{task_id}", response_model=schemas.Task)
-async def update_task(task_id: int, task: schemas.TaskUpdate, db: Session = Depends(get_db)):
+async def update_task(task_id: int, task: schemas.TaskUpdate, db: AsyncSession = Depends(get_db)):
     """
     Updates an existing task based on the provided task ID and update data.
 
     This endpoint allows partial updates to a task's details. Fields that can be updated include the task's name, 
-    scheduled time, and recurrence frequency. Any combination of these fields can be provided in the request body.
+    scheduled time, recurrence frequency and cron expression. Any combination of these fields can be provided in the request body.
 
     Parameters:
     - task_id (int): The unique identifier of the task to be updated. This is a path parameter.
     - task (schemas.TaskUpdate): A Pydantic model representing the fields to update, which may include `name`, 
       `scheduled_time`, and `recurrence`.
-    - db (Session, auto-injected): SQLAlchemy Session dependency that is automatically injected by FastAPI's 
+    - db (AsyncSession, auto-injected): SQLAlchemy AsyncSession dependency that is automatically injected by FastAPI's 
       dependency injection system. It represents a database session that is used to query and update the database.
 
     Returns:
@@ -178,20 +453,28 @@ async def update_task(task_id: int, task: schemas.TaskUpdate, db: Session = Depe
     ```
     """
     logger.info(f"Updating task: {task_id}")
-    updated_task = crud.update_task(
+    updated_task = await async_crud.update_task(
         db=db, 
         task_id=task_id, 
         new_name=task.name, 
         new_scheduled_time=task.scheduled_time, 
-        new_recurrence=task.recurrence
+        new_recurrence=task.recurrence,
+        new_cron_expression=task.cron_expression,
+        new_handler=task.handler,
+        new_payload=task.payload,
+        new_priority=task.priority,
+        new_group=task.group,
+        new_misfire_policy=task.misfire_policy
     )
     if not updated_task:
         logger.error(f"Failed to update task: {task_id}")
         raise HTTPException(status_code=404, detail="Task not found")
+    if task.scheduled_time is not None:
+        schedule_task_execution(updated_task.id, updated_task.scheduled_time, misfire_policy=updated_task.misfire_policy)
     return updated_task
 
 @router.delete("/tasks/{task_id}", status_code=204)
-async def delete_task(task_id: int, db: Session = Depends(get_db)):
+async def delete_task(task_id: int, db: AsyncSession = Depends(get_db)):
     """
     Deletes an existing task based on the provided task ID.
 
@@ -200,7 +483,7 @@ async def delete_task(task_id: int, db: Session = Depends(get_db)):
 
     Parameters:
     - task_id (int): The unique identifier of the task to be deleted. This is a path parameter.
-    - db (Session, auto-injected): SQLAlchemy Session dependency that is automatically injected by FastAPI's 
+    - db (AsyncSession, auto-injected): SQLAlchemy AsyncSession dependency that is automatically injected by FastAPI's 
       dependency injection system. It represents a database session that is used to query and update the database.
 
     Returns:
@@ -218,7 +501,7 @@ async def delete_task(task_id: int, db: Session = Depends(get_db)):
     ```
     """
     logger.info(f"Deleting task: {task_id}")
-    success = crud.delete_task(db=db, task_id=task_id)
+    success = await async_crud.delete_task(db=db, task_id=task_id)
     if not success:
         logger.error(f"Failed to delete task: {task_id}")
         raise HTTPException(status_code=404, detail="Task not found")
@@ -0,0 +1,386 @@
+import math
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.jobstores.base import ConflictingIdError
+from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.base import STATE_RUNNING
+from apscheduler.triggers.date import DateTrigger
+from .config import settings
+from .lanes import PriorityLanes, group_limits
+from .metrics import TASKS_MISFIRED, TASKS_SCHEDULED
+from .misfire import catch_up
+from .timer_engine import TimerEngine
+from . import crud, models, task_executor
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BoundedExecutorMixin:
+    """
+    Limits the number of jobs an APScheduler executor accepts to its workers plus a bounded queue.
+
+    `capacity` is the number of jobs that may be submitted and not yet finished. Jobs beyond it are not handed
+    to the executor: `BoundedMemoryJobStore` leaves them in the job store until a worker frees up, and the
+    executor wakes the scheduler up again as soon as one does.
+    """
+
+    def _init_bounds(self, max_workers: int, queue_size: int):
+        self.max_workers = max_workers
+        self.capacity = max_workers + queue_size
+        self.outstanding = 0
+
+    @property
+    def free_slots(self) -> int:
+        return self.capacity - self.outstanding
+
+    @property
+    def busy_workers(self) -> int:
+        return min(self.outstanding, self.max_workers)
+
+    def _do_submit_job(self, job, run_times):
+        super()._do_submit_job(job, run_times)
+        self.outstanding += 1
+
+    def _release(self):
+        with self._lock:
+            was_saturated = self.outstanding >= self.capacity
+            self.outstanding -= 1
+        if was_saturated:
+            self._scheduler.wakeup()
+
+    def _run_job_success(self, job_id, events):
+        super()._run_job_success(job_id, events)
+        self._release()
+
+    def _run_job_error(self, job_id, exc, traceback=None):
+        super()._run_job_error(job_id, exc, traceback)
+        self._release()
+
+class BoundedThreadPoolExecutor(BoundedExecutorMixin, ThreadPoolExecutor):
+    """A thread pool executor accepting at most `max_workers + queue_size` outstanding jobs."""
+
+    def __init__(self, max_workers: int = 10, queue_size: int = 100):
+        super().__init__(max_workers)
+        self._init_bounds(max_workers, queue_size)
+
+class BoundedMemoryJobStore(MemoryJobStore):
+    """
+    A memory job store that only hands out as many due jobs as their executors have free slots.
+
+    Due jobs beyond an executor's capacity stay in the store, in order, instead of piling up in the executor's
+    queue where they would silently exceed their misfire grace time.
+
+    The store counts the `task-<id>` jobs as they are added and removed, in `task_jobs`, so that the metrics do not
+    list every job on each scrape.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.task_jobs = 0
+
+    def add_job(self, job):
+        super().add_job(job)
+        if job.id.startswith("task-"):
+            self.task_jobs += 1
+
+    def remove_job(self, job_id):
+        super().remove_job(job_id)
+        if job_id.startswith("task-"):
+            self.task_jobs -= 1
+
+    def remove_all_jobs(self):
+        super().remove_all_jobs()
+        self.task_jobs = 0
+
+    def get_due_jobs(self, now):
+        free_slots = {}
+        admitted = []
+        for job in super().get_due_jobs(now):
+            if job.executor not in free_slots:
+                free_slots[job.executor] = self._scheduler.free_slots(job.executor)
+            if free_slots[job.executor] > 0:
+                free_slots[job.executor] -= 1
+                admitted.append(job)
+        return admitted
+
+class TaskScheduler(BackgroundScheduler):
+    """
+    The application's single APScheduler instance, with bounded executors and explicit backpressure.
+
+    When an executor is saturated its due jobs are held back in the job store. The scheduler logs it once per
+    saturation episode and, rather than spinning on the overdue jobs, waits at least `backpressure_interval`
+    seconds or until a worker frees up.
+    """
+
+    def __init__(self, backpressure_interval: float = 0.5, **options):
+        super().__init__(**options)
+        self.backpressure_interval = backpressure_interval
+        self._saturated = False
+
+    @property
+    def task_jobs(self) -> int:
+        """Number of `task-<id>` jobs waiting in the job stores, see `BoundedMemoryJobStore`."""
+        return sum(getattr(store, "task_jobs", 0) for store in self._jobstores.values())
+
+    def free_slots(self, executor_alias: str) -> float:
+        executor = self._lookup_executor(executor_alias)
+        return getattr(executor, "free_slots", math.inf)
+
+    def _process_jobs(self):
+        wait_seconds = super()._process_jobs()
+        saturated = [alias for alias in self._executors if self.free_slots(alias) <= 0]
+        if saturated and not self._saturated:
+            logger.warning(f"Executors {saturated} are saturated; holding back due jobs until workers are free.")
+        elif not saturated and self._saturated:
+            logger.info("Executors are no longer saturated.")
+        self._saturated = bool(saturated)
+        if saturated and wait_seconds is not None:
+            wait_seconds = max(wait_seconds, self.backpressure_interval)
+        return wait_seconds
+
+def build_scheduler() -> TaskScheduler:
+    """
+    Builds the scheduler from the application settings.
+
+    Executors:
+    - `default`: a thread pool for blocking jobs such as `task_executor.execute_task`. CPU-bound and I/O-bound
+      handlers are handed over to `handlers.handler_runtime`, so they do not hold its threads.
+    - `maintenance`: a single unbounded thread for the scheduler's own housekeeping jobs, so that they keep running
+      while the task executors are saturated.
+    """
+    return TaskScheduler(
+        backpressure_interval=settings.scheduler_backpressure_interval,
+        jobstores={"default": BoundedMemoryJobStore()},
+        executors={
+            "default": BoundedThreadPoolExecutor(settings.scheduler_thread_pool_size, settings.scheduler_queue_size),
+            "maintenance": ThreadPoolExecutor(1),
+        },
+        job_defaults={
+            "max_instances": settings.scheduler_max_instances,
+            "coalesce": settings.scheduler_coalesce,
+            "misfire_grace_time": settings.scheduler_misfire_grace_time,
+        },
+    )
+
+class TaskWindowLoader:
+    """
+    Keeps the scheduler loaded with the pending tasks due within a sliding time window.
+
+    Holding every future task as an APScheduler job would make startup and memory grow with the size of the
+    `tasks` table. Instead only tasks due before `loaded_until` are scheduled. `refill` streams the tasks of the
+    next window from the `(status, scheduled_time)` index in chunks, and runs periodically so that the window
+    keeps `horizon` ahead of the current time. Tasks created further in the future are left in the database
+    until their window is loaded. The first window also holds the tasks left overdue while no scheduler was running,
+    which `schedule_task_execution` paces according to their misfire policy. Recurring tasks whose policy is `SKIP`
+    are not scheduled for their misfired occurrence: each chunk of them is moved to its next occurrence at once
+    with `crud.skip_misfired_tasks`.
+
+    Parameters:
+    - horizon_seconds (int): How far ahead of now tasks are loaded.
+    - chunk_size (int): Rows read per query while loading a window.
+    """
+
+    def __init__(self, horizon_seconds: int, chunk_size: int = 1000):
+        self.horizon = timedelta(seconds=horizon_seconds)
+        self.chunk_size = chunk_size
+        self.loaded_until: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def covers(self, run_date: datetime) -> bool:
+        """Returns True if tasks due at `run_date` belong to an already loaded window."""
+        return self.loaded_until is not None and run_date < self.loaded_until
+
+    def refill(self) -> int:
+        """
+        Schedules the pending tasks due between the end of the loaded window and `horizon` from now.
+
+        The window end is moved before reading, so a task created concurrently is either scheduled by its
+        creator (it is already covered) or found by this read. A task that is both is still scheduled once, since
+        `schedule_task_execution` replaces the job or timer of a task already scheduled.
+
+        Returns:
+        - int: Number of tasks scheduled.
+        """
+        with self._lock:
+            start = self.loaded_until
+            end = datetime.now() + self.horizon
+            if start is not None and end <= start:
+                return 0
+            self.loaded_until = end
+            count = 0
+            with task_executor.get_db_session() as db:
+                for chunk in crud.iter_pending_task_chunks(db=db, start=start, end=end, chunk_size=self.chunk_size):
+                    chunk = self._skip_misfired(db, chunk)
+                    schedule_tasks_execution(chunk)
+                    count += len(chunk)
+        if count:
+            logger.info(f"Loaded {count} tasks due before {end}.")
+        return count
+
+    def _skip_misfired(self, db, chunk: list) -> list:
+        """Skips the misfired occurrences of the `SKIP` tasks of a chunk, and returns the rows left to schedule."""
+        now = datetime.now()
+        misfired = [row for row in chunk if catch_up.is_misfired(row.scheduled_time, now)
+                    and catch_up.policy_of(row.misfire_policy) == models.MisfirePolicy.SKIP]
+        if not misfired:
+            return chunk
+        moved = crud.skip_misfired_tasks(db=db, tasks=misfired, now=now, worker_id=settings.worker_id)
+        if not moved:
+            return chunk
+        TASKS_MISFIRED.labels(models.MisfirePolicy.SKIP.value).inc(len(moved))
+        logger.info(f"Skipped the misfired occurrence of {len(moved)} recurring tasks.")
+        policies = {row.id: row.misfire_policy for row in chunk}
+        for task_id, next_run in moved:
+            schedule_task_execution(task_id, next_run, misfire_policy=policies[task_id])
+        moved_ids = {task_id for task_id, _ in moved}
+        return [row for row in chunk if row.id not in moved_ids]
+
+    def start(self, refill_interval: int) -> int:
+        """
+        Loads the first window, overdue tasks included, and registers the periodic refill job on the scheduler.
+
+        Returns:
+        - int: Number of tasks scheduled by the first load.
+        """
+        count = self.refill()
+        scheduler.add_job(self.refill, trigger=IntervalTrigger(seconds=refill_interval), id="refill-task-window",
+                          executor="maintenance", replace_existing=True, coalesce=True, misfire_grace_time=None)
+        return count
+
+def maintain_leases(stale_owner: Optional[str] = None) -> int:
+    """
+    Renews the leases of the tasks executing in this process, and schedules again the tasks whose lease expired,
+    which `task_executor.maintain_leases` has put back to PENDING.
+
+    Parameters:
+    - stale_owner (str, optional): See `crud.reclaim_expired_leases`.
+
+    Returns:
+    - int: Number of tasks reclaimed.
+    """
+    reclaimed = task_executor.maintain_leases(settings.worker_id, settings.dispatch_lease_seconds, stale_owner=stale_owner)
+    schedule_tasks_execution(reclaimed)
+    return len(reclaimed)
+
+def start_lease_maintenance() -> int:
+    """
+    Schedules again the tasks left RUNNING by a previous run of this process (same `worker_id`) or without a lease,
+    then registers the job renewing the leases of the tasks executing here every third of `dispatch_lease_seconds`.
+    Call it once the first window is loaded, so that the reclaimed tasks are covered by it.
+
+    Returns:
+    - int: Number of tasks reclaimed at startup.
+    """
+    count = maintain_leases(stale_owner=settings.worker_id)
+    scheduler.add_job(maintain_leases, trigger=IntervalTrigger(seconds=max(settings.dispatch_lease_seconds / 3, 1)),
+                      id="maintain-leases", executor="maintenance", replace_existing=True, coalesce=True,
+                      misfire_grace_time=None)
+    return count
+
+def run_task_now(task_id: int):
+    """Hands a due task to `task_lanes`, which starts it by priority within the limits of its group."""
+    task_lanes.offer(task_id)
+
+def load_task_lanes(task_ids: List[int]):
+    """Reads the priority and group of due tasks for `task_lanes`."""
+    with task_executor.get_db_session() as db:
+        return crud.get_task_lanes(db=db, task_ids=task_ids)
+
+def _execute_admitted(task_id: int, group: Optional[str]):
+    try:
+        pending = task_executor.execute_task(task_id)
+    except BaseException:
+        task_lanes.release(group)
+        raise
+    if pending is None:
+        task_lanes.release(group)
+        return
+    # The handler runs on in the handler runtime: the worker may start another task, the group keeps its slot
+    task_lanes.free_worker()
+    pending.add_done_callback(lambda _: task_lanes.release(group, worker=False))
+
+def start_admitted_task(task_id: int, group: Optional[str]):
+    """
+    Submits the execution of a task admitted by `task_lanes` to the scheduler's default executor.
+
+    A task offered twice, for example by a timer and a lease reclaim, can be admitted again while its first job is
+    still waiting for a free executor slot. That job already runs the task, so the second admission gives back the
+    worker and group slots it took instead of replacing it, which would leak the slots of the first one.
+    """
+    try:
+        # A job held back by a saturated executor must not be dropped as misfired; the task's own policy applies
+        scheduler.add_job(_execute_admitted, args=[task_id, group], id=f"run-{task_id}", misfire_grace_time=None)
+    except ConflictingIdError:
+        logger.info(f"Task {task_id} is already waiting to run, ignoring its second admission.")
+        task_lanes.release(group)
+
+scheduler = build_scheduler()
+task_lanes = PriorityLanes(group_limits, max_in_flight=settings.scheduler_thread_pool_size, load=load_task_lanes,
+                           submit=start_admitted_task)
+timer_engine = TimerEngine(callback=run_task_now)
+window_loader = TaskWindowLoader(settings.rehydration_horizon_seconds, settings.rehydration_chunk_size)
+_batch_lock = threading.Lock()
+
+def schedule_task_execution(task_id: int, run_date: datetime, misfire_policy: models.MisfirePolicy = None):
+    """
+    Schedules a task for execution using APScheduler at the specified run_date. If the run_date is in the past,
+    the task is executed immediately. If it is more than `misfire_grace_time` in the past, the task is started
+    when `misfire.catch_up` says: at a random time within the spread window for `spread` tasks, and no more than
+    `misfire_catchup_rate` such tasks per second.
+
+    Parameters:
+    - task_id (int): The unique identifier of the task to be executed.
+    - run_date (datetime): The scheduled datetime for the task to be executed.
+    - misfire_policy (models.MisfirePolicy, optional): The misfire policy of the task. Defaults to None, the
+      `misfire_policy` setting.
+
+    The task is scheduled with a job in APScheduler using a DateTrigger with the specified run_date, under the ID
+    `task-<task_id>` so that scheduling the same task again replaces its job. A warning is logged if the run_date
+    is in the past. Once due, the job hands the task to `task_lanes`, which orders due tasks by priority and applies
+    the limits of their group before executing them. With the `native` timer engine the task is held by `timer_engine` instead, and only becomes an
+    APScheduler job once it is due; there too, scheduling the task again replaces its timer. Nothing is scheduled here when:
+    - the run_date is beyond the window loaded by `window_loader`; the task is scheduled when its window is loaded.
+    - the application runs in queue dispatch mode; the pending row itself is claimed from the database by a
+      replica's dispatcher once it is due.
+    """
+    if settings.dispatch_mode == "queue" or not window_loader.covers(run_date):
+        TASKS_SCHEDULED.labels("deferred").inc()
+        return
+    now = datetime.now()
+    if catch_up.is_misfired(run_date, now):
+        run_date = catch_up.defer(now, catch_up.policy_of(misfire_policy))
+    elif run_date <= now:
+        logger.warning(f"Task {task_id} scheduled time is in the past. Running immediately.")
+    if settings.timer_engine == "native":
+        timer_engine.reschedule(task_id, run_date)
+        TASKS_SCHEDULED.labels("timer_engine").inc()
+        return
+    scheduler.add_job(run_task_now, trigger=DateTrigger(run_date=run_date), args=[task_id], id=f"task-{task_id}",
+                      executor="maintenance", replace_existing=True, misfire_grace_time=None)
+    TASKS_SCHEDULED.labels("apscheduler").inc()
+
+def schedule_tasks_execution(tasks: List[models.Task]):
+    """
+    Schedules many tasks for execution in one go.
+
+    Parameters:
+    - tasks (List[models.Task]): The tasks to schedule, or rows, each with its `id`, `scheduled_time` and
+      `misfire_policy` loaded.
+
+    APScheduler wakes its scheduling thread after every `add_job` on a running scheduler. The scheduler is
+    paused while the jobs are added so that the whole batch costs a single wakeup when it is resumed.
+    """
+    with _batch_lock:
+        running = scheduler.state == STATE_RUNNING
+        if running:
+            scheduler.pause()
+        try:
+            for task in tasks:
+                schedule_task_execution(task.id, task.scheduled_time, misfire_policy=task.misfire_policy)
+        finally:
+            if running:
+                scheduler.resume()
@@ -1,7 +1,44 @@
 from pydantic import BaseModel, Field, validator
 from datetime import datetime
-from typing import Optional
-from .models import RecurrenceFrequency  # Ensure this import works as intended.
+from typing import Any, Dict, List, Optional
+from .handlers import HANDLERS, decode_payload
+from .models import MisfirePolicy, RecurrenceFrequency, TaskStatus  # Ensure this import works as intended.
+from .profiling import ProfilingMode
+from .recurrence import compile_cron
+
+def validate_cron_expression(v: Optional[str]) -> Optional[str]:
+    """
+    Validates that a cron expression can be compiled and fires at least once.
+
+    Args:
+    - v (Optional[str]): The cron expression to be validated.
+
+    Returns:
+    - Optional[str]: The validated cron expression.
+
+    Raises:
+    - ValueError: If the cron expression is invalid.
+    """
+    if v is not None:
+        compile_cron(v).next_after(datetime.now())
+    return v
+
+def validate_handler(v: Optional[str]) -> Optional[str]:
+    """
+    Validates that a handler name is registered in `handlers.HANDLERS`.
+
+    Args:
+    - v (Optional[str]): The handler name to be validated.
+
+    Returns:
+    - Optional[str]: The validated handler name.
+
+    Raises:
+    - ValueError: If no handler is registered under that name.
+    """
+    if v is not None and v not in HANDLERS:
+        raise ValueError(f"unknown handler, expected one of: {', '.join(sorted(HANDLERS))}")
+    return v
 
 class TaskBase(BaseModel):
     """
@@ -11,10 +48,22 @@ class TaskBase(BaseModel):
     - name (str): The name of the task. It should be a descriptive title of what the task involves.
     - scheduled_time (datetime): The time when the task is scheduled to be executed. It specifies when the task should start or be considered due.
     - recurrence (Optional[RecurrenceFrequency]): Specifies how often the task recurs. This can be daily, weekly, etc. If not specified, the task is considered non-recurring.
+    - cron_expression (Optional[str]): A cron expression such as "0 9 * * mon-fri" giving the times the task recurs at. It takes precedence over `recurrence`.
+    - handler (Optional[str]): Name of the registered handler that executes the task. If not specified, the default handler runs.
+    - payload (Optional[Any]): JSON value passed to the handler.
+    - priority (int): From 0 to 9. Among due tasks, higher priorities start first. Defaults to 0.
+    - group (Optional[str]): The group of the task, such as a tenant, sharing the group's concurrency and rate limits.
+    - misfire_policy (Optional[MisfirePolicy]): What happens to an occurrence that starts too late: run every missed occurrence, run once (coalesce), skip it, or spread the catch-up. If not specified, the `MISFIRE_POLICY` setting applies.
     """
     name: str = Field(..., description="The name of the task", example="Complete project report")
     scheduled_time: datetime = Field(..., description="The time when the task is scheduled to be executed", example="2023-01-01T12:00:00")
     recurrence: Optional[RecurrenceFrequency] = Field(None, description="How often the task recurs", example="daily")
+    cron_expression: Optional[str] = Field(None, max_length=255, description="Cron expression of the times the task recurs at", example="0 9 * * mon-fri")
+    handler: Optional[str] = Field(None, max_length=255, description="Name of the handler executing the task", example="http_request")
+    payload: Optional[Any] = Field(None, description="JSON value passed to the handler", example={"url": "https://example.com/hook"})
+    priority: int = Field(0, ge=0, le=9, description="Priority among due tasks, higher first", example=5)
+    group: Optional[str] = Field(None, max_length=255, description="Group sharing concurrency and rate limits", example="tenant-42")
+    misfire_policy: Optional[MisfirePolicy] = Field(None, description="What happens to an occurrence that starts too late", example="coalesce")
 
 class TaskCreate(TaskBase):
     """
@@ -25,6 +74,8 @@ class TaskCreate(TaskBase):
 
     Validators:
     - validate_scheduled_time: Ensures that the `scheduled_time` for a new task is in the future, raising a ValueError if not.
+    - validate_cron_expression: Ensures that the `cron_expression`, if given, is valid.
+    - validate_handler: Ensures that the `handler`, if given, is registered.
     """
     @validator('scheduled_time')
     def validate_scheduled_time(cls, v):
@@ -44,6 +95,9 @@ class TaskCreate(TaskBase):
             raise ValueError("scheduled_time must be in the future")
         return v
 
+    _validate_cron_expression = validator('cron_expression', allow_reuse=True)(validate_cron_expression)
+    _validate_handler = validator('handler', allow_reuse=True)(validate_handler)
+
 class TaskUpdate(BaseModel):
     """
     A model for updating an existing task, allowing partial updates.
@@ -52,10 +106,25 @@ class TaskUpdate(BaseModel):
     - name (Optional[str]): Optional new name for the task. If provided, updates the task's current name.
     - scheduled_time (Optional[datetime]): Optional new scheduled time for the task. If provided, updates the task's current scheduled time.
     - recurrence (Optional[RecurrenceFrequency]): Optional new recurrence frequency for the task. If provided, updates the task's current recurrence pattern.
+    - cron_expression (Optional[str]): Optional new cron expression for the task. If provided, updates the task's current cron expression.
+    - handler (Optional[str]): Optional new handler for the task. If provided, updates the task's current handler.
+    - payload (Optional[Any]): Optional new handler payload for the task. If provided, replaces the task's current payload.
+    - priority (Optional[int]): Optional new priority for the task. If provided, updates the task's current priority.
+    - group (Optional[str]): Optional new group for the task. If provided, updates the task's current group.
+    - misfire_policy (Optional[MisfirePolicy]): Optional new misfire policy for the task. If provided, updates the task's current misfire policy.
     """
     name: Optional[str] = Field(None, description="The new name of the task", example="Finalize project report")
     scheduled_time: Optional[datetime] = Field(None, description="The new scheduled time for the task execution", example="2023-01-02T12:00:00")
     recurrence: Optional[RecurrenceFrequency] = Field(None, description="The new recurrence frequency of the task", example="weekly")
+    cron_expression: Optional[str] = Field(None, max_length=255, description="The new cron expression of the task", example="@daily")
+    handler: Optional[str] = Field(None, max_length=255, description="The new handler of the task", example="checksum")
+    payload: Optional[Any] = Field(None, description="The new payload of the handler", example={"rounds": 10})
+    priority: Optional[int] = Field(None, ge=0, le=9, description="The new priority of the task", example=9)
+    group: Optional[str] = Field(None, max_length=255, description="The new group of the task", example="tenant-42")
+    misfire_policy: Optional[MisfirePolicy] = Field(None, description="The new misfire policy of the task", example="skip")
+
+    _validate_cron_expression = validator('cron_expression', allow_reuse=True)(validate_cron_expression)
+    _validate_handler = validator('handler', allow_reuse=True)(validate_handler)
 
 class Task(TaskBase):
     """
@@ -66,11 +135,236 @@ class Task(TaskBase):
 
     Attributes:
     - id (int): The unique identifier of the task, automatically generated upon task creation.
+    - status (TaskStatus): Whether the task is pending, running, or its latest execution succeeded, failed or was skipped.
+    - started_at (Optional[datetime]): When the latest execution of the task started.
+    - finished_at (Optional[datetime]): When the latest execution of the task finished.
 
     Configuration:
     - orm_mode (bool): Tells Pydantic to treat the SQLAlchemy models as dictionaries. This is required for data extraction from SQLAlchemy models into Pydantic models.
     """
     id: int = Field(..., description="The ID of the task")
+    status: TaskStatus = Field(TaskStatus.PENDING, description="The dispatch status of the task", example="pending")
+    started_at: Optional[datetime] = Field(None, description="When the latest execution started")
+    finished_at: Optional[datetime] = Field(None, description="When the latest execution finished")
+
+    @validator('payload', pre=True)
+    def parse_payload(cls, v):
+        """
+        Parses the payload, which the database stores as JSON text.
+
+        Args:
+        - v (Any): The stored payload.
+
+        Returns:
+        - Any: The parsed payload.
+        """
+        return decode_payload(v) if isinstance(v, str) else v
+
+    class Config:
+        orm_mode = True
+
+class TaskFilter(BaseModel):
+    """
+    A model of the query parameters filtering task listings and counts. Every given filter must match.
+
+    Attributes:
+    - scheduled_after (Optional[datetime]): Only tasks scheduled at or after this time.
+    - scheduled_before (Optional[datetime]): Only tasks scheduled before this time.
+    - recurrence (Optional[RecurrenceFrequency]): Only tasks with this recurrence frequency.
+    - status (Optional[TaskStatus]): Only tasks with this dispatch status.
+    - name_prefix (Optional[str]): Only tasks whose name starts with this text, compared with the collation of the `name` column.
+    """
+    scheduled_after: Optional[datetime] = Field(None, description="Only tasks scheduled at or after this time", example="2030-01-01T00:00:00")
+    scheduled_before: Optional[datetime] = Field(None, description="Only tasks scheduled before this time", example="2030-01-01T01:00:00")
+    recurrence: Optional[RecurrenceFrequency] = Field(None, description="Only tasks with this recurrence", example="weekly")
+    status: Optional[TaskStatus] = Field(None, description="Only tasks with this dispatch status", example="pending")
+    name_prefix: Optional[str] = Field(None, min_length=1, max_length=255, description="Only tasks whose name starts with this text", example="Report")
+
+class TaskCount(BaseModel):
+    """
+    A model representing the number of tasks matching a filter.
+
+    Attributes:
+    - count (int): The number of matching tasks.
+    - exact (bool): False when the count is an estimate from the table statistics, returned instead of counting a large number of rows.
+    """
+    count: int = Field(..., description="The number of matching tasks")
+    exact: bool = Field(..., description="Whether the count is exact or estimated from table statistics")
+
+class TaskRun(BaseModel):
+    """
+    A model representing one execution of a task, read from the run history.
+
+    Attributes:
+    - id (int): The unique identifier of the run, increasing with the time it was recorded.
+    - task_id (int): The ID of the executed task.
+    - scheduled_time (datetime): The occurrence of the task that was executed.
+    - started_at (Optional[datetime]): When the execution started.
+    - finished_at (datetime): When the execution finished.
+    - status (TaskStatus): Whether the execution succeeded, failed or was skipped.
+    - worker (Optional[str]): The worker that ran the task in queue dispatch mode.
+    - error (Optional[str]): Why the execution failed.
+
+    Configuration:
+    - orm_mode (bool): Allows building the model from `models.TaskRun` instances.
+    """
+    id: int = Field(..., description="The ID of the run")
+    task_id: int = Field(..., description="The ID of the executed task")
+    scheduled_time: datetime = Field(..., description="The occurrence that was executed")
+    started_at: Optional[datetime] = Field(None, description="When the execution started")
+    finished_at: datetime = Field(..., description="When the execution finished")
+    status: TaskStatus = Field(..., description="The outcome of the execution", example="succeeded")
+    worker: Optional[str] = Field(None, description="The worker that ran the task in queue dispatch mode")
+    error: Optional[str] = Field(None, description="Why the execution failed")
 
     class Config:
         orm_mode = True
+
+class TaskBulkError(BaseModel):
+    """
+    A model describing why one item of a bulk creation request was rejected.
+
+    Attributes:
+    - index (int): Position of the rejected item in the request body.
+    - name (Optional[str]): Name of the rejected task, if the item has one.
+    - detail (str): Human readable reason for the rejection: a duplicate name, or the fields that failed validation.
+    """
+    index: int = Field(..., description="Position of the item in the request body")
+    name: Optional[str] = Field(None, description="The name of the rejected task")
+    detail: str = Field(..., description="Why the item was rejected", example="Task name already exists")
+
+class TaskBulkResult(BaseModel):
+    """
+    A model representing the outcome of a bulk task creation request.
+
+    Attributes:
+    - created (List[Task]): The tasks that were created and scheduled.
+    - errors (List[TaskBulkError]): The items that were rejected, without failing the rest of the batch.
+    """
+    created: List[Task] = Field(default_factory=list, description="The created tasks")
+    errors: List[TaskBulkError] = Field(default_factory=list, description="Per-item errors")
+
+class TaskPage(BaseModel):
+    """
+    A model representing one page of tasks returned by keyset pagination.
+
+    Attributes:
+    - items (List[Task]): The tasks of the page, ordered by `scheduled_time` and then `id`.
+    - next_cursor (Optional[str]): Opaque cursor to pass back to fetch the next page, or None on the last page.
+    """
+    items: List[Task] = Field(default_factory=list, description="The tasks of the page")
+    next_cursor: Optional[str] = Field(None, description="Cursor of the next page, null on the last page")
+
+class CacheStats(BaseModel):
+    """
+    A model representing the counters of the task cache of this process.
+
+    Attributes:
+    - hits (int): Lookups answered from the cache.
+    - misses (int): Lookups that had to query the database.
+    - evictions (int): Entries dropped because the cache was full or the entry had expired.
+    - size (int): Entries currently held in this process.
+    """
+    hits: int = Field(..., description="Lookups answered from the cache")
+    misses: int = Field(..., description="Lookups that queried the database")
+    evictions: int = Field(..., description="Entries dropped because the cache was full or they expired")
+    size: int = Field(..., description="Entries held in this process")
+
+class ProfilingStart(BaseModel):
+    """
+    A model for opening a profiling window.
+
+    Attributes:
+    - mode (ProfilingMode): `cprofile` to run cProfile on sampled requests and executions, `sampling` to record the
+      stacks of the threads running them at a fixed interval.
+    - duration (float): Seconds after which the window closes by itself.
+    - sample_rate (float): Fraction of the requests and executions profiled in `cprofile` mode.
+    - interval_ms (float): Milliseconds between two stack samples in `sampling` mode.
+    - trace (bool): Whether executions also record their `db`, `handler` and `commit` timings.
+    """
+    mode: ProfilingMode = Field(ProfilingMode.SAMPLING, description="How requests and executions are measured", example="sampling")
+    duration: float = Field(60, gt=0, le=3600, description="Seconds after which profiling stops by itself", example=30)
+    sample_rate: float = Field(1.0, gt=0, le=1, description="Fraction of requests and executions profiled in cprofile mode", example=0.1)
+    interval_ms: float = Field(10, ge=1, le=1000, description="Milliseconds between two stack samples in sampling mode", example=10)
+    trace: bool = Field(True, description="Whether executions record per-span timings")
+
+class ProfilingStatus(BaseModel):
+    """
+    A model representing the current or last profiling window of this process.
+
+    Attributes:
+    - active (bool): Whether the window is open.
+    - mode (Optional[ProfilingMode]): The mode of the window, null if profiling never ran.
+    - started_at (Optional[datetime]): When the window opened.
+    - ends_at (Optional[datetime]): When the window closes, or closed.
+    - sample_rate (float), interval (float), trace (bool): The settings of the window, the interval in seconds.
+    - requests_profiled (int), executions_profiled (int): Requests and executions measured so far.
+    - samples (int): Stacks recorded in `sampling` mode.
+    - traces (int): Execution traces held.
+    """
+    active: bool
+    mode: Optional[ProfilingMode] = None
+    started_at: Optional[datetime] = None
+    ends_at: Optional[datetime] = None
+    sample_rate: float
+    interval: float
+    trace: bool
+    requests_profiled: int
+    executions_profiled: int
+    samples: int
+    traces: int
+
+class ExecutionTrace(BaseModel):
+    """
+    A model representing where the time of one profiled task execution went.
+
+    Attributes:
+    - task_id (int): The executed task.
+    - started_at (datetime): When the execution started.
+    - duration (float): Seconds spent in the execution.
+    - spans (Dict[str, float]): Seconds spent in database queries (`db`), in the handler (`handler`) and handing the
+      outcome to the result writer (`commit`).
+    - db_queries (int): Number of database operations.
+    """
+    task_id: int
+    started_at: datetime
+    duration: float
+    spans: Dict[str, float]
+    db_queries: int
+
+class AllocationStart(BaseModel):
+    """
+    A model for starting to trace memory allocations.
+
+    Attributes:
+    - frames (int): Frames of traceback stored per allocation. More frames cost more memory and time.
+    """
+    frames: int = Field(10, ge=1, le=100, description="Frames of traceback stored per allocation", example=10)
+
+class AllocationSite(BaseModel):
+    """
+    A model representing the allocations of one line, or one traceback, compared with the previous snapshot.
+
+    Attributes:
+    - location (str): `file:line` of the allocation, or the frames of its traceback from the oldest, separated by `;`.
+    - size (int), count (int): Bytes and blocks currently allocated there.
+    - size_diff (int), count_diff (int): Their growth since the previous snapshot.
+    """
+    location: str
+    size: int
+    count: int
+    size_diff: int
+    count_diff: int
+
+class AllocationReport(BaseModel):
+    """
+    A model representing a memory snapshot compared with the previous one.
+
+    Attributes:
+    - current (int): Bytes currently allocated by traced allocations.
+    - peak (int): Peak of `current` since tracing started.
+    - top (List[AllocationSite]): The sites whose allocations changed the most.
+    """
+    current: int
+    peak: int
+    top: List[AllocationSite]
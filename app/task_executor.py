@@ -1,10 +1,21 @@
+import threading
 import time
-import random
+from concurrent.futures import CancelledError, Future
 from contextlib import contextmanager
-from datetime import datetime, timedelta
-from .crud import get_task_by_id, update_task, create_task
+from datetime import datetime
+from functools import partial
+from typing import Iterable, List, Optional
+from . import crud
+from .config import settings
+from .crud import get_task_by_id, start_task
 from .database import SessionLocal
-from .models import RecurrenceFrequency
+from .handlers import decode_payload, get_handler, handler_runtime
+from .metrics import DISPATCH_LAG, RUN_DURATION, TASKS_MISFIRED
+from .misfire import catch_up
+from .models import MisfirePolicy, RecurrenceFrequency, TaskStatus
+from .profiling import profile_execution, profiler
+from .recurrence import calculate_next_run, next_run_after
+from .result_writer import TaskResult, result_writer
 import logging
 
 # Configure logging
@@ -21,81 +32,188 @@ def get_db_session():
     finally:
         db.close()
 
-def calculate_next_run(scheduled_time, recurrence):
+# Tasks executing in this process, whose leases are renewed by `maintain_leases`
+_executing = set()
+_executing_lock = threading.Lock()
+
+def held_task_ids() -> List[int]:
+    """IDs of the tasks leased by this process: those executing, and those whose result is not written yet."""
+    with _executing_lock:
+        executing = list(_executing)
+    return executing + result_writer.pending_task_ids()
+
+def maintain_leases(worker_id: str, lease_seconds: int, task_ids: Iterable[int] = (), stale_owner: Optional[str] = None) -> list:
     """
-    Calculates the next scheduled time for a task based on its recurrence frequency.
+    Renews the leases of the tasks held by this process and puts the tasks whose lease expired back to PENDING.
 
     Parameters:
-    - scheduled_time (datetime): The initial scheduled time of the task.
-    - recurrence (RecurrenceFrequency): The recurrence frequency of the task, which determines
-      how often the task recurs. The `RecurrenceFrequency` is an enumeration that includes values like
-      DAILY, WEEKLY, BIWEEKLY, MONTHLY, QUARTERLY, and YEARLY.
+    - worker_id (str): Owner of the leases of this process.
+    - lease_seconds (int): New validity of the leases.
+    - task_ids (Iterable[int], optional): Tasks held besides `held_task_ids`, e.g. claimed but not started yet.
+    - stale_owner (str, optional): Passed to `crud.reclaim_expired_leases`, at startup, to reclaim the tasks left
+      RUNNING by a previous run of this worker.
 
     Returns:
-    - datetime: The next scheduled time of the task. Returns None if the recurrence frequency
-      is not recognized, which should not happen with well-defined enums.
-
-    Examples:
-    - If the task is scheduled for 2023-01-01 and has a DAILY recurrence, the next scheduled
-      time will be 2023-01-02.
-    - If the task is scheduled for 2023-01-01 and has a WEEKLY recurrence, the next scheduled
-      time will be 2023-01-08.
+    - list: The reclaimed tasks, as returned by `crud.reclaim_expired_leases`.
     """
-    if recurrence == RecurrenceFrequency.DAILY:
-        return scheduled_time + timedelta(days=1)
-    elif recurrence == RecurrenceFrequency.WEEKLY:
-        return scheduled_time + timedelta(weeks=1)
-    elif recurrence == RecurrenceFrequency.BIWEEKLY:
-        return scheduled_time + timedelta(weeks=2)
-    elif recurrence == RecurrenceFrequency.MONTHLY:
-        return scheduled_time + timedelta(weeks=4)
-    elif recurrence == RecurrenceFrequency.QUARTERLY:
-        return scheduled_time + timedelta(weeks=13)
-    elif recurrence == RecurrenceFrequency.YEARLY:
-        return scheduled_time + timedelta(weeks=52)
-    else:  # Default case, should not occur for well-defined enums
-        return None
+    held = set(task_ids)
+    held.update(held_task_ids())
+    with get_db_session() as db:
+        crud.renew_leases(db=db, worker_id=worker_id, task_ids=list(held), lease_seconds=lease_seconds)
+        reclaimed = crud.reclaim_expired_leases(db=db, stale_owner=stale_owner)
+    if reclaimed:
+        logger.warning(f"Reclaimed {len(reclaimed)} tasks with expired leases.")
+    return reclaimed
 
-def execute_task(task_id: int):
+def schedule_next_run(task_id: int, next_run: datetime, misfire_policy: MisfirePolicy = None):
+    """Schedules the next occurrence of a recurring task, once its row has been moved back to PENDING."""
+    # Imported here because the scheduler module imports this one
+    from .scheduler import schedule_task_execution
+    schedule_task_execution(task_id, next_run, misfire_policy=misfire_policy)
+    logger.info(f"Scheduled next run for task {task_id} at {next_run}.")
+
+@profile_execution
+def execute_task(task_id: int, worker_id: str = None) -> Optional[Future]:
     """
-    Simulates the execution of a task by sleeping for a random amount of time and then
-    updating the task's details to indicate it has been executed. If the task is recurrent,
-    it schedules the next occurrence.
+    Executes a task by running its handler with its payload, recording its progress in the task's
+    `status`, `started_at` and `finished_at` columns. If the task is recurrent, it advances the task
+    to its next occurrence.
 
-    This function is meant to simulate work being done for the task. It sleeps for a random
-    duration to represent the task's execution time. After "executing" the task, it updates
-    the task's name to include the execution time and handles the scheduling of the next
-    occurrence if the task is recurrent.
+    The handler is looked up by the task's `handler` name in the registry of `handlers` and runs
+    where its execution class says (this thread, the process pool or the handler event loop), see
+    `handlers.HandlerRuntime`. Tasks without a handler run the default `simulate` handler, which
+    sleeps for a random duration to represent the task's execution time.
 
     Parameters:
     - task_id (int): The unique identifier of the task to execute.
+    - worker_id (str, optional): Set by the queue dispatcher, which has already claimed the task
+      (moved it to RUNNING) under a lease owned by `worker_id`.
+
+    Returns:
+    - Future or None: For a CPU-bound or I/O-bound handler, which keeps running after this function returns, a
+      future resolved once its outcome is handed to `result_writer`, with the exception of the handler if it
+      raised. None when the execution is over, including when nothing was executed.
+
+    Without a `worker_id` the task is first moved from PENDING to RUNNING with `start_task`, under a lease owned by
+    this process (the `worker_id` setting) for `dispatch_lease_seconds`. Either way the lease is renewed by
+    `maintain_leases` until the outcome is written, so a task left RUNNING by a crash is run again once its lease
+    expires. If the transition to RUNNING does not apply (the task does not exist, is already running or finished,
+    or is not due), nothing is executed, so a task fired twice only runs once. A one-off task then ends SUCCEEDED, or
+    FAILED if the execution raised. A recurring task stays a single row: the statement recording the run
+    also moves its `scheduled_time` to the next occurrence and puts it back to PENDING, and the next
+    occurrence is scheduled.
 
-    The function fetches the task by its ID from the database. If the task is found, it proceeds
-    to simulate execution. If the task is marked for recurrence, it calculates the next run
-    time and creates a new task entry for it. If the task is not found, it logs a warning.
+    An occurrence starting more than `misfire_grace_time` seconds late has misfired, and the misfire policy of the
+    task applies (see `misfire.CatchUp`): unless it is `RUN_ALL`, a recurring task moves on to its next occurrence
+    after now instead of replaying the missed ones, and with `SKIP` the handler is not run and the occurrence is
+    recorded as a skipped run.
+
+    The outcome is handed to `result_writer`, which records it together with the outcomes of other tasks
+    finishing around the same time, and appends it to the `task_runs` history with the error of a failed
+    execution. The next occurrence is only scheduled once the outcome is written.
+
+    While a profiling window is open, executions are profiled and the time spent in database queries, the handler
+    and the hand-off of the outcome (`db`, `handler` and `commit` spans) is traced, see `profiling.Profiler`. The
+    `handler` span of a CPU-bound or I/O-bound handler is added to the trace when the handler finishes.
 
     Note: This function uses a context manager `get_db_session` to manage the database session
     lifecycle, ensuring the session is properly closed after use.
-
-    Examples:
-    - For a non-recurrent task, it simply updates the task's name post-execution.
-    - For a recurrent task, it updates the task's name and creates a new task for the next occurrence.
     """
     with get_db_session() as db:
-        task = get_task_by_id(db=db, task_id=task_id)
-        if task:
-            sleep_time = random.randint(1, 10)
-            logger.info(f"Executing task {task.id} ('{task.name}'). Sleeping for {sleep_time} seconds.")
-            time.sleep(sleep_time)
-
-            executed_name = f"{task.name} (Executed at {datetime.now()})"
-            update_task(db=db, task_id=task.id, new_name=executed_name)
-            
-            if task.recurrence and task.recurrence != RecurrenceFrequency.ONCE:
-                next_run = calculate_next_run(task.scheduled_time, task.recurrence)
-                if next_run:
-                    new_task_name = f"Recurring: {task.name}"
-                    create_task(db=db, task_name=new_task_name, scheduled_time=next_run, recurrence=task.recurrence)
-                    logger.info(f"Scheduled next run for task {task.id} ('{task.name}') at {next_run}.")
+        if worker_id is None:
+            worker_id = settings.worker_id
+            task = start_task(db=db, task_id=task_id, worker_id=worker_id, lease_seconds=settings.dispatch_lease_seconds)
         else:
-            logger.warning(f"Task {task_id} not found.")
+            task = get_task_by_id(db=db, task_id=task_id)
+    if not task:
+        logger.warning(f"Task {task_id} not found or not ready to run.")
+        return None
+    with _executing_lock:
+        _executing.add(task_id)
+    try:
+        pending = _run(task, worker_id)
+    except BaseException:
+        _release(task_id)
+        raise
+    if pending is None:
+        _release(task_id)
+    return pending
+
+def _release(task_id: int):
+    # The outcome was handed to `result_writer` by now, which keeps the lease held until it is written
+    with _executing_lock:
+        _executing.discard(task_id)
+
+def _run(task, worker_id: str) -> Optional[Future]:
+    task_id = task.id
+    now = datetime.now()
+    lag = max((now - task.scheduled_time).total_seconds(), 0)
+    DISPATCH_LAG.observe(lag)
+    policy = catch_up.policy_of(task.misfire_policy)
+    misfired = catch_up.is_misfired(task.scheduled_time, now)
+    if misfired:
+        TASKS_MISFIRED.labels(policy.value).inc()
+
+    next_run = None
+    if task.cron_expression or (task.recurrence and task.recurrence != RecurrenceFrequency.ONCE):
+        if misfired and policy != MisfirePolicy.RUN_ALL:
+            # The occurrences missed in between are not replayed
+            next_run = next_run_after(task.scheduled_time, task.recurrence, now, task.cron_expression, task.anchor_day)
+        else:
+            next_run = calculate_next_run(task.scheduled_time, task.recurrence, task.cron_expression, task.anchor_day)
+    on_written = partial(schedule_next_run, task_id, next_run, task.misfire_policy) if next_run else None
+    result = partial(TaskResult, task_id=task_id, worker_id=worker_id, next_scheduled_time=next_run, on_written=on_written,
+                     scheduled_time=task.scheduled_time, started_at=task.started_at or now)
+
+    if misfired and policy == MisfirePolicy.SKIP:
+        logger.info(f"Skipping task {task.id} ('{task.name}'), {lag:.0f}s late.")
+        result_writer.submit(result(status=TaskStatus.SKIPPED, finished_at=datetime.now(),
+                                    error=f"Skipped: started {lag:.0f}s late, beyond the misfire grace time"))
+        return None
+
+    start = time.perf_counter()
+
+    def finish(status: TaskStatus, error: Optional[str] = None):
+        RUN_DURATION.labels(status.value).observe(time.perf_counter() - start)
+        with profiler.span("commit"):
+            result_writer.submit(result(status=status, finished_at=datetime.now(), error=error))
+
+    try:
+        handler = get_handler(task.handler)
+        logger.info(f"Executing task {task.id} ('{task.name}') with handler {handler.name}.")
+        payload = decode_payload(task.payload)
+        if handler_runtime.offloaded(handler):
+            future = handler_runtime.submit(handler, payload)
+        else:
+            with profiler.span("handler"):
+                handler_runtime.run(handler, payload)
+            future = None
+    except Exception as e:
+        finish(TaskStatus.FAILED, f"{type(e).__name__}: {e}")
+        raise
+    if future is None:
+        finish(TaskStatus.SUCCEEDED)
+        return None
+
+    # The handler runs on without this worker thread, and is finished by the thread that completes it
+    trace = profiler.current_trace()
+    pending = Future()
+
+    def on_done(future: Future):
+        error = CancelledError() if future.cancelled() else future.exception()
+        if trace is not None:
+            trace.add("handler", time.perf_counter() - start)
+        try:
+            finish(TaskStatus.SUCCEEDED if error is None else TaskStatus.FAILED,
+                   None if error is None else f"{type(error).__name__}: {error}")
+        except Exception as e:
+            logger.error(f"Failed to record the outcome of task {task_id}: {e}")
+        finally:
+            _release(task_id)
+        if error is None:
+            pending.set_result(None)
+        else:
+            pending.set_exception(error)
+
+    future.add_done_callback(on_done)
+    return pending
@@ -0,0 +1,170 @@
+import heapq
+import math
+import threading
+import time
+from array import array
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class _Bucket:
+    """The timers falling in one second, stored column-wise in typed arrays (24 bytes per timer)."""
+    __slots__ = ("run_at_ms", "task_ids", "generations")
+
+    def __init__(self):
+        self.run_at_ms = array("q")
+        self.task_ids = array("q")
+        self.generations = array("L")
+
+class TimerEngine:
+    """
+    A compact in-process timer queue firing `callback(task_id)` when a task is due, for millions of pending tasks.
+
+    Timers are kept in a bucketed timing wheel: one `_Bucket` per second of run time, holding only
+    `(run_at, task_id, generation)` in typed arrays, plus a heap of the bucket seconds. Scheduling a timer is an
+    append to its bucket (and a heap push for a new second). When a second comes due its bucket is moved into a
+    small heap ordered by millisecond, from which a single dispatcher thread fires the timers.
+
+    Cancellation is O(1) and lazy: `cancel` bumps the generation of the task, and entries recorded with an older
+    generation are discarded when they come due. Only tasks that were cancelled or rescheduled have a generation
+    entry, and the entries of tasks without any timer left are dropped by a sweep over the timers once their number
+    doubles (and exceeds half the timers held), so memory stays proportional to the number of pending timers.
+
+    Parameters:
+    - callback (Callable[[int], None]): Called with the task ID of every due timer, on the dispatcher thread. It
+      should hand the work off (for example to an executor) rather than run it.
+    """
+
+    # Number of generation entries below which they are never swept
+    MIN_SWEEP = 4096
+
+    def __init__(self, callback: Callable[[int], None]):
+        self.callback = callback
+        self._buckets: Dict[int, _Bucket] = {}
+        self._seconds: List[int] = []
+        self._ready: List[Tuple[int, int, int]] = []
+        self._promoted_until = -1
+        self._generations: Dict[int, int] = {}
+        self._sweep_above = self.MIN_SWEEP
+        self._size = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def __len__(self) -> int:
+        """Number of timers held, including cancelled ones not yet discarded."""
+        return self._size
+
+    def schedule(self, task_id: int, run_at: datetime):
+        """
+        Adds a timer firing `task_id` at `run_at`. Timers in the past fire immediately.
+
+        Scheduling a task that already has a pending timer adds a second one; use `reschedule` to move it.
+        """
+        # Rounded up, so that a timer never fires before `run_at`
+        run_at_ms = math.ceil(run_at.timestamp() * 1000)
+        second = run_at_ms // 1000
+        with self._condition:
+            generation = self._generations.get(task_id, 0)
+            self._size += 1
+            if second <= self._promoted_until:
+                heapq.heappush(self._ready, (run_at_ms, task_id, generation))
+                if self._ready[0][0] == run_at_ms:
+                    self._condition.notify()
+                return
+            bucket = self._buckets.get(second)
+            if bucket is None:
+                bucket = self._buckets[second] = _Bucket()
+                heapq.heappush(self._seconds, second)
+                if self._seconds[0] == second:
+                    self._condition.notify()
+            bucket.run_at_ms.append(run_at_ms)
+            bucket.task_ids.append(task_id)
+            bucket.generations.append(generation)
+
+    def cancel(self, task_id: int):
+        """Cancels every pending timer of `task_id`."""
+        with self._condition:
+            self._generations[task_id] = self._generations.get(task_id, 0) + 1
+            if len(self._generations) > self._sweep_above:
+                self._sweep_generations()
+
+    def _sweep_generations(self):
+        # A generation entry can only be dropped once no timer of its task is left, whatever its generation:
+        # a timer recorded with an older generation would otherwise match the default generation 0 again.
+        live = set()
+        for bucket in self._buckets.values():
+            live.update(task_id for task_id in bucket.task_ids if task_id in self._generations)
+        live.update(task_id for _, task_id, _ in self._ready if task_id in self._generations)
+        for task_id in [task_id for task_id in self._generations if task_id not in live]:
+            del self._generations[task_id]
+        # Sweeping costs a pass over the timers, so wait for enough new entries to pay for it
+        self._sweep_above = max(self.MIN_SWEEP, self._size // 2, 2 * len(self._generations))
+
+    def reschedule(self, task_id: int, run_at: datetime):
+        """Cancels the pending timers of `task_id` and schedules a new one at `run_at`."""
+        with self._condition:
+            self.cancel(task_id)
+            self.schedule(task_id, run_at)
+
+    def start(self):
+        """Starts the dispatcher thread."""
+        with self._condition:
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="timer-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the dispatcher thread. Pending timers are kept."""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread:
+            self._thread.join()
+
+    def _promote(self, now_second: int):
+        # Move every bucket whose second has started into the millisecond-ordered ready heap
+        while self._seconds and self._seconds[0] <= now_second:
+            second = heapq.heappop(self._seconds)
+            bucket = self._buckets.pop(second)
+            self._ready.extend(zip(bucket.run_at_ms, bucket.task_ids, bucket.generations))
+            self._promoted_until = max(self._promoted_until, second)
+        heapq.heapify(self._ready)
+
+    def _take_due(self, now_ms: int) -> List[int]:
+        due = []
+        while self._ready and self._ready[0][0] <= now_ms:
+            _, task_id, generation = heapq.heappop(self._ready)
+            self._size -= 1
+            if generation == self._generations.get(task_id, 0):
+                due.append(task_id)
+        if self._size == 0:
+            # Without any timer left, no generation is needed to tell stale timers apart
+            self._generations.clear()
+        return due
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._running:
+                    return
+                now_ms = int(time.time() * 1000)
+                if self._seconds and self._seconds[0] <= now_ms // 1000:
+                    self._promote(now_ms // 1000)
+                due = self._take_due(now_ms)
+                if not due:
+                    next_ms = None
+                    if self._ready:
+                        next_ms = self._ready[0][0]
+                    if self._seconds and (next_ms is None or self._seconds[0] * 1000 < next_ms):
+                        next_ms = self._seconds[0] * 1000
+                    timeout = None if next_ms is None else max(next_ms - now_ms, 0) / 1000
+                    self._condition.wait(timeout)
+                    continue
+            for task_id in due:
+                try:
+                    self.callback(task_id)
+                except Exception as e:
+                    logger.error(f"Timer callback failed for task {task_id}: {e}")
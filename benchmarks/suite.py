@@ -0,0 +1,223 @@
+"""
+Load and latency benchmark suite for the API and the scheduler.
+
+Runs `app.main:app` in-process (with its startup and shutdown events) against a scratch database, by default a
+temporary SQLite file standing in for MariaDB, and measures:
+
+- `post`: throughput of `POST /api/tasks/`.
+- `list`: latency of `GET /api/tasks/` (first page and random offsets) with 10k, 100k and 1M rows in the table.
+- `lookup`: latency of `GET /api/tasks/{task_id}` on random IDs.
+- `dispatch_lag`: distribution of `started_at - scheduled_time` when N tasks come due at the same instant. The
+  simulated work of the default `simulate` handler is disabled so that the lag only
+  reflects scheduling and database overhead.
+
+Results are printed as JSON, and written to `--output` if given, so that runs can be compared between commits.
+With `--baseline`, every metric is compared with a previous result file and the run fails (exit status 1) when a
+metric got worse by more than `--fail-threshold` percent. Metrics ending in `_per_second` are better when higher,
+metrics ending in `_ms` are better when lower.
+
+Usage:
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --sizes 10000 100000 --baseline results.json --fail-threshold 10
+
+Pass `--database-url` to run against a real (empty, scratch) database instead of SQLite; the seeded rows are not
+removed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+
+
+def percentiles(samples_ms):
+    samples_ms = sorted(samples_ms)
+    return {
+        "p50_ms": round(statistics.median(samples_ms), 3),
+        "p99_ms": round(samples_ms[max(int(len(samples_ms) * 0.99) - 1, 0)], 3),
+        "max_ms": round(samples_ms[-1], 3),
+    }
+
+
+def timed_requests(client, paths):
+    samples = []
+    for path in paths:
+        started = time.perf_counter()
+        response = client.get(path)
+        samples.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+    return percentiles(samples)
+
+
+def seed_tasks(engine, models, start, end, chunk_size=10_000):
+    """Inserts tasks `seed-<start>` to `seed-<end - 1>`, scheduled far enough ahead that they are never loaded."""
+    base = datetime(2100, 1, 1)
+    with engine.begin() as connection:
+        for chunk_start in range(start, end, chunk_size):
+            connection.execute(models.Task.__table__.insert(), [
+                {"name": f"seed-{i}", "scheduled_time": base + timedelta(seconds=i), "status": models.TaskStatus.PENDING}
+                for i in range(chunk_start, min(chunk_start + chunk_size, end))
+            ])
+
+
+def bench_post(client, count):
+    scheduled_time = (datetime.now() + timedelta(days=365)).isoformat()
+    started = time.perf_counter()
+    for i in range(count):
+        client.post("/api/tasks/", json={"name": f"post-{i}", "scheduled_time": scheduled_time}).raise_for_status()
+    elapsed = time.perf_counter() - started
+    return {"requests": count, "requests_per_second": round(count / elapsed, 1)}
+
+
+def bench_list(client, rng, rows, samples):
+    return {
+        "first_page": timed_requests(client, ["/api/tasks/?skip=0&limit=100"] * samples),
+        "random_offset": timed_requests(client, [f"/api/tasks/?skip={rng.randrange(rows)}&limit=100" for _ in range(samples)]),
+    }
+
+
+def bench_lookup(client, rng, max_id, samples):
+    return timed_requests(client, [f"/api/tasks/{rng.randint(1, max_id)}" for _ in range(samples)])
+
+
+def bench_dispatch_lag(crud, models, schemas, scheduler_module, task_executor, count, delay, timeout):
+    scheduled_time = datetime.now() + timedelta(seconds=delay)
+    tasks = [schemas.TaskCreate(name=f"due-{i}", scheduled_time=scheduled_time) for i in range(count)]
+    with task_executor.get_db_session() as db:
+        created, _ = crud.create_tasks(db=db, tasks=tasks)
+    scheduler_module.schedule_tasks_execution(created)
+    task_ids = [task.id for task in created]
+
+    deadline = time.monotonic() + delay + timeout
+    rows = []
+    while time.monotonic() < deadline:
+        time.sleep(0.5)
+        with task_executor.get_db_session() as db:
+            rows = db.query(models.Task.scheduled_time, models.Task.started_at).filter(
+                models.Task.id.in_(task_ids), models.Task.finished_at.is_not(None)).all()
+        if len(rows) == count:
+            break
+    lags = [(row.started_at - row.scheduled_time).total_seconds() * 1000 for row in rows]
+    result = {"tasks": count, "completed": len(rows)}
+    if lags:
+        result.update(percentiles(lags))
+    return result
+
+
+def run(args):
+    # The application reads its database URL when imported
+    if args.database_url:
+        os.environ["MARIADB_URI"] = args.database_url
+    else:
+        os.environ["MARIADB_URI"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+    os.environ.setdefault("DISPATCH_MODE", "scheduler")
+
+    from fastapi.testclient import TestClient
+    from app import crud, handlers, models, schemas, task_executor
+    from app import scheduler as scheduler_module
+    from app.database import get_engine
+    from app.main import app
+
+    engine = get_engine()
+    models.Base.metadata.create_all(bind=engine)
+    rng = random.Random(args.seed)
+    results = {}
+    with mock.patch.object(handlers.random, "randint", return_value=0), TestClient(app) as client:
+        results["post"] = bench_post(client, args.posts)
+        results["list"] = {}
+        seeded = 0
+        for size in sorted(args.sizes):
+            seed_tasks(engine, models, seeded, size)
+            seeded = size
+            results["list"][str(size)] = bench_list(client, rng, size, args.samples)
+        results["lookup"] = bench_lookup(client, rng, seeded, args.samples)
+        results["dispatch_lag"] = bench_dispatch_lag(crud, models, schemas, scheduler_module, task_executor,
+                                                     args.due_tasks, args.due_delay, args.timeout)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "database": engine.dialect.name,
+            "sizes": sorted(args.sizes),
+        },
+        "results": results,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=""):
+    metrics = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            metrics.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and (key.endswith("_per_second") or key.endswith("_ms")):
+            metrics[name] = value
+    return metrics
+
+
+def compare(current, baseline, threshold):
+    """Returns one entry per metric present in both runs, flagging those worse than `threshold` percent."""
+    current_metrics = flatten(current["results"])
+    baseline_metrics = flatten(baseline["results"])
+    comparison = []
+    for name, value in sorted(current_metrics.items()):
+        previous = baseline_metrics.get(name)
+        if not previous:
+            continue
+        change = (value - previous) / previous * 100
+        worse = -change if name.endswith("_per_second") else change
+        comparison.append({
+            "metric": name, "baseline": previous, "current": value, "change_percent": round(change, 1),
+            "regression": threshold is not None and worse > threshold,
+        })
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="table sizes for the list benchmark")
+    parser.add_argument("--posts", type=int, default=1000, help="POST requests for the throughput benchmark")
+    parser.add_argument("--samples", type=int, default=500, help="requests per latency measurement")
+    parser.add_argument("--due-tasks", type=int, default=1000, help="tasks coming due at the same instant")
+    parser.add_argument("--due-delay", type=float, default=5.0, help="seconds from creation until the tasks are due")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for the due tasks to finish")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random offsets and IDs")
+    parser.add_argument("--database-url", help="scratch database to use instead of a temporary SQLite file")
+    parser.add_argument("--output", help="file to write the results to")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument("--fail-threshold", type=float, help="fail when a metric is worse than the baseline by more than this percentage")
+    args = parser.parse_args()
+
+    report = run(args)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report, json.load(f), args.fail_threshold)
+        regressions = [entry for entry in report["comparison"] if entry["regression"]]
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    if regressions:
+        print(f"{len(regressions)} metrics regressed by more than {args.fail_threshold}%: "
+              f"{', '.join(entry['metric'] for entry in regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Micro-benchmark of the native timer engine against the APScheduler job store.
+
+Measures, for each implementation, the time and memory needed to hold N pending tasks, the cost of cancelling
+them, and the firing jitter (actual minus scheduled time) of timers coming due over one second.
+
+Usage:
+    python -m benchmarks.timer_engine --tasks 1000000 --apscheduler-tasks 100000
+"""
+import argparse
+import gc
+import json
+import statistics
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.date import DateTrigger
+
+from app.timer_engine import TimerEngine
+
+
+def _noop(task_id):
+    pass
+
+
+def _percentiles(samples_ms):
+    samples_ms = sorted(samples_ms)
+    return {
+        "p50_ms": round(statistics.median(samples_ms), 3),
+        "p99_ms": round(samples_ms[int(len(samples_ms) * 0.99) - 1], 3),
+        "max_ms": round(samples_ms[-1], 3),
+    }
+
+
+def _measure(build, count):
+    gc.collect()
+    tracemalloc.start()
+    holder = build(count)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del holder
+    gc.collect()
+    started = time.perf_counter()
+    holder = build(count)
+    elapsed = time.perf_counter() - started
+    return holder, {
+        "tasks": count,
+        "schedule_per_second": round(count / elapsed),
+        "bytes_per_task": round(memory / count, 1),
+    }
+
+
+def build_engine(count):
+    engine = TimerEngine(callback=_noop)
+    base = datetime.now() + timedelta(days=1)
+    for task_id in range(count):
+        engine.schedule(task_id, base + timedelta(milliseconds=task_id))
+    return engine
+
+
+def build_apscheduler(count):
+    scheduler = BackgroundScheduler()
+    scheduler.start(paused=True)
+    base = datetime.now() + timedelta(days=1)
+    for task_id in range(count):
+        scheduler.add_job(_noop, trigger=DateTrigger(run_date=base + timedelta(milliseconds=task_id)), args=[task_id], id=f"task-{task_id}")
+    return scheduler
+
+
+def bench_engine(count, jitter_tasks):
+    engine, result = _measure(build_engine, count)
+    started = time.perf_counter()
+    for task_id in range(count):
+        engine.cancel(task_id)
+    result["cancel_per_second"] = round(count / (time.perf_counter() - started))
+    del engine
+
+    lags = []
+    done = threading.Event()
+    expected = {}
+
+    def record(task_id):
+        lags.append((time.time() - expected[task_id]) * 1000)
+        if len(lags) == jitter_tasks:
+            done.set()
+
+    engine = TimerEngine(callback=record)
+    engine.start()
+    base = datetime.now() + timedelta(seconds=1)
+    for task_id in range(jitter_tasks):
+        run_at = base + timedelta(microseconds=task_id * 1_000_000 // jitter_tasks)
+        expected[task_id] = run_at.timestamp()
+        engine.schedule(task_id, run_at)
+    done.wait(30)
+    engine.stop()
+    result["jitter"] = _percentiles(lags)
+    return result
+
+
+def bench_apscheduler(count, jitter_tasks):
+    scheduler, result = _measure(build_apscheduler, count)
+    started = time.perf_counter()
+    for task_id in range(count):
+        scheduler.remove_job(f"task-{task_id}")
+    result["cancel_per_second"] = round(count / (time.perf_counter() - started))
+    scheduler.shutdown(wait=False)
+
+    lags = []
+    done = threading.Event()
+
+    def record(expected):
+        lags.append((time.time() - expected) * 1000)
+        if len(lags) == jitter_tasks:
+            done.set()
+
+    scheduler = BackgroundScheduler(job_defaults={"misfire_grace_time": None})
+    scheduler.start()
+    base = datetime.now() + timedelta(seconds=1)
+    for task_id in range(jitter_tasks):
+        run_at = base + timedelta(microseconds=task_id * 1_000_000 // jitter_tasks)
+        scheduler.add_job(record, trigger=DateTrigger(run_date=run_at), args=[run_at.timestamp()])
+    done.wait(30)
+    scheduler.shutdown(wait=False)
+    result["jitter"] = _percentiles(lags)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=1_000_000, help="pending tasks held by the timer engine")
+    parser.add_argument("--apscheduler-tasks", type=int, default=100_000, help="pending jobs held by APScheduler")
+    parser.add_argument("--jitter-tasks", type=int, default=2000, help="timers fired over one second to measure jitter")
+    args = parser.parse_args()
+    results = {
+        "timer_engine": bench_engine(args.tasks, args.jitter_tasks),
+        "apscheduler": bench_apscheduler(args.apscheduler_tasks, args.jitter_tasks),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,13 @@
 # Load environment variables from .env file
 source /app/.env
 
+if [[ "${MARIADB_URI}" == sqlite* ]]; then
+    echo "Using the embedded SQLite database, creating or migrating its schema..."
+    python -c "from app.models import init_schema; init_schema()"
+    echo "Starting the application..."
+    exec "$@"
+fi
+
 echo "Waiting for DB to be ready..."
 until mariadb -h db -u${MARIADB_USER} -p${MARIADB_PASSWORD} -e 'SELECT 1' > /dev/null 2>&1; do
     sleep 1
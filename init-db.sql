@@ -5,7 +5,36 @@ CREATE TABLE IF NOT EXISTS tasks (
   id INT AUTO_INCREMENT PRIMARY KEY,
   name VARCHAR(255) NOT NULL UNIQUE,
   scheduled_time DATETIME NOT NULL,
-  recurrence ENUM('ONCE', 'DAILY', 'WEEKLY', 'BIWEEKLY', 'MONTHLY', 'QUARTERLY', 'YEARLY') NULL
+  anchor_day SMALLINT NULL,
+  recurrence ENUM('ONCE', 'DAILY', 'WEEKLY', 'BIWEEKLY', 'MONTHLY', 'QUARTERLY', 'YEARLY') NULL,
+  cron_expression VARCHAR(255) NULL,
+  handler VARCHAR(255) NULL,
+  payload TEXT NULL,
+  priority SMALLINT NOT NULL DEFAULT 0,
+  `group` VARCHAR(255) NULL,
+  misfire_policy ENUM('RUN_ALL', 'COALESCE', 'SKIP', 'SPREAD') NULL,
+  status ENUM('PENDING', 'RUNNING', 'SUCCEEDED', 'FAILED', 'SKIPPED') NOT NULL DEFAULT 'PENDING',
+  lease_owner VARCHAR(255) NULL,
+  lease_expires_at DATETIME NULL,
+  started_at DATETIME NULL,
+  finished_at DATETIME NULL,
+  INDEX ix_tasks_scheduled_time (scheduled_time),
+  INDEX ix_tasks_status_scheduled_time (status, scheduled_time),
+  INDEX ix_tasks_status_priority_scheduled_time (status, priority, scheduled_time),
+  INDEX ix_tasks_recurrence_scheduled_time (recurrence, scheduled_time)
+);
+
+CREATE TABLE IF NOT EXISTS task_runs (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  task_id INT NOT NULL,
+  scheduled_time DATETIME NOT NULL,
+  started_at DATETIME NULL,
+  finished_at DATETIME NOT NULL,
+  status ENUM('PENDING', 'RUNNING', 'SUCCEEDED', 'FAILED', 'SKIPPED') NOT NULL,
+  worker VARCHAR(255) NULL,
+  error TEXT NULL,
+  INDEX ix_task_runs_task_id_id (task_id, id),
+  INDEX ix_task_runs_finished_at (finished_at)
 );
 
 -- Insert sample data if not exists
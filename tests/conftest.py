@@ -0,0 +1,64 @@
+import os
+import tempfile
+
+# The settings are read when `app.config` is first imported, so the test database is chosen before importing the app.
+# Queue dispatch mode keeps the API from registering jobs with the scheduler, which the tests do not start.
+_tmpdir = tempfile.TemporaryDirectory(prefix="taskscheduler-tests-")
+os.environ["MARIADB_URI"] = f"sqlite:///{os.path.join(_tmpdir.name, 'tasks.db')}"
+os.environ.pop("MARIADB_ASYNC_URI", None)
+os.environ["DISPATCH_MODE"] = "queue"
+os.environ["TASK_CACHE_BACKEND"] = "local"
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+
+from app import models
+from app.cache import task_cache
+from app.database import SessionLocal
+from app.handlers import handler
+from app.main import app
+
+
+@handler("test_noop")
+def noop_handler(payload):
+    return payload
+
+
+@handler("test_fail")
+def failing_handler(payload):
+    raise RuntimeError("handler failed")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    models.init_schema()
+    yield
+    _tmpdir.cleanup()
+
+
+@pytest.fixture(autouse=True)
+def clean_tables():
+    yield
+    with SessionLocal() as db:
+        db.execute(delete(models.TaskRun))
+        db.execute(delete(models.Task))
+        db.commit()
+    SessionLocal.remove()
+    task_cache.clear()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        SessionLocal.remove()
+
+
+@pytest.fixture
+def client():
+    # Not entered as a context manager, which would run the startup handlers and start the dispatcher and workers
+    return TestClient(app)
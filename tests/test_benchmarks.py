@@ -0,0 +1,41 @@
+from benchmarks.suite import compare, flatten, percentiles
+
+
+def _report(**results):
+    return {"meta": {}, "results": results}
+
+
+def test_percentiles_of_samples():
+    stats = percentiles([float(value) for value in range(100, 0, -1)])
+
+    assert stats == {"p50_ms": 50.5, "p99_ms": 99.0, "max_ms": 100.0}
+    assert percentiles([7.0]) == {"p50_ms": 7.0, "p99_ms": 7.0, "max_ms": 7.0}
+
+
+def test_only_rates_and_latencies_are_compared():
+    results = {"post": {"requests": 1000, "requests_per_second": 250.0},
+               "list": {"10000": {"first_page": {"p50_ms": 1.5}}},
+               "dispatch_lag": {"tasks": 10, "completed": 10, "p99_ms": 20.0}}
+
+    assert flatten(results) == {"post.requests_per_second": 250.0, "list.10000.first_page.p50_ms": 1.5,
+                                "dispatch_lag.p99_ms": 20.0}
+
+
+def test_regressions_depend_on_the_direction_of_the_metric():
+    baseline = _report(post={"requests_per_second": 200.0}, lookup={"p50_ms": 10.0, "p99_ms": 20.0})
+    current = _report(post={"requests_per_second": 170.0}, lookup={"p50_ms": 9.0, "p99_ms": 23.0})
+
+    comparison = {entry["metric"]: entry for entry in compare(current, baseline, threshold=10)}
+
+    assert comparison["post.requests_per_second"]["change_percent"] == -15.0
+    assert {name: entry["regression"] for name, entry in comparison.items()} == {
+        "lookup.p50_ms": False, "lookup.p99_ms": True, "post.requests_per_second": True}
+
+
+def test_metrics_missing_from_the_baseline_are_skipped():
+    baseline = _report(lookup={"p50_ms": 10.0}, dispatch_lag={})
+    current = _report(lookup={"p50_ms": 30.0}, dispatch_lag={"p50_ms": 5.0})
+
+    comparison = compare(current, baseline, threshold=None)
+
+    assert [(entry["metric"], entry["regression"]) for entry in comparison] == [("lookup.p50_ms", False)]
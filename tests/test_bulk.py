@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from app.config import settings
+
+
+def _task(name, **fields):
+    return {"name": name, "scheduled_time": (datetime.now() + timedelta(days=1)).isoformat(), **fields}
+
+
+def test_bulk_creates_every_valid_task(client):
+    response = client.post("/api/tasks/bulk", json=[_task("a"), _task("b"), _task("c", recurrence="daily")])
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [task["name"] for task in body["created"]] == ["a", "b", "c"]
+    assert body["errors"] == []
+
+
+def test_bulk_reports_invalid_items_without_failing_the_batch(client):
+    past = (datetime.now() - timedelta(days=1)).isoformat()
+    items = [
+        _task("ok-1"),
+        {"name": "late", "scheduled_time": past},
+        _task("bad-cron", cron_expression="not a cron"),
+        "not an object",
+        _task("ok-2", priority=3),
+    ]
+
+    response = client.post("/api/tasks/bulk", json=items)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [task["name"] for task in body["created"]] == ["ok-1", "ok-2"]
+    assert [(error["index"], error["name"]) for error in body["errors"]] == [(1, "late"), (2, "bad-cron"), (3, None)]
+    assert "scheduled_time" in body["errors"][0]["detail"]
+    assert "cron_expression" in body["errors"][1]["detail"]
+
+
+def test_bulk_duplicate_indexes_point_into_the_request(client):
+    client.post("/api/tasks/", json=_task("taken"))
+    items = [{"name": "invalid", "priority": 20}, _task("fresh"), _task("taken"), _task("fresh")]
+
+    response = client.post("/api/tasks/bulk", json=items)
+
+    body = response.json()
+    assert [task["name"] for task in body["created"]] == ["fresh"]
+    assert [(error["index"], error["name"]) for error in body["errors"]] == [(0, "invalid"), (2, "taken"), (3, "fresh")]
+    assert body["errors"][1]["detail"] == "Task name already exists"
+
+
+def test_bulk_rejects_oversized_batches(client, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_create_max_tasks", 2)
+
+    response = client.post("/api/tasks/bulk", json=[_task("a"), _task("b"), _task("c")])
+
+    assert response.status_code == 413
+    assert client.get("/api/tasks/count").json()["count"] == 0
+
+
+def test_bulk_body_must_be_a_list(client):
+    assert client.post("/api/tasks/bulk", json=_task("a")).status_code == 422
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.util import greenlet_spawn
+
+from app import crud, models
+from app.cache import CacheBackend, InMemoryBackend, RedisBackend, TaskCache, dump_task_record, load_task_record, task_record
+from app.models import TaskStatus
+
+RECORD = {"id": 1, "name": "task"}
+
+
+@pytest.fixture(params=["local", "shared"])
+def cache(request):
+    return TaskCache(maxsize=2, ttl=30, backend=InMemoryBackend() if request.param == "shared" else None)
+
+
+def test_invalidation_removes_the_entry(cache):
+    cache.set(1, RECORD, cache.token(1))
+
+    cache.invalidate([1])
+
+    assert cache.get(1) is None
+
+
+def test_lookup_started_before_an_invalidation_is_not_stored(cache):
+    token = cache.token(1)
+    cache.invalidate([1])
+
+    cache.set(1, RECORD, token)
+
+    assert cache.get(1) is None
+
+
+def test_lookup_started_before_another_replica_invalidated_is_not_stored():
+    backend = InMemoryBackend()
+    replica, other = TaskCache(maxsize=0, backend=backend), TaskCache(maxsize=0, backend=backend)
+    token = replica.token(1)
+
+    other.invalidate([1])
+    replica.set(1, RECORD, token)
+    assert replica.get(1) is None
+
+    other.set(2, RECORD, other.token(2))
+    token = replica.token(2)
+    other.clear()
+    replica.set(2, RECORD, token)
+    assert replica.get(2) is None
+
+
+def test_invalidating_a_task_leaves_lookups_of_other_tasks_storable():
+    cache = TaskCache(maxsize=0, backend=InMemoryBackend())
+    token = cache.token(1)
+
+    cache.invalidate([2])
+    cache.set(1, RECORD, token)
+
+    assert cache.get(1) == RECORD
+
+
+def test_backends_implement_every_operation():
+    class Partial(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+class _Client:
+    def __init__(self, result):
+        self.result = result
+
+    def get(self, key):
+        return self.result
+
+
+class _AsyncClient(_Client):
+    async def get(self, key):
+        await asyncio.sleep(0)
+        return self.result
+
+
+def test_redis_commands_are_awaited_inside_the_api_greenlet():
+    backend = RedisBackend.__new__(RedisBackend)
+    backend._prefix = "task:"
+    backend._client, backend._async_client = _Client(b"sync"), _AsyncClient(b"async")
+
+    assert backend.get("1") == "sync"
+    assert asyncio.run(greenlet_spawn(backend.get, "1")) == "async"
+
+
+def test_clear_removes_every_entry(cache):
+    cache.set(1, RECORD, cache.token(1))
+    cache.set(2, {"id": 2, "name": "other"}, cache.token(2))
+
+    cache.clear()
+
+    assert cache.get(1) is None and cache.get(2) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TaskCache(maxsize=2, ttl=30)
+    for task_id in (1, 2):
+        cache.set(task_id, {"id": task_id}, cache.token(task_id))
+    cache.get(1)
+
+    cache.set(3, {"id": 3}, cache.token(3))
+
+    assert [cache.get(task_id) is not None for task_id in (1, 2, 3)] == [True, False, True]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_their_ttl():
+    cache = TaskCache(maxsize=10, ttl=0.05)
+    cache.set(1, RECORD, cache.token(1))
+
+    time.sleep(0.1)
+
+    assert cache.get(1) is None
+
+
+def test_shared_records_keep_their_column_types(db):
+    task = crud.create_task(db, "typed", datetime(2030, 1, 1, 9), recurrence=models.RecurrenceFrequency.DAILY)
+
+    record = load_task_record(dump_task_record(task_record(task)))
+
+    assert record == task_record(task)
+
+
+def test_api_reads_see_updates(client):
+    created = client.post("/api/tasks/", json={"name": "before", "scheduled_time": (datetime.now() + timedelta(days=1)).isoformat()}).json()
+    assert client.get(f"/api/tasks/{created['id']}").json()["name"] == "before"
+
+    client.put(f"/api/tasks/{created['id']}", json={"name": "after"})
+
+    assert client.get(f"/api/tasks/{created['id']}").json()["name"] == "after"
+
+
+def test_execution_writes_invalidate_cached_tasks(db):
+    task_id = crud.create_task(db, "task", datetime.now() - timedelta(seconds=1)).id
+    assert crud.get_task_by_id(db, task_id).status == TaskStatus.PENDING
+
+    crud.start_task(db, task_id)
+    assert crud.get_task_by_id(db, task_id).status == TaskStatus.RUNNING
+
+    crud.finish_task(db, task_id, TaskStatus.SUCCEEDED)
+    assert crud.get_task_by_id(db, task_id).status == TaskStatus.SUCCEEDED
+
+
+def test_deleted_tasks_are_not_served_from_the_cache(client, db):
+    task_id = crud.create_task(db, "task", datetime.now() + timedelta(days=1)).id
+    assert client.get(f"/api/tasks/{task_id}").status_code == 200
+
+    assert client.delete(f"/api/tasks/{task_id}").status_code == 204
+
+    assert client.get(f"/api/tasks/{task_id}").status_code == 404
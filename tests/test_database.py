@@ -0,0 +1,47 @@
+from app.config import Settings, settings
+from app.database import (AsyncSessionLocal, SessionLocal, engine_options, get_async_database_url, get_async_engine,
+                          get_engine)
+
+MARIADB_URL = "mysql+pymysql://user:secret@db:3306/tasks"
+
+
+def test_async_url_swaps_the_driver(monkeypatch):
+    monkeypatch.setattr(settings, "mariadb_async_uri", None)
+
+    assert get_async_database_url(MARIADB_URL) == "mysql+aiomysql://user:secret@db:3306/tasks"
+    assert get_async_database_url("sqlite:///tasks.db") == "sqlite+aiosqlite:///tasks.db"
+    monkeypatch.setattr(settings, "mariadb_async_uri", "mysql+asyncmy://db/tasks")
+    assert get_async_database_url(MARIADB_URL) == "mysql+asyncmy://db/tasks"
+
+
+def test_server_pools_follow_the_settings(monkeypatch):
+    monkeypatch.setattr(settings, "db_isolation_level", "READ COMMITTED")
+    monkeypatch.setattr(settings, "db_statement_timeout", 2.5)
+
+    options = engine_options(MARIADB_URL, pool_size=7, max_overflow=3)
+
+    assert options == {
+        "pool_pre_ping": settings.db_pool_pre_ping, "isolation_level": "READ COMMITTED", "pool_size": 7,
+        "max_overflow": 3, "pool_timeout": settings.db_pool_timeout, "pool_recycle": settings.db_pool_recycle,
+        "connect_args": {"init_command": "SET SESSION max_statement_time = 2.5"},
+    }
+    assert "connect_args" not in engine_options("postgresql://db/tasks", 7, 3)
+
+
+def test_in_memory_sqlite_keeps_the_static_pool():
+    assert "pool_size" not in engine_options("sqlite://", 7, 3)
+    assert engine_options("sqlite:///tasks.db", 7, 3)["pool_size"] == 7
+
+
+def test_executor_pool_defaults_to_one_connection_per_worker():
+    assert Settings(scheduler_thread_pool_size=8, dispatch_workers=4).executor_pool_size == 10
+    assert Settings(db_executor_pool_size=3).executor_pool_size == 3
+
+
+def test_executor_and_api_use_separate_lazily_created_engines():
+    assert get_engine() is get_engine()
+    assert get_engine() is not get_async_engine().sync_engine
+    assert get_engine().pool.size() == settings.executor_pool_size
+    assert get_async_engine().pool.size() == settings.db_api_pool_size
+    assert SessionLocal().get_bind() is get_engine()
+    assert AsyncSessionLocal().sync_session.get_bind() is get_async_engine().sync_engine
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+from app import crud, models
+from app.models import TaskStatus
+
+
+def _due(db, name, seconds_ago=10, **fields):
+    return crud.create_task(db, name, datetime.now() - timedelta(seconds=seconds_ago), **fields).id
+
+
+def _status(db, task_id):
+    db.expire_all()
+    return db.get(models.Task, task_id)
+
+
+def test_claim_takes_highest_priority_then_earliest(db):
+    low_old = _due(db, "low-old", 60)
+    high_new = _due(db, "high-new", 5, priority=9)
+    mid = _due(db, "mid", 30, priority=5)
+    high_old = _due(db, "high-old", 50, priority=9)
+
+    claimed = crud.claim_due_tasks(db, worker_id="w1", limit=3, lease_seconds=60)
+
+    assert [task_id for task_id, _ in claimed] == [high_old, high_new, mid]
+    assert _status(db, low_old).status == TaskStatus.PENDING
+
+
+def test_claim_leases_the_rows_to_the_worker(db):
+    task_id = _due(db, "task")
+
+    crud.claim_due_tasks(db, worker_id="w1", limit=10, lease_seconds=60)
+
+    task = _status(db, task_id)
+    assert task.status == TaskStatus.RUNNING
+    assert task.lease_owner == "w1"
+    assert task.lease_expires_at > datetime.now() + timedelta(seconds=50)
+    # A second claim finds nothing left
+    assert crud.claim_due_tasks(db, worker_id="w2", limit=10, lease_seconds=60) == []
+
+
+def test_claim_skips_future_tasks_and_excluded_groups(db):
+    crud.create_task(db, "future", datetime.now() + timedelta(hours=1))
+    _due(db, "blocked", group="tenant-a")
+    no_group = _due(db, "no-group")
+    other = _due(db, "other", group="tenant-b")
+
+    claimed = crud.claim_due_tasks(db, worker_id="w1", limit=10, lease_seconds=60, excluded_groups={"tenant-a"})
+    assert sorted(task_id for task_id, _ in claimed) == sorted([no_group, other])
+
+    _due(db, "no-group-2")
+    assert crud.claim_due_tasks(db, worker_id="w1", limit=10, lease_seconds=60, excluded_groups={None, "tenant-a"}) == []
+
+
+def test_tasks_refused_by_admit_stay_pending(db):
+    first = _due(db, "first", 20, group="g")
+    second = _due(db, "second", 10, group="g")
+    admitted = []
+
+    def admit(group, scheduled_time):
+        admitted.append(group)
+        return len(admitted) == 1
+
+    claimed = crud.claim_due_tasks(db, worker_id="w1", limit=10, lease_seconds=60, admit=admit)
+
+    assert claimed == [(first, "g")]
+    assert _status(db, second).status == TaskStatus.PENDING
+
+
+def test_renew_only_extends_leases_still_owned(db):
+    mine, theirs = _due(db, "mine"), _due(db, "theirs")
+    crud.claim_due_tasks(db, worker_id="w1", limit=1, lease_seconds=1)
+    crud.claim_due_tasks(db, worker_id="w2", limit=1, lease_seconds=1)
+
+    renewed = crud.renew_leases(db, worker_id="w1", task_ids=[mine, theirs], lease_seconds=600)
+
+    assert renewed == 1
+    assert _status(db, mine).lease_expires_at > datetime.now() + timedelta(seconds=500)
+    assert _status(db, theirs).lease_expires_at < datetime.now() + timedelta(seconds=2)
+
+
+def test_expired_leases_are_reclaimed_for_another_worker(db):
+    expired, live = _due(db, "expired", 20), _due(db, "live", 10)
+    crud.claim_due_tasks(db, worker_id="dead", limit=1, lease_seconds=-1)
+    crud.claim_due_tasks(db, worker_id="alive", limit=1, lease_seconds=600)
+
+    assert [row.id for row in crud.reclaim_expired_leases(db)] == [expired]
+
+    task = _status(db, expired)
+    assert (task.status, task.lease_owner, task.lease_expires_at) == (TaskStatus.PENDING, None, None)
+    assert _status(db, live).status == TaskStatus.RUNNING
+    assert crud.claim_due_tasks(db, worker_id="alive", limit=10, lease_seconds=600) == [(expired, None)]
+
+
+def test_finish_is_ignored_once_the_lease_moved_on(db):
+    task_id = _due(db, "task")
+    crud.claim_due_tasks(db, worker_id="dead", limit=1, lease_seconds=-1)
+    crud.reclaim_expired_leases(db)
+    crud.claim_due_tasks(db, worker_id="alive", limit=1, lease_seconds=600)
+
+    assert not crud.finish_task(db, task_id, TaskStatus.FAILED, worker_id="dead")
+    assert crud.finish_task(db, task_id, TaskStatus.SUCCEEDED, worker_id="alive")
+    assert _status(db, task_id).status == TaskStatus.SUCCEEDED
+
+
+def test_claim_fills_the_limit_across_priorities_past_excluded_groups(db):
+    top = _due(db, "top", 5, priority=9, group="busy")
+    high = _due(db, "high", 5, priority=9)
+    mid_old, mid_new = _due(db, "mid-old", 40, priority=5), _due(db, "mid-new", 20, priority=5)
+    low = _due(db, "low", 60)
+
+    claimed = crud.claim_due_tasks(db, worker_id="w1", limit=3, lease_seconds=60, excluded_groups=["busy"])
+
+    assert [task_id for task_id, _ in claimed] == [high, mid_old, mid_new]
+    assert [_status(db, task_id).status for task_id in (top, low)] == [TaskStatus.PENDING, TaskStatus.PENDING]
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.events import EventBus
+from app.routes import task_router
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    bus = EventBus(buffer_size=4, max_batch=10)
+    monkeypatch.setattr(task_router, "task_events", bus)
+    return bus
+
+
+def _publish(bus, *task_ids):
+    bus.publish_many(("updated", task_id, {"name": f"task-{task_id}"}) for task_id in task_ids)
+
+
+async def _read(subscription, timeout=1.0):
+    events, missed = await subscription.next_events(timeout)
+    return [event.task_id for event in events], missed
+
+
+async def _stream(token=None, chunks=1, last_event_id=None):
+    response = await task_router.stream_task_events(since=token, last_event_id=last_event_id)
+    body = response.body_iterator
+    try:
+        return [await body.__anext__() for _ in range(chunks)]
+    finally:
+        await body.aclose()
+
+
+def test_tokens_only_resume_positions_of_this_process(bus):
+    _publish(bus, 1, 2)
+
+    assert bus.parse_token(bus.token(1)) == 1
+    assert bus.parse_token(bus.token(3)) is None
+    assert bus.parse_token(f"other-{1}") is None
+    assert bus.parse_token("garbage") is None
+    assert bus.parse_token(None) is None
+
+
+def test_subscription_resumes_after_its_token(bus):
+    _publish(bus, 1, 2, 3)
+
+    async def read():
+        return await _read(bus.subscribe(after=1))
+
+    assert asyncio.run(read()) == ([2, 3], False)
+
+
+def test_new_subscriptions_only_get_new_events(bus):
+    _publish(bus, 1)
+
+    async def read():
+        subscription = bus.subscribe()
+        threading.Timer(0.05, _publish, args=(bus, 2)).start()
+        return await _read(subscription)
+
+    assert asyncio.run(read()) == ([2], False)
+
+
+def test_slow_subscriber_is_told_it_missed_events(bus):
+    async def read():
+        subscription = bus.subscribe()
+        _publish(bus, *range(1, 8))
+        return await _read(subscription), await _read(subscription, timeout=0.01)
+
+    assert asyncio.run(read()) == (([4, 5, 6, 7], True), ([], False))
+
+
+def test_stream_resumes_with_the_events_after_the_token(bus):
+    _publish(bus, 1, 2, 3)
+
+    chunk, = asyncio.run(_stream(bus.token(1)))
+
+    assert chunk.count("event: updated") == 2
+    assert chunk.startswith(f"id: {bus.token(2)}\nevent: updated\ndata: ")
+    assert '"task_id": 3' in chunk
+
+
+def test_stream_sends_a_reset_for_an_unknown_token(bus):
+    reset, = asyncio.run(_stream("stale-42"))
+
+    assert reset == f"id: {bus.token(0)}\nevent: reset\ndata: {{}}\n\n"
+
+
+def test_stream_sends_a_reset_before_the_events_after_a_gap(bus):
+    _publish(bus, 1)
+    token = bus.token(1)
+    _publish(bus, *range(2, 10))
+
+    reset, events = asyncio.run(_stream(token, chunks=2))
+
+    assert reset == f"id: {bus.token(5)}\nevent: reset\ndata: {{}}\n\n"
+    assert events.startswith(f"id: {bus.token(6)}\n")
+
+
+def test_last_event_id_header_takes_precedence(bus):
+    _publish(bus, 1, 2)
+
+    chunk, = asyncio.run(_stream("stale-42", last_event_id=bus.token(1)))
+
+    assert chunk.startswith(f"id: {bus.token(2)}\nevent: updated\n")
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import select
+from sqlalchemy.dialects import mysql
+
+from app import crud, models
+from app.models import RecurrenceFrequency, TaskStatus
+from app.schemas import TaskFilter
+
+BASE = datetime(2030, 1, 1, 9)
+
+
+def _create(db, name, hours, **fields):
+    return crud.create_task(db, name, BASE + timedelta(hours=hours), **fields)
+
+
+class _MariaDB:
+    """A session answering `EXPLAIN` with `plan`, as MariaDB would, and running every other query on `db`."""
+
+    def __init__(self, db, plan):
+        self.db = db
+        self.plan = plan
+
+    def get_bind(self):
+        return SimpleNamespace(dialect=SimpleNamespace(name="mariadb"))
+
+    def execute(self, statement):
+        assert isinstance(statement, crud._Explain)
+        return SimpleNamespace(mappings=lambda: SimpleNamespace(first=lambda: self.plan))
+
+    def scalar(self, statement):
+        return self.db.scalar(statement)
+
+
+def test_filters_combine(client, db):
+    _create(db, "Report daily", 0, recurrence=RecurrenceFrequency.DAILY)
+    _create(db, "Report weekly", 1, recurrence=RecurrenceFrequency.WEEKLY)
+    _create(db, "Report late", 5, recurrence=RecurrenceFrequency.DAILY)
+    _create(db, "Backup", 1, recurrence=RecurrenceFrequency.DAILY)
+
+    params = {"name_prefix": "Report", "recurrence": "daily", "scheduled_before": (BASE + timedelta(hours=2)).isoformat()}
+
+    assert [task["name"] for task in client.get("/api/tasks/", params=params).json()] == ["Report daily"]
+    assert client.get("/api/tasks/count", params=params).json() == {"count": 1, "exact": True}
+    assert client.get("/api/tasks/count", params={"status": "pending"}).json()["count"] == 4
+
+
+def test_name_prefix_matches_wildcards_literally(db):
+    for name in ("50% off", "500 items", "a_b", "axb"):
+        _create(db, name, 0)
+
+    names = lambda prefix: sorted(task["name"] for task in crud.get_tasks(db, task_filter=TaskFilter(name_prefix=prefix)))
+
+    assert names("50%") == ["50% off"]
+    assert names("a_") == ["a_b"]
+
+
+def test_count_is_exact_on_sqlite_whatever_the_limit(db):
+    for index in range(3):
+        _create(db, f"task-{index}", index)
+
+    assert crud.count_tasks(db, exact_limit=1) == (3, True)
+    assert crud.count_tasks(db, TaskFilter(status=TaskStatus.RUNNING), exact_limit=1) == (0, True)
+
+
+def test_large_estimate_is_returned_instead_of_counting(db):
+    _create(db, "task", 0)
+
+    assert crud.count_tasks(_MariaDB(db, {"rows": 1000, "filtered": 50.0}), exact_limit=100) == (500, False)
+    # Below the limit, or when asked for an exact count, the rows are counted
+    assert crud.count_tasks(_MariaDB(db, {"rows": 150, "filtered": 50.0}), exact_limit=100) == (1, True)
+    assert crud.count_tasks(_MariaDB(db, {"rows": 1000, "filtered": None}), exact_limit=None) == (1, True)
+
+
+def test_explain_wraps_the_filtered_query():
+    statement = crud.filter_tasks(select(models.Task.id), TaskFilter(status=TaskStatus.PENDING))
+
+    sql = str(crud._Explain(statement).compile(dialect=mysql.dialect(), compile_kwargs={"literal_binds": True}))
+
+    assert sql.startswith("EXPLAIN SELECT tasks.id")
+    assert "tasks.status = 'PENDING'" in sql
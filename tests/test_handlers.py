@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import crud, models, task_executor
+from app.handlers import ExecutionClass, HandlerRuntime, decode_payload, encode_payload, handler
+from app.models import TaskStatus
+
+# Opened by the tests to let the I/O-bound handlers finish
+gate = threading.Event()
+
+
+@handler("test_io", ExecutionClass.IO)
+async def gated_handler(payload):
+    while not gate.is_set():
+        await asyncio.sleep(0.01)
+    if payload and payload.get("fail"):
+        raise ValueError("downstream error")
+    return payload
+
+
+@pytest.fixture(autouse=True)
+def closed_gate():
+    gate.clear()
+    yield
+    gate.set()
+
+
+@pytest.fixture
+def runtime():
+    runtime = HandlerRuntime(process_pool_size=1, max_coroutines=1)
+    yield runtime
+    gate.set()
+    runtime.shutdown(timeout=5)
+
+
+def _due(db, name, **fields):
+    return crud.create_task(db, name, datetime.now() - timedelta(seconds=1), **fields).id
+
+
+def _task(db, task_id):
+    db.expire_all()
+    return db.get(models.Task, task_id)
+
+
+def test_thread_handlers_finish_before_returning(db):
+    task_id = _due(db, "inline", handler="test_noop")
+
+    assert task_executor.execute_task(task_id) is None
+    assert _task(db, task_id).status == TaskStatus.SUCCEEDED
+
+
+def test_io_handlers_are_handed_over_without_holding_the_worker(db):
+    task_id = _due(db, "io", handler="test_io")
+
+    pending = task_executor.execute_task(task_id)
+
+    assert pending is not None and not pending.done()
+    assert _task(db, task_id).status == TaskStatus.RUNNING
+    assert task_id in task_executor.held_task_ids()
+    gate.set()
+    pending.result(timeout=5)
+    assert _task(db, task_id).status == TaskStatus.SUCCEEDED
+    assert task_id not in task_executor.held_task_ids()
+
+
+def test_io_handler_failures_are_recorded(db):
+    task_id = _due(db, "io", handler="test_io", payload={"fail": True})
+
+    pending = task_executor.execute_task(task_id)
+    gate.set()
+
+    with pytest.raises(ValueError):
+        pending.result(timeout=5)
+    assert _task(db, task_id).status == TaskStatus.FAILED
+    assert crud.get_task_runs(db, task_id)[0].error == "ValueError: downstream error"
+
+
+def test_submit_waits_while_the_execution_class_is_at_capacity(runtime):
+    io_handler = task_executor.get_handler("test_io")
+    first = runtime.submit(io_handler, None)
+    submitted = []
+    waiting = threading.Thread(target=lambda: submitted.append(runtime.submit(io_handler, None)))
+    waiting.start()
+
+    time.sleep(0.1)
+    assert submitted == [] and runtime.running(ExecutionClass.IO) == 1
+    gate.set()
+    waiting.join(timeout=5)
+    assert first.result(timeout=5) is None
+    assert submitted[0].result(timeout=5) is None
+
+
+def test_shutdown_waits_for_handlers_in_progress(runtime):
+    future = runtime.submit(task_executor.get_handler("test_io"), None)
+    threading.Timer(0.1, gate.set).start()
+
+    runtime.shutdown(timeout=5)
+
+    assert future.done()
+    assert runtime.running(ExecutionClass.IO) == 0
+
+
+def test_cpu_handlers_run_in_processes_that_are_not_forked(runtime):
+    future = runtime.submit(task_executor.get_handler("checksum"), {"size": 16, "rounds": 2})
+
+    assert len(future.result(timeout=60)) == 64
+    assert runtime._process_pool._mp_context.get_start_method() in ("forkserver", "spawn")
+
+
+def test_decoded_payloads_are_not_shared():
+    stored = encode_payload({"items": [1, 2], "big": 2 ** 70})
+    first = decode_payload(stored)
+    first["items"].append(3)
+
+    assert decode_payload(stored) == {"items": [1, 2], "big": 2 ** 70}
@@ -0,0 +1,105 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from apscheduler.triggers.date import DateTrigger
+
+from app.config import settings
+from app.metrics import RuntimeCollector
+from app.scheduler import BoundedMemoryJobStore, BoundedThreadPoolExecutor, TaskScheduler, build_scheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = build_scheduler()
+    scheduler.start(paused=True)
+    yield scheduler
+    scheduler.shutdown(wait=False)
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _add(scheduler, job_id, func=lambda: None, delay=timedelta(hours=1)):
+    scheduler.add_job(func, trigger=DateTrigger(run_date=datetime.now() + delay), id=job_id, replace_existing=True,
+                      executor="maintenance")
+
+
+def test_task_jobs_are_counted_as_they_are_added_and_removed(scheduler):
+    for task_id in (1, 2, 3):
+        _add(scheduler, f"task-{task_id}")
+    _add(scheduler, "task-1")
+    _add(scheduler, "refill-task-window")
+    assert scheduler.task_jobs == 3
+
+    scheduler.remove_job("task-2")
+    assert scheduler.task_jobs == 2
+
+    scheduler.remove_all_jobs()
+    assert scheduler.task_jobs == 0
+
+
+def test_jobs_that_ran_are_no_longer_counted(scheduler):
+    ran = threading.Event()
+    _add(scheduler, "task-1", ran.set, delay=timedelta(0))
+    _add(scheduler, "task-2")
+
+    scheduler.resume()
+
+    assert ran.wait(5)
+    # The scheduler removes the job right after submitting it, possibly after it ran
+    deadline = time.monotonic() + 5
+    while scheduler.task_jobs != 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert scheduler.task_jobs == 1
+
+
+def test_collector_reports_the_counter(scheduler):
+    _add(scheduler, "task-1")
+    timer_engine = type("Timers", (), {"__len__": lambda self: 5})()
+    dispatcher = type("Dispatcher", (), {"busy_workers": 0})()
+    cache = type("Cache", (), {"stats": lambda self: {"hits": 0, "misses": 0, "evictions": 0}})()
+
+    pending = next(RuntimeCollector(scheduler, timer_engine, dispatcher, {}, cache).collect())
+
+    assert {sample.labels["store"]: sample.value for sample in pending.samples} == {"apscheduler": 1, "timer_engine": 5}
+
+
+def test_due_jobs_beyond_the_executor_capacity_wait_in_the_store():
+    executor = BoundedThreadPoolExecutor(max_workers=1, queue_size=1)
+    scheduler = TaskScheduler(backpressure_interval=0.05, jobstores={"default": BoundedMemoryJobStore()},
+                              executors={"default": executor})
+    scheduler.start(paused=True)
+    gate, ran = threading.Event(), []
+    try:
+        for index in range(4):
+            scheduler.add_job(lambda index=index: gate.wait(5) and ran.append(index), trigger=DateTrigger(run_date=datetime.now()),
+                              id=f"run-{index}", misfire_grace_time=None)
+        scheduler.resume()
+
+        _wait_for(lambda: executor.outstanding == 2)
+        time.sleep(0.1)
+        # One job runs and one is queued; the others are held back in order instead of being dropped
+        assert (executor.outstanding, executor.busy_workers, executor.free_slots) == (2, 1, 0)
+        assert [job.id for job in scheduler.get_jobs()] == ["run-2", "run-3"]
+        gate.set()
+        _wait_for(lambda: len(ran) == 4)
+        assert ran == [0, 1, 2, 3]
+        _wait_for(lambda: executor.outstanding == 0)
+    finally:
+        gate.set()
+        scheduler.shutdown(wait=False)
+
+
+def test_scheduler_executors_follow_the_settings(scheduler):
+    default, maintenance = scheduler._lookup_executor("default"), scheduler._lookup_executor("maintenance")
+
+    assert default.capacity == settings.scheduler_thread_pool_size + settings.scheduler_queue_size
+    assert scheduler.free_slots("default") == default.capacity
+    # Housekeeping jobs are not held back by saturated task workers
+    assert scheduler.free_slots("maintenance") == float("inf") and maintenance is not default
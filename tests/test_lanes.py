@@ -0,0 +1,134 @@
+import math
+import time
+
+import pytest
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from app import scheduler
+from app.lanes import GroupLimits, PriorityLanes, TokenBucket
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def started():
+    return []
+
+
+def _lanes(started, limits=None, max_in_flight=1, tasks=None):
+    tasks = tasks or {}
+    lanes = PriorityLanes(limits or GroupLimits(), max_in_flight=max_in_flight,
+                          load=lambda task_ids: [(task_id, *tasks.get(task_id, (0, None))) for task_id in task_ids],
+                          submit=lambda task_id, group: started.append(task_id))
+    lanes.start()
+    return lanes
+
+
+def test_freed_worker_starts_the_next_task_while_the_group_slot_is_kept(started):
+    lanes = _lanes(started, GroupLimits(concurrency=1), max_in_flight=1, tasks={1: (0, "a"), 2: (0, "a"), 3: (0, "b")})
+    try:
+        for task_id in (1, 2, 3):
+            lanes.offer(task_id)
+        _wait_for(lambda: started == [1])
+
+        lanes.free_worker()
+        # Group "a" is still at its cap, so the worker goes to group "b"
+        _wait_for(lambda: started == [1, 3])
+        lanes.release("a", worker=False)
+        time.sleep(0.05)
+        assert started == [1, 3]
+
+        lanes.release("b")
+        _wait_for(lambda: started == [1, 3, 2])
+    finally:
+        lanes.stop()
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=2, burst=2)
+    now = bucket.updated
+
+    for _ in range(2):
+        assert bucket.wait_time(now) == 0
+        bucket.take()
+    assert bucket.wait_time(now) == pytest.approx(0.5)
+    assert bucket.wait_time(now + 0.5) == 0
+
+
+def test_group_limits_cap_concurrency_per_group():
+    limits = GroupLimits(concurrency=1, overrides={"wide": {"concurrency": 2}})
+
+    assert limits.acquire("a", 0) == 0
+    assert limits.acquire("a", 0) == math.inf
+    assert limits.acquire("wide", 0) == limits.acquire("wide", 0) == 0
+    assert set(limits.blocked_groups(0)) == {"a", "wide"}
+    limits.release("a")
+    assert limits.acquire("a", 0) == 0
+
+
+def test_lanes_start_the_highest_priority_first(started):
+    lanes = _lanes(started, max_in_flight=1, tasks={1: (0, None), 2: (5, None), 3: (9, None)})
+    with lanes._condition:
+        # Queued together, so that the dispatcher thread sees every task before starting one
+        lanes._incoming.extend([1, 2, 3])
+        lanes._condition.notify()
+    try:
+        _wait_for(lambda: started == [3])
+        lanes.release(None)
+        _wait_for(lambda: started == [3, 2])
+        lanes.release(None)
+        _wait_for(lambda: started == [3, 2, 1])
+    finally:
+        lanes.stop()
+
+
+def test_lanes_take_turns_between_groups_of_equal_priority():
+    tasks = {1: (0, "noisy"), 2: (0, "noisy"), 3: (0, "noisy"), 4: (0, "quiet")}
+    lanes = PriorityLanes(GroupLimits(), max_in_flight=4, load=None, submit=None)
+    for task_id, (priority, group) in tasks.items():
+        lanes.push(task_id, priority, group)
+
+    order = [lanes.pop(0)[0] for _ in tasks]
+
+    assert order.index(4) < order.index(3)
+
+
+def test_rate_limited_group_waits_for_its_next_token(started):
+    lanes = _lanes(started, GroupLimits(rate=2, burst=1), max_in_flight=4, tasks={1: (0, "a"), 2: (0, "a")})
+    try:
+        lanes.offer(1)
+        lanes.offer(2)
+        _wait_for(lambda: started == [1])
+        time.sleep(0.1)
+        # A worker is free, but the next token of the group is only due half a second after the first start
+        assert started == [1]
+        _wait_for(lambda: started == [1, 2])
+    finally:
+        lanes.stop()
+
+
+def test_second_admission_of_a_waiting_task_gives_its_slots_back(monkeypatch):
+    jobs = BackgroundScheduler()
+    # Paused, the admitted jobs wait as they do for a saturated executor
+    jobs.start(paused=True)
+    lanes = PriorityLanes(GroupLimits(concurrency=2), max_in_flight=2,
+                          load=lambda task_ids: [(task_id, 0, "a") for task_id in task_ids],
+                          submit=scheduler.start_admitted_task)
+    monkeypatch.setattr(scheduler, "scheduler", jobs)
+    monkeypatch.setattr(scheduler, "task_lanes", lanes)
+    lanes.start()
+    try:
+        lanes.offer(1)
+        lanes.offer(1)
+        lanes.offer(2)
+        _wait_for(lambda: jobs.get_job("run-2") is not None)
+        assert sorted(job.id for job in jobs.get_jobs()) == ["run-1", "run-2"]
+        assert lanes.in_flight == 2
+    finally:
+        lanes.stop()
+        jobs.shutdown(wait=False)
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app import crud, models, task_executor
+from app.config import settings
+from app.database import sqlite_writer_lock
+from app.models import TaskStatus
+from app.result_writer import TaskResult, result_writer
+
+
+def _due(db, name, **fields):
+    return crud.create_task(db, name, datetime.now() - timedelta(seconds=1), **fields).id
+
+
+def _task(db, task_id):
+    db.expire_all()
+    return db.get(models.Task, task_id)
+
+
+def test_started_tasks_are_leased(db):
+    task_id = _due(db, "task")
+
+    task = crud.start_task(db, task_id, worker_id="w1", lease_seconds=60)
+
+    assert (task.status, task.lease_owner) == (TaskStatus.RUNNING, "w1")
+    assert task.lease_expires_at > datetime.now() + timedelta(seconds=50)
+
+
+def test_scheduler_mode_execution_leases_and_releases_the_task(db):
+    task_id = _due(db, "task", handler="test_noop")
+
+    task_executor.execute_task(task_id)
+
+    task = _task(db, task_id)
+    assert (task.status, task.lease_owner, task.lease_expires_at) == (TaskStatus.SUCCEEDED, None, None)
+    assert [run.worker for run in crud.get_task_runs(db, task_id)] == [settings.worker_id]
+
+
+def test_expired_scheduler_lease_is_reclaimed(db):
+    task_id = _due(db, "crashed")
+    crud.start_task(db, task_id, worker_id="gone", lease_seconds=-1)
+
+    reclaimed = crud.reclaim_expired_leases(db)
+
+    assert [row.id for row in reclaimed] == [task_id]
+    assert _task(db, task_id).status == TaskStatus.PENDING
+
+
+def test_stale_owner_reclaims_its_own_and_unleased_tasks(db):
+    own, unleased, other = _due(db, "own"), _due(db, "unleased"), _due(db, "other")
+    crud.start_task(db, own, worker_id="me", lease_seconds=600)
+    crud.start_task(db, unleased)
+    crud.start_task(db, other, worker_id="someone-else", lease_seconds=600)
+
+    reclaimed = crud.reclaim_expired_leases(db, stale_owner="me")
+
+    assert sorted(row.id for row in reclaimed) == sorted([own, unleased])
+    assert [_task(db, task_id).status for task_id in (own, unleased, other)] == [
+        TaskStatus.PENDING, TaskStatus.PENDING, TaskStatus.RUNNING]
+
+
+def test_maintain_leases_renews_tasks_with_unwritten_results(db, monkeypatch):
+    task_id = _due(db, "task")
+    crud.start_task(db, task_id, worker_id="me", lease_seconds=1)
+    result = TaskResult(task_id=task_id, status=TaskStatus.SUCCEEDED, finished_at=datetime.now(), worker_id="me")
+    # The writer thread is not started, so the result stays pending
+    monkeypatch.setattr(result_writer, "_running", True)
+    result_writer.submit(result)
+    try:
+        assert task_executor.held_task_ids() == [task_id]
+        assert task_executor.maintain_leases("me", 600) == []
+        assert _task(db, task_id).lease_expires_at > datetime.now() + timedelta(seconds=500)
+    finally:
+        result_writer._pending.clear()
+
+
+def test_failed_lease_renewal_rolls_back(db, monkeypatch):
+    task_id = _due(db, "task")
+    crud.start_task(db, task_id, worker_id="me", lease_seconds=1)
+
+    def fail():
+        raise OperationalError("COMMIT", {}, Exception("connection lost"))
+
+    with monkeypatch.context() as patch:
+        patch.setattr(db, "commit", fail)
+        with pytest.raises(OperationalError):
+            crud.renew_leases(db, "me", [task_id], 600)
+
+    # The transaction of the failed update is not left open, holding the writer lock
+    assert not sqlite_writer_lock._lock.locked()
+    assert crud.renew_leases(db, "me", [task_id], 600) == 1
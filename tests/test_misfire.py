@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import crud, models, task_executor
+from app.misfire import CatchUp
+from app.models import MisfirePolicy, RecurrenceFrequency, TaskStatus
+from app.scheduler import TaskWindowLoader
+
+
+def _task(db, task_id):
+    db.expire_all()
+    return db.get(models.Task, task_id)
+
+
+def test_occurrences_misfire_beyond_the_grace_time():
+    catch_up = CatchUp(grace_seconds=15)
+    now = datetime(2030, 1, 1, 12)
+
+    assert not catch_up.is_misfired(now - timedelta(seconds=15), now)
+    assert catch_up.is_misfired(now - timedelta(seconds=16), now)
+    assert catch_up.policy_of(None) == MisfirePolicy.COALESCE
+    assert catch_up.policy_of(MisfirePolicy.SKIP) == MisfirePolicy.SKIP
+
+
+def test_deferred_starts_are_spaced_by_the_catch_up_rate():
+    catch_up = CatchUp(rate=10)
+    now = datetime.now()
+
+    starts = [catch_up.defer(now, MisfirePolicy.COALESCE) for _ in range(5)]
+
+    assert starts == sorted(set(starts))
+    assert all(later - earlier == pytest.approx(timedelta(seconds=0.1), abs=timedelta(milliseconds=1))
+               for earlier, later in zip(starts, starts[1:]))
+
+
+def test_spread_starts_fall_within_the_spread_window():
+    catch_up = CatchUp(spread_seconds=60)
+    now = datetime.now()
+
+    for _ in range(20):
+        assert now <= catch_up.defer(now, MisfirePolicy.SPREAD) <= now + timedelta(seconds=60)
+    assert catch_up.defer(now, MisfirePolicy.COALESCE) == now
+
+
+def test_queue_mode_catch_up_takes_tokens():
+    catch_up = CatchUp(rate=1)
+    now = catch_up._bucket.updated
+
+    assert catch_up.acquire(now)
+    assert not catch_up.acquire(now)
+    assert catch_up.acquire(now + 1)
+    assert CatchUp().acquire(now)
+
+
+def test_skipped_occurrence_is_recorded_without_running(db):
+    task_id = crud.create_task(db, "late", datetime.now() - timedelta(hours=1), handler="test_fail",
+                               misfire_policy=MisfirePolicy.SKIP).id
+
+    task_executor.execute_task(task_id)
+
+    assert _task(db, task_id).status == TaskStatus.SKIPPED
+    run, = crud.get_task_runs(db, task_id)
+    assert (run.status, run.error.startswith("Skipped:")) == (TaskStatus.SKIPPED, True)
+
+
+def test_coalesce_moves_a_recurring_task_past_now(db):
+    scheduled = datetime.now() - timedelta(days=3, hours=1)
+    task_id = crud.create_task(db, "daily", scheduled, RecurrenceFrequency.DAILY, handler="test_noop",
+                               misfire_policy=MisfirePolicy.COALESCE).id
+
+    task_executor.execute_task(task_id)
+
+    task = _task(db, task_id)
+    assert task.status == TaskStatus.PENDING
+    assert task.scheduled_time == scheduled + timedelta(days=4)
+
+
+def test_run_all_replays_the_next_missed_occurrence(db):
+    scheduled = datetime.now() - timedelta(days=3, hours=1)
+    task_id = crud.create_task(db, "daily", scheduled, RecurrenceFrequency.DAILY, handler="test_noop",
+                               misfire_policy=MisfirePolicy.RUN_ALL).id
+
+    task_executor.execute_task(task_id)
+
+    assert _task(db, task_id).scheduled_time == scheduled + timedelta(days=1)
+
+
+def test_misfired_skip_tasks_are_moved_in_bulk(db):
+    now = datetime.now()
+    scheduled = now - timedelta(days=3, hours=1)
+    daily = crud.create_task(db, "daily", scheduled, RecurrenceFrequency.DAILY).id
+    weekly = crud.create_task(db, "weekly", scheduled, RecurrenceFrequency.WEEKLY).id
+    once = crud.create_task(db, "once", scheduled).id
+    rows = [row for chunk in crud.iter_pending_task_chunks(db, None, now) for row in chunk]
+    # Changed after it was read: left to the next load
+    crud.update_task(db, weekly, new_scheduled_time=scheduled + timedelta(minutes=1))
+
+    moved = crud.skip_misfired_tasks(db, rows, now, worker_id="w1")
+
+    assert moved == [(daily, scheduled + timedelta(days=4))]
+    assert _task(db, daily).scheduled_time == scheduled + timedelta(days=4)
+    assert _task(db, once).scheduled_time == scheduled
+    run, = crud.get_task_runs(db, daily)
+    assert (run.status, run.worker, run.scheduled_time) == (TaskStatus.SKIPPED, "w1", scheduled)
+    assert crud.get_task_runs(db, weekly) == []
+
+
+def test_window_load_skips_only_misfired_skip_tasks(db):
+    scheduled = datetime.now() - timedelta(days=1, hours=1)
+    skip = crud.create_task(db, "skip", scheduled, RecurrenceFrequency.DAILY, misfire_policy=MisfirePolicy.SKIP).id
+    coalesce = crud.create_task(db, "coalesce", scheduled, RecurrenceFrequency.DAILY).id
+
+    assert TaskWindowLoader(horizon_seconds=60).refill() == 1
+
+    assert _task(db, skip).scheduled_time == scheduled + timedelta(days=2)
+    assert _task(db, coalesce).scheduled_time == scheduled
+
+
+def test_skipped_task_runs_again_when_given_a_new_time(db):
+    task_id = crud.create_task(db, "late", datetime.now() - timedelta(hours=1), misfire_policy=MisfirePolicy.SKIP).id
+    task_executor.execute_task(task_id)
+
+    crud.update_task(db, task_id, new_scheduled_time=datetime.now() + timedelta(hours=1))
+
+    assert _task(db, task_id).status == TaskStatus.PENDING
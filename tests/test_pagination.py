@@ -0,0 +1,100 @@
+import json
+from datetime import datetime, timedelta
+
+from app import crud, models
+
+BASE = datetime(2030, 1, 1, 9)
+
+
+def _create(db, name, minutes, **fields):
+    return crud.create_task(db, name, BASE + timedelta(minutes=minutes), **fields)
+
+
+def _walk(client, limit, **params):
+    pages, cursor = [], None
+    while True:
+        query = {"limit": limit, **params}
+        if cursor:
+            query["cursor"] = cursor
+        response = client.get("/api/tasks/page", params=query)
+        assert response.status_code == 200
+        body = response.json()
+        pages.append([task["name"] for task in body["items"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_pages_split_tasks_sharing_a_scheduled_time(client, db):
+    # Five tasks at the same time: the page boundary falls between them and is resolved by id
+    for index in range(5):
+        _create(db, f"tie-{index}", 0)
+    _create(db, "later", 1)
+
+    pages = _walk(client, limit=2)
+
+    assert pages == [["tie-0", "tie-1"], ["tie-2", "tie-3"], ["tie-4", "later"]]
+
+
+def test_last_full_page_has_no_next_cursor(client, db):
+    for index in range(4):
+        _create(db, f"task-{index}", index)
+
+    pages = _walk(client, limit=2)
+
+    assert pages == [["task-0", "task-1"], ["task-2", "task-3"]]
+
+
+def test_empty_table_returns_an_empty_page(client):
+    assert client.get("/api/tasks/page").json() == {"items": [], "next_cursor": None}
+
+
+def test_rows_inserted_before_the_cursor_are_not_repeated(client, db):
+    for index in range(3):
+        _create(db, f"task-{index}", 10 + index)
+    first = client.get("/api/tasks/page", params={"limit": 2}).json()
+
+    _create(db, "earlier", 0)
+    second = client.get("/api/tasks/page", params={"limit": 2, "cursor": first["next_cursor"]}).json()
+
+    assert [task["name"] for task in second["items"]] == ["task-2"]
+    assert second["next_cursor"] is None
+
+
+def test_filters_apply_to_every_page(client, db):
+    for index in range(6):
+        recurrence = models.RecurrenceFrequency.WEEKLY if index % 2 else None
+        _create(db, f"task-{index}", index, recurrence=recurrence)
+
+    pages = _walk(client, limit=2, recurrence="weekly")
+
+    assert pages == [["task-1", "task-3"], ["task-5"]]
+
+
+def test_malformed_cursor_is_rejected(client):
+    for cursor in ("not-base64!", crud.encode_cursor(BASE, 1)[:-3], "WyJ4Il0"):
+        assert client.get("/api/tasks/page", params={"cursor": cursor}).status_code == 400
+
+
+def test_cursor_round_trip():
+    assert crud.decode_cursor(crud.encode_cursor(BASE, 42)) == (BASE, 42)
+
+
+def test_export_streams_every_task_as_ndjson(client, db):
+    _create(db, "later", 5, payload={"n": 1})
+    _create(db, "earlier", 0)
+
+    response = client.get("/api/tasks/export")
+
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [task["name"] for task in lines] == ["earlier", "later"]
+    assert lines[1]["payload"] == {"n": 1}
+    assert lines == sorted(client.get("/api/tasks/").json(), key=lambda task: task["scheduled_time"])
+
+
+def test_export_reads_the_table_in_chunks(db):
+    for index in range(5):
+        _create(db, f"task-{index}", index)
+
+    assert [task["name"] for task in crud.iter_tasks(db, chunk_size=2)] == [f"task-{index}" for index in range(5)]
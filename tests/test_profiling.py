@@ -0,0 +1,32 @@
+import threading
+import time
+
+from app.profiling import Profiler, ProfilingMode
+
+
+def _busy(task_id, seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+    return task_id
+
+
+def test_sampled_stacks_are_consistent_while_read():
+    profiler = Profiler()
+    profiler.start(ProfilingMode.SAMPLING, duration=30, interval=0.001, trace=False)
+    worker = threading.Thread(target=profiler.run_execution, args=(_busy, 1, 0.3))
+    worker.start()
+    try:
+        # Reading while the sampler records must neither fail nor see a sample half recorded
+        while worker.is_alive():
+            profiler.collapsed_stacks()
+            profiler.status()
+    finally:
+        worker.join()
+        profiler.stop()
+
+    lines = profiler.collapsed_stacks().splitlines()
+    counts = [int(line.rpartition(" ")[2]) for line in lines]
+    assert sum(counts) == profiler.status()["samples"] > 0
+    assert all(line.startswith("execute_task;") for line in lines)
+    assert any("_busy" in line for line in lines)
@@ -0,0 +1,114 @@
+import calendar
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app import crud, models, task_executor
+from app.models import RecurrenceFrequency
+from app.recurrence import CronSchedule, add_months, calculate_next_run, next_run_after, next_runs_after
+
+
+def _steps(start, recurrence, count):
+    times = [start]
+    for _ in range(count):
+        times.append(calculate_next_run(times[-1], recurrence, anchor_day=start.day))
+    return times[1:]
+
+
+def test_month_end_tasks_return_to_their_anchor_day():
+    assert _steps(datetime(2023, 1, 31, 9), RecurrenceFrequency.MONTHLY, 4) == [
+        datetime(2023, 2, 28, 9), datetime(2023, 3, 31, 9), datetime(2023, 4, 30, 9), datetime(2023, 5, 31, 9)]
+    assert _steps(datetime(2023, 11, 30), RecurrenceFrequency.QUARTERLY, 2) == [datetime(2024, 2, 29), datetime(2024, 5, 30)]
+    assert _steps(datetime(2024, 2, 29), RecurrenceFrequency.YEARLY, 4)[-1] == datetime(2028, 2, 29)
+
+
+@pytest.mark.parametrize("after", [datetime(2023, 3, 1), datetime(2023, 4, 29), datetime(2023, 4, 30, 9),
+                                   datetime(2023, 9, 15)])
+def test_step_and_batch_paths_agree(after):
+    clamped = datetime(2023, 2, 28, 9)
+    stepped = clamped
+    while stepped <= after:
+        stepped = calculate_next_run(stepped, RecurrenceFrequency.MONTHLY, anchor_day=31)
+
+    assert next_run_after(clamped, RecurrenceFrequency.MONTHLY, after, anchor_day=31) == stepped
+    assert next_runs_after(np.array([clamped], dtype="datetime64[us]"), [RecurrenceFrequency.MONTHLY], after,
+                           anchor_days=[31])[0] == np.datetime64(stepped)
+
+
+def test_without_an_anchor_the_day_of_the_scheduled_time_is_kept():
+    assert add_months(datetime(2023, 2, 28), 1) == datetime(2023, 3, 28)
+    assert add_months(datetime(2023, 2, 28), 1, 31) == datetime(2023, 3, 31)
+    assert calculate_next_run(datetime(2023, 1, 10), RecurrenceFrequency.WEEKLY) == datetime(2023, 1, 17)
+    assert calculate_next_run(datetime(2023, 1, 10), RecurrenceFrequency.ONCE) is None
+
+
+def test_executed_monthly_task_keeps_its_anchor(db):
+    scheduled = datetime.now() - timedelta(seconds=1)
+    task_id = crud.create_task(db, "month-end", scheduled, RecurrenceFrequency.MONTHLY, handler="test_noop").id
+    # As if created on the 31st and clamped by an earlier run
+    db.query(models.Task).filter_by(id=task_id).update({"anchor_day": 31})
+    db.commit()
+    crud.task_cache.clear()
+
+    task_executor.execute_task(task_id)
+
+    db.expire_all()
+    task = db.get(models.Task, task_id)
+    month_end = calendar.monthrange(task.scheduled_time.year, task.scheduled_time.month)[1]
+    assert (task.anchor_day, task.scheduled_time.day) == (31, month_end)
+
+
+def test_created_and_updated_tasks_record_their_anchor_day(db):
+    task = crud.create_task(db, "anchor", datetime(2030, 1, 31, 9), RecurrenceFrequency.MONTHLY)
+    assert task.anchor_day == 31
+
+    assert crud.update_task(db, task.id, new_scheduled_time=datetime(2030, 3, 15)).anchor_day == 15
+
+
+def test_cron_restricted_day_of_month_and_weekday_match_either():
+    # The 13th of each month, and every Friday
+    schedule = CronSchedule("0 0 13 * fri")
+
+    assert schedule.next_after(datetime(2023, 1, 1)) == datetime(2023, 1, 6)
+    assert schedule.next_after(datetime(2023, 1, 12)) == datetime(2023, 1, 13)
+    # With only one of them restricted, the other does not widen the match
+    assert CronSchedule("0 0 13 * *").next_after(datetime(2023, 1, 1)) == datetime(2023, 1, 13)
+    assert CronSchedule("0 0 * * fri").next_after(datetime(2023, 1, 1)) == datetime(2023, 1, 6)
+
+
+def test_cron_steps_ranges_lists_and_names():
+    schedule = CronSchedule("*/15 9-17/4 * jan,jul mon-fri")
+
+    assert schedule.minutes == (0, 15, 30, 45)
+    assert schedule.hours == (9, 13, 17)
+    assert schedule.months == (1, 7)
+    assert schedule.weekdays == (1, 2, 3, 4, 5)
+    assert CronSchedule("5/20 * * * *").minutes == (5, 25, 45)
+    assert CronSchedule("0 0 * * 7").weekdays == (0,)
+    assert schedule.next_after(datetime(2023, 1, 6, 17, 50)) == datetime(2023, 1, 9, 9, 0)
+
+
+@pytest.mark.parametrize("macro, after, expected", [
+    ("@yearly", datetime(2023, 6, 1), datetime(2024, 1, 1)),
+    ("@monthly", datetime(2023, 6, 1), datetime(2023, 7, 1)),
+    ("@weekly", datetime(2023, 6, 1), datetime(2023, 6, 4)),
+    ("@daily", datetime(2023, 6, 1, 12), datetime(2023, 6, 2)),
+    ("@hourly", datetime(2023, 6, 1, 12, 30), datetime(2023, 6, 1, 13)),
+])
+def test_cron_macros(macro, after, expected):
+    assert CronSchedule(macro).next_after(after) == expected
+
+
+@pytest.mark.parametrize("expression", [
+    "* * * *", "60 * * * *", "* 24 * * *", "* * 0 * *", "* * * 13 *", "* * * * 8", "*/0 * * * *", "5-1 * * * *",
+    "a * * * *", "* * * foo *",
+])
+def test_invalid_cron_fields_are_rejected(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+def test_cron_that_never_fires_is_rejected():
+    with pytest.raises(ValueError):
+        CronSchedule("0 0 30 2 *").next_after(datetime(2023, 1, 1))
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app import crud, models, task_executor
+from app.models import RecurrenceFrequency, TaskStatus
+
+
+def _task(db, task_id):
+    db.expire_all()
+    return db.get(models.Task, task_id)
+
+
+def _count(db):
+    return db.scalar(select(func.count()).select_from(models.Task))
+
+
+def test_recurring_task_advances_in_place(db):
+    scheduled = datetime.now() - timedelta(seconds=1)
+    task_id = crud.create_task(db, "daily", scheduled, RecurrenceFrequency.DAILY, handler="test_noop").id
+
+    task_executor.execute_task(task_id)
+
+    task = _task(db, task_id)
+    assert (task.name, task.status, task.scheduled_time) == ("daily", TaskStatus.PENDING,
+                                                             scheduled + timedelta(days=1))
+    assert _count(db) == 1
+    run, = crud.get_task_runs(db, task_id)
+    assert (run.status, run.scheduled_time) == (TaskStatus.SUCCEEDED, scheduled)
+
+
+def test_failed_occurrence_still_advances(db):
+    scheduled = datetime.now() - timedelta(seconds=1)
+    task_id = crud.create_task(db, "daily", scheduled, RecurrenceFrequency.DAILY, handler="test_fail").id
+
+    with pytest.raises(RuntimeError):
+        task_executor.execute_task(task_id)
+
+    task = _task(db, task_id)
+    assert (task.status, task.scheduled_time) == (TaskStatus.PENDING, scheduled + timedelta(days=1))
+    run, = crud.get_task_runs(db, task_id)
+    assert run.status == TaskStatus.FAILED
+
+
+def test_one_off_task_ends_with_its_outcome(db):
+    ok = crud.create_task(db, "ok", datetime.now() - timedelta(seconds=1), handler="test_noop").id
+    failing = crud.create_task(db, "failing", datetime.now() - timedelta(seconds=1), handler="test_fail").id
+
+    task_executor.execute_task(ok)
+    with pytest.raises(RuntimeError):
+        task_executor.execute_task(failing)
+
+    assert _task(db, ok).status == TaskStatus.SUCCEEDED
+    assert _task(db, failing).status == TaskStatus.FAILED
+    assert _count(db) == 2
+
+
+def test_occurrence_fired_twice_runs_once(db):
+    scheduled = datetime.now() - timedelta(seconds=1)
+    task_id = crud.create_task(db, "weekly", scheduled, RecurrenceFrequency.WEEKLY, handler="test_noop").id
+
+    task_executor.execute_task(task_id)
+    # The next occurrence is not due, so a stale timer for the one that ran does nothing
+    task_executor.execute_task(task_id)
+
+    assert len(crud.get_task_runs(db, task_id)) == 1
+    assert _task(db, task_id).scheduled_time == scheduled + timedelta(weeks=1)
+
+
+def test_finish_task_records_the_next_occurrence_atomically(db):
+    scheduled = datetime.now() - timedelta(seconds=1)
+    task_id = crud.create_task(db, "monthly", scheduled, RecurrenceFrequency.MONTHLY).id
+    crud.start_task(db, task_id, worker_id="w1", lease_seconds=60)
+    next_time = scheduled + timedelta(days=30)
+
+    assert crud.finish_task(db, task_id, TaskStatus.SUCCEEDED, worker_id="w1", next_scheduled_time=next_time)
+
+    task = _task(db, task_id)
+    assert (task.status, task.scheduled_time, task.lease_owner) == (TaskStatus.PENDING, next_time, None)
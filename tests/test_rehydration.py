@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import crud, scheduler
+from app.models import TaskStatus
+from app.scheduler import TaskWindowLoader
+
+
+@pytest.fixture
+def scheduled(monkeypatch):
+    chunks = []
+    monkeypatch.setattr(scheduler, "schedule_tasks_execution", lambda chunk: chunks.append([row.id for row in chunk]))
+    return chunks
+
+
+def _create(db, name, offset, **fields):
+    return crud.create_task(db, name, datetime.now() + offset, **fields).id
+
+
+def test_first_window_holds_the_overdue_tasks_up_to_the_horizon(db, scheduled):
+    overdue = _create(db, "overdue", timedelta(days=-2))
+    soon = _create(db, "soon", timedelta(minutes=5))
+    _create(db, "beyond", timedelta(hours=2))
+    running = _create(db, "running", timedelta(seconds=-1))
+    crud.start_task(db, running)
+    loader = TaskWindowLoader(horizon_seconds=3600)
+
+    assert loader.refill() == 2
+
+    assert scheduled == [[overdue, soon]]
+    assert loader.covers(datetime.now() + timedelta(minutes=59))
+    assert not loader.covers(datetime.now() + timedelta(hours=2))
+
+
+def test_refill_only_reads_the_window_after_the_loaded_one(db, scheduled):
+    first = _create(db, "first", timedelta(minutes=5))
+    second = _create(db, "second", timedelta(hours=2))
+    loader = TaskWindowLoader(horizon_seconds=3600)
+    loader.refill()
+
+    # Nothing new is due within the horizon yet
+    assert loader.refill() == 0
+    loader.horizon = timedelta(hours=3)
+    assert loader.refill() == 1
+
+    assert scheduled == [[first], [second]]
+    assert loader.covers(datetime.now() + timedelta(hours=2, minutes=30))
+
+
+def test_window_is_read_in_chunks(db, scheduled):
+    task_ids = [_create(db, f"task-{index}", timedelta(minutes=index)) for index in range(5)]
+
+    assert TaskWindowLoader(horizon_seconds=3600, chunk_size=2).refill() == 5
+
+    assert scheduled == [task_ids[:2], task_ids[2:4], task_ids[4:]]
+
+
+def test_tasks_created_in_a_loaded_window_are_scheduled_by_their_creator(db, scheduled, monkeypatch):
+    created = []
+    monkeypatch.setattr(scheduler, "window_loader", TaskWindowLoader(horizon_seconds=3600))
+    monkeypatch.setattr(scheduler.settings, "dispatch_mode", "scheduler")
+    monkeypatch.setattr(scheduler.timer_engine, "reschedule", lambda task_id, run_date: created.append(task_id))
+    monkeypatch.setattr(scheduler.settings, "timer_engine", "native")
+    scheduler.window_loader.refill()
+
+    inside = _create(db, "inside", timedelta(minutes=30))
+    outside = _create(db, "outside", timedelta(hours=2))
+    for task_id, offset in ((inside, timedelta(minutes=30)), (outside, timedelta(hours=2))):
+        scheduler.schedule_task_execution(task_id, datetime.now() + offset)
+
+    # The task beyond the window is left in the database until its window is loaded
+    assert created == [inside]
+    assert crud.get_task_by_id(db, outside).status == TaskStatus.PENDING
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from app import crud, schemas
+from app.models import RecurrenceFrequency
+from app.routes import task_router
+
+SCHEDULED = datetime(2030, 1, 1, 9, 30, 15, 123456)
+
+
+def _expected(db):
+    return jsonable_encoder([schemas.Task.model_validate(task) for task in crud.get_tasks(db)])
+
+
+def test_list_matches_the_response_model(client, db):
+    crud.create_task(db, "weekly", SCHEDULED, RecurrenceFrequency.WEEKLY, payload={"to": ["a", "b"]})
+    crud.create_task(db, "plain", SCHEDULED + timedelta(hours=1))
+
+    assert client.get("/api/tasks/").json() == _expected(db)
+
+
+def test_json_fallback_encodes_like_orjson(client, db, monkeypatch):
+    crud.create_task(db, "weekly", SCHEDULED, RecurrenceFrequency.WEEKLY, payload={"n": 1})
+    fast = client.get("/api/tasks/").content
+
+    def unsupported(content):
+        raise orjson.JSONEncodeError("Integer exceeds 64-bit range")
+
+    monkeypatch.setattr(task_router.orjson, "dumps", unsupported)
+    assert client.get("/api/tasks/").content == fast
+
+
+def test_payload_beyond_64_bits_falls_back_to_json(client, db):
+    crud.create_task(db, "big", SCHEDULED, payload={"n": 2 ** 70})
+
+    response = client.get("/api/tasks/page")
+
+    assert response.status_code == 200
+    assert response.json()["items"][0]["payload"] == {"n": 2 ** 70}
@@ -0,0 +1,103 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import crud, models
+from app.models import TaskStatus
+from app.result_writer import ResultWriter, TaskResult
+
+
+def _result(task_id, status=TaskStatus.SUCCEEDED):
+    return TaskResult(task_id=task_id, status=status, finished_at=datetime.now())
+
+
+class FlakyWriter(ResultWriter):
+    """Fails the first `failures` writes, and every write holding one of the `poison` tasks."""
+
+    def __init__(self, failures=0, poison=(), **options):
+        super().__init__(retry_seconds=0.001, **options)
+        self.failures = failures
+        self.poison = set(poison)
+        self.attempts = []
+        self.written = []
+
+    def _write(self, batch):
+        self.attempts.append([result.task_id for result in batch])
+        if self.failures > 0 or self.poison & {result.task_id for result in batch}:
+            self.failures -= 1
+            raise RuntimeError("write failed")
+        self.written.extend(result.task_id for result in batch)
+
+
+def test_transient_failures_are_retried():
+    writer = FlakyWriter(failures=2, max_attempts=5)
+
+    assert writer._write_batch([_result(task_id) for task_id in range(4)], writer.max_attempts, time.sleep) == 0
+
+    assert len(writer.attempts) == 3
+    assert writer.written == [0, 1, 2, 3]
+
+
+def test_failing_batch_is_split_and_the_poison_result_dropped():
+    writer = FlakyWriter(poison={5}, max_attempts=3)
+
+    dropped = writer._write_batch([_result(task_id) for task_id in range(8)], writer.max_attempts, time.sleep)
+
+    assert dropped == 1
+    assert sorted(writer.written) == [0, 1, 2, 3, 4, 6, 7]
+    # Three attempts at the batch, then one per half down to the poison result
+    assert writer.attempts[:3] == [list(range(8))] * 3
+    assert [5] in writer.attempts and len(writer.attempts) == 3 + 6
+
+
+def test_writer_thread_moves_on_after_a_poison_batch():
+    writer = FlakyWriter(poison={1}, max_attempts=2, batch_size=2, flush_interval_ms=1)
+    writer.start()
+    try:
+        for task_id in range(4):
+            writer.submit(_result(task_id))
+        deadline = time.monotonic() + 5
+        while len(writer.written) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        writer.stop()
+
+    assert sorted(writer.written) == [0, 2, 3]
+    assert writer.pending_task_ids() == []
+
+
+def test_stop_flushes_pending_results():
+    writer = FlakyWriter(failures=1, batch_size=10, flush_interval_ms=60000)
+    writer.start()
+    for task_id in range(3):
+        writer.submit(_result(task_id))
+
+    writer.stop()
+
+    assert writer.written == [0, 1, 2]
+
+
+@pytest.mark.parametrize("running", [False, True])
+def test_rejected_result_does_not_lose_the_rest_of_the_batch(db, running):
+    task_ids = [crud.create_task(db, f"task-{index}", datetime.now() - timedelta(seconds=1)).id for index in range(3)]
+    for task_id in task_ids:
+        crud.start_task(db, task_id, worker_id="me", lease_seconds=60)
+    writer = ResultWriter(batch_size=10, flush_interval_ms=60000, retry_seconds=0.001, max_attempts=2)
+    if running:
+        writer.start()
+    # A run without its scheduled time violates a NOT NULL constraint, so the database rejects any batch holding it
+    results = [TaskResult(task_id, TaskStatus.SUCCEEDED, datetime.now(), worker_id="me",
+                          scheduled_time=None if task_id == task_ids[1] else datetime.now()) for task_id in task_ids]
+
+    if running:
+        for result in results:
+            writer.submit(result)
+        writer.stop()
+    else:
+        writer._write_batch(results, writer.max_attempts, time.sleep)
+
+    db.expire_all()
+    assert [db.get(models.Task, task_id).status for task_id in task_ids] == [
+        TaskStatus.SUCCEEDED, TaskStatus.RUNNING, TaskStatus.SUCCEEDED]
+    assert len(crud.get_task_runs(db, task_ids[1])) == 0
@@ -0,0 +1,77 @@
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app import crud, models
+from app.models import TaskStatus
+from app.retention import RunRetention
+
+
+def _runs(db, *ages):
+    now = datetime.now()
+    db.add_all(models.TaskRun(task_id=1, scheduled_time=now - age, finished_at=now - age, status=TaskStatus.SUCCEEDED)
+               for age in ages)
+    db.commit()
+
+
+def _remaining(db):
+    db.expire_all()
+    return len(db.scalars(select(models.TaskRun.id)).all())
+
+
+def test_oldest_runs_are_deleted_first_in_batches(db):
+    _runs(db, timedelta(days=3), timedelta(days=2), timedelta(days=1), timedelta(hours=1))
+
+    assert crud.delete_task_runs_before(db, datetime.now() - timedelta(hours=12), batch_size=2) == 2
+
+    finished = db.scalars(select(models.TaskRun.finished_at).order_by(models.TaskRun.finished_at)).all()
+    assert [round((datetime.now() - at) / timedelta(hours=1)) for at in finished] == [24, 1]
+
+
+def test_purge_deletes_every_expired_run_batch_by_batch(db, monkeypatch):
+    _runs(db, *(timedelta(days=10 + index) for index in range(5)), timedelta(days=2), timedelta(hours=1))
+    batches = []
+    delete = crud.delete_task_runs_before
+
+    def counted(**kwargs):
+        batches.append(delete(**kwargs))
+        return batches[-1]
+
+    monkeypatch.setattr(crud, "delete_task_runs_before", counted)
+
+    assert RunRetention(retention_days=7, batch_size=2).purge() == 5
+
+    assert batches == [2, 2, 1]
+    assert _remaining(db) == 2
+
+
+def test_purge_stops_between_batches(db):
+    _runs(db, timedelta(days=10), timedelta(days=11))
+    job = RunRetention(retention_days=7, batch_size=1)
+    job._stop.set()
+
+    assert job.purge() == 0
+    assert _remaining(db) == 2
+
+
+def test_started_job_purges_until_stopped(db):
+    _runs(db, timedelta(days=10))
+    job = RunRetention(retention_days=7, interval_seconds=3600)
+
+    job.start()
+    deadline = time.monotonic() + 5
+    while _remaining(db) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    job.stop()
+
+    assert _remaining(db) == 0
+    assert job._thread is None
+
+
+def test_disabled_retention_does_not_start():
+    job = RunRetention(retention_days=0)
+
+    job.start()
+
+    assert job._thread is None
@@ -0,0 +1,73 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import inspect, text
+
+from app import crud, models
+from app.config import settings
+from app.database import SessionLocal, get_engine, sqlite_writer_lock
+
+
+def test_connections_use_wal_mode_and_the_configured_pragmas():
+    with get_engine().connect() as conn:
+        pragma = lambda name: conn.execute(text(f"PRAGMA {name}")).scalar()
+        assert pragma("journal_mode") == "wal"
+        assert pragma("busy_timeout") == int(settings.sqlite_busy_timeout * 1000)
+        assert pragma("temp_store") == 2
+
+
+def test_schema_is_stamped_with_the_latest_migration():
+    models.init_schema()
+
+    config = Config()
+    config.set_main_option("script_location", os.path.join(os.path.dirname(models.__file__), "..", "alembic"))
+    with get_engine().connect() as conn:
+        revision = conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    assert revision == ScriptDirectory.from_config(config).get_current_head()
+    indexes = {index["name"] for index in inspect(get_engine()).get_indexes("tasks")}
+    assert {"ix_tasks_status_scheduled_time", "ix_tasks_status_priority_scheduled_time"} <= indexes
+
+
+def test_concurrent_writers_queue_instead_of_failing():
+    def create(i):
+        db = SessionLocal()
+        try:
+            crud.create_task(db, f"task-{i}", datetime.now() + timedelta(hours=1))
+        finally:
+            db.close()
+            SessionLocal.remove()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(create, range(40)))
+
+    with SessionLocal() as db:
+        assert db.query(models.Task).count() == 40
+    assert not sqlite_writer_lock._lock.locked()
+
+
+def test_writer_lock_is_held_until_the_transaction_ends(db):
+    db.add(models.Task(name="held", scheduled_time=datetime.now()))
+    db.flush()
+    assert sqlite_writer_lock._lock.locked()
+
+    db.rollback()
+    db.close()
+    assert not sqlite_writer_lock._lock.locked()
+
+
+def test_reads_do_not_take_the_writer_lock(db):
+    crud.get_tasks(db)
+
+    assert not sqlite_writer_lock._lock.locked()
+
+
+def test_api_writes_go_through_the_async_driver(client):
+    response = client.post("/api/tasks/", json={"name": "via-api", "scheduled_time": "2030-01-01T09:00:00"})
+
+    assert response.status_code == 200
+    assert not sqlite_writer_lock._lock.locked()
+    with SessionLocal() as db:
+        assert db.query(models.Task).filter_by(name="via-api").count() == 1
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import crud, models
+from app.models import TaskStatus, can_transition
+
+
+def _due(db, name, **fields):
+    return crud.create_task(db, name, datetime.now() - timedelta(seconds=1), **fields).id
+
+
+def _task(db, task_id):
+    db.expire_all()
+    return db.get(models.Task, task_id)
+
+
+@pytest.mark.parametrize("current, new", [
+    (TaskStatus.PENDING, TaskStatus.RUNNING),
+    (TaskStatus.RUNNING, TaskStatus.SUCCEEDED),
+    (TaskStatus.RUNNING, TaskStatus.FAILED),
+    (TaskStatus.RUNNING, TaskStatus.SKIPPED),
+    # A reclaimed lease, and a finished task given a new scheduled time
+    (TaskStatus.RUNNING, TaskStatus.PENDING),
+    (TaskStatus.SUCCEEDED, TaskStatus.PENDING),
+    (TaskStatus.FAILED, TaskStatus.PENDING),
+    (TaskStatus.SKIPPED, TaskStatus.PENDING),
+])
+def test_allowed_transitions(current, new):
+    assert can_transition(current, new)
+
+
+@pytest.mark.parametrize("current, new", [
+    (TaskStatus.PENDING, TaskStatus.SUCCEEDED),
+    (TaskStatus.PENDING, TaskStatus.FAILED),
+    (TaskStatus.PENDING, TaskStatus.PENDING),
+    (TaskStatus.RUNNING, TaskStatus.RUNNING),
+    (TaskStatus.SUCCEEDED, TaskStatus.RUNNING),
+    (TaskStatus.SUCCEEDED, TaskStatus.FAILED),
+    (TaskStatus.FAILED, TaskStatus.SUCCEEDED),
+])
+def test_forbidden_transitions(current, new):
+    assert not can_transition(current, new)
+
+
+def test_every_status_has_its_transitions():
+    assert set(models.TASK_STATUS_TRANSITIONS) == set(TaskStatus)
+
+
+def test_only_a_due_pending_task_starts(db):
+    due = _due(db, "due")
+    later = crud.create_task(db, "later", datetime.now() + timedelta(hours=1)).id
+
+    assert crud.start_task(db, due).status == TaskStatus.RUNNING
+    # Fired twice, e.g. by a stale timer: only one execution starts
+    assert crud.start_task(db, due) is None
+    assert crud.start_task(db, later) is None
+    assert _task(db, later).status == TaskStatus.PENDING
+
+
+def test_finish_only_applies_to_a_running_task(db):
+    task_id = _due(db, "task")
+
+    assert not crud.finish_task(db, task_id, TaskStatus.SUCCEEDED)
+    crud.start_task(db, task_id, worker_id="w1", lease_seconds=60)
+    with pytest.raises(ValueError):
+        crud.finish_task(db, task_id, TaskStatus.RUNNING)
+    # A worker whose lease was reclaimed cannot overwrite the state of the new claim
+    assert not crud.finish_task(db, task_id, TaskStatus.FAILED, worker_id="w2")
+    assert crud.finish_task(db, task_id, TaskStatus.SUCCEEDED, worker_id="w1")
+
+    task = _task(db, task_id)
+    assert (task.status, task.lease_owner) == (TaskStatus.SUCCEEDED, None)
@@ -0,0 +1,95 @@
+import queue
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import scheduler
+from app.config import settings
+from app.timer_engine import TimerEngine
+
+
+@pytest.fixture
+def engine():
+    fired = queue.Queue()
+    engine = TimerEngine(lambda task_id: fired.put((task_id, time.time())))
+    engine.fired = fired
+    engine.start()
+    yield engine
+    engine.stop()
+
+
+def _drain(engine, timeout=0.5):
+    fired = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            fired.append(engine.fired.get(timeout=max(deadline - time.monotonic(), 0)))
+        except queue.Empty:
+            break
+    return fired
+
+
+def test_timers_fire_in_order_and_never_early(engine):
+    start = datetime.now()
+    # Sub-millisecond run times: truncating them to milliseconds would fire up to 1 ms early
+    run_at = {task_id: start + timedelta(milliseconds=50 * task_id, microseconds=700) for task_id in (3, 1, 2)}
+    for task_id, when in run_at.items():
+        engine.schedule(task_id, when)
+
+    fired = _drain(engine, 0.5)
+
+    assert [task_id for task_id, _ in fired] == [1, 2, 3]
+    for task_id, fired_at in fired:
+        assert fired_at >= run_at[task_id].timestamp()
+
+
+def test_cancelled_and_rescheduled_timers(engine):
+    soon = datetime.now() + timedelta(milliseconds=50)
+    for task_id in (1, 2, 3):
+        engine.schedule(task_id, soon)
+    engine.cancel(1)
+    engine.reschedule(2, soon + timedelta(milliseconds=100))
+
+    assert [task_id for task_id, _ in _drain(engine, 0.5)] == [3, 2]
+    assert len(engine) == 0
+
+
+def test_generations_are_dropped_once_no_timer_is_left(engine):
+    soon = datetime.now() + timedelta(milliseconds=20)
+    engine.schedule(1, soon)
+    engine.reschedule(1, soon)
+    assert engine._generations == {1: 1}
+
+    assert [task_id for task_id, _ in _drain(engine, 0.3)] == [1]
+    assert engine._generations == {}
+
+
+def test_sweep_keeps_generations_of_pending_timers():
+    engine = TimerEngine(lambda task_id: None)
+    later = datetime.now() + timedelta(hours=1)
+    engine.schedule(0, later)
+    engine.cancel(0)
+    engine.schedule(0, later)
+    # Cancelling tasks without timers grows the generations until a sweep drops them
+    for task_id in range(1, TimerEngine.MIN_SWEEP + 1):
+        engine.cancel(task_id)
+
+    assert engine._generations == {0: 1}
+    assert engine._take_due(int(later.timestamp() * 1000) + 1000) == []
+    engine._promote(int(later.timestamp()) + 1)
+    assert engine._take_due(int(later.timestamp() * 1000) + 1000) == [0]
+
+
+def test_scheduling_a_task_twice_leaves_a_single_timer(engine, monkeypatch):
+    monkeypatch.setattr(settings, "dispatch_mode", "scheduler")
+    monkeypatch.setattr(settings, "timer_engine", "native")
+    monkeypatch.setattr(scheduler, "timer_engine", engine)
+    monkeypatch.setattr(scheduler.window_loader, "loaded_until", datetime.now() + timedelta(hours=1))
+    soon = datetime.now() + timedelta(milliseconds=50)
+
+    # As when a task created during a window refill is scheduled by its creator and by the refill
+    scheduler.schedule_task_execution(1, soon)
+    scheduler.schedule_task_execution(1, soon + timedelta(milliseconds=20))
+
+    assert [task_id for task_id, _ in _drain(engine, 0.3)] == [1]
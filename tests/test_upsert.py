@@ -0,0 +1,66 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import crud, models
+from app.models import TaskStatus
+
+
+def _values(name, **fields):
+    # Every column `upsert_task` sets
+    values = dict.fromkeys(("recurrence", "cron_expression", "handler", "payload", "group", "misfire_policy"))
+    return {**values, "name": name, "scheduled_time": datetime(2030, 1, 6, 9), "anchor_day": 6, "priority": 0, **fields}
+
+
+def test_upsert_returns_the_existing_task(db):
+    first = crud.upsert_task(db, "report", datetime(2030, 1, 6, 9))
+
+    again = crud.upsert_task(db, "report", datetime(2031, 1, 6, 9), priority=5)
+
+    assert again.id == first.id
+    assert (again.scheduled_time, again.priority) == (datetime(2030, 1, 6, 9), 0)
+
+
+def test_upsert_updates_and_reopens_a_finished_task(db):
+    task = crud.upsert_task(db, "report", datetime(2030, 1, 6, 9))
+    db.query(models.Task).filter_by(id=task.id).update({"status": TaskStatus.SUCCEEDED})
+    db.commit()
+
+    updated = crud.upsert_task(db, "report", datetime(2031, 1, 6, 9), priority=5, update_existing=True)
+
+    assert updated.id == task.id
+    assert (updated.scheduled_time, updated.priority, updated.status) == (datetime(2031, 1, 6, 9), 5, TaskStatus.PENDING)
+
+
+def test_portable_upsert_inserts_then_resolves_the_conflict(db):
+    table = models.Task.__table__
+    task_id = crud._upsert_portable(db, table, _values("report"), update_existing=False)
+    db.commit()
+
+    assert crud._upsert_portable(db, table, _values("report", priority=5), update_existing=False) == task_id
+    assert db.get(models.Task, task_id).priority == 0
+    assert crud._upsert_portable(db, table, _values("report", priority=5), update_existing=True) == task_id
+    db.commit()
+    db.expire_all()
+    assert db.get(models.Task, task_id).priority == 5
+    assert db.query(models.Task).count() == 1
+
+
+def test_portable_upsert_raises_other_integrity_errors(db):
+    with pytest.raises(IntegrityError):
+        crud._upsert_portable(db, models.Task.__table__, _values("report", scheduled_time=None), update_existing=False)
+
+
+def test_only_upserts_that_change_the_task_invalidate_and_publish(db, monkeypatch):
+    published, invalidated = [], []
+    monkeypatch.setattr(crud.task_events, "publish", lambda kind, task_id, record: published.append((kind, task_id)))
+    monkeypatch.setattr(crud.task_cache, "invalidate", lambda task_ids: invalidated.extend(task_ids))
+
+    task_id = crud.upsert_task(db, "report", datetime(2030, 1, 6, 9), priority=5).id
+    crud.upsert_task(db, "report", datetime(2030, 1, 6, 9), priority=5)
+    crud.upsert_task(db, "report", datetime(2030, 1, 6, 9), priority=5, update_existing=True)
+    crud.upsert_task(db, "report", datetime(2031, 1, 6, 9), priority=5, update_existing=True)
+
+    assert published == [("created", task_id), ("updated", task_id)]
+    assert invalidated == [task_id, task_id]